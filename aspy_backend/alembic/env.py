@@ -16,6 +16,9 @@ from app.models.subscription import Plan, Subscription
 from app.models.invoice import Invoice
 from app.models.payment import Payment
 from app.models.code_execution import CodeExecution
+from app.models.translation_cache import TranslationCacheEntry
+from app.models.admin_stats import AdminStatsSnapshot
+from app.models.webhook_event import WebhookEvent
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,29 @@
+"""add keyset pagination indexes
+
+Revision ID: 4b7e2a9c1d3f
+Revises: be2d9ec1c6cc
+Create Date: 2026-10-17 13:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2a9c1d3f'
+down_revision: Union[str, None] = 'be2d9ec1c6cc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Admin lists page newest first by (created_at, id)
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+    op.create_index('ix_subscriptions_created_at_id', 'subscriptions', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_subscriptions_created_at_id', table_name='subscriptions')
+    op.drop_index('ix_users_created_at_id', table_name='users')
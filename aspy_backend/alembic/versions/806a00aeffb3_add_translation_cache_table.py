@@ -0,0 +1,33 @@
+"""add translation cache table
+
+Revision ID: 806a00aeffb3
+Revises: d1c4e9b13a50
+Create Date: 2026-10-17 10:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '806a00aeffb3'
+down_revision: Union[str, None] = 'd1c4e9b13a50'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('translation_cache',
+        sa.Column('cache_key', sa.String(length=64), nullable=False),
+        sa.Column('language', sa.String(), nullable=True),
+        sa.Column('prompt_version', sa.String(length=20), nullable=True),
+        sa.Column('python_code', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('cache_key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('translation_cache')
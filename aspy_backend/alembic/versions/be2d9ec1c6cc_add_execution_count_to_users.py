@@ -0,0 +1,33 @@
+"""add execution_count to users
+
+Revision ID: be2d9ec1c6cc
+Revises: 806a00aeffb3
+Create Date: 2026-10-17 11:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'be2d9ec1c6cc'
+down_revision: Union[str, None] = '806a00aeffb3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('execution_count', sa.Integer(), server_default='0', nullable=False))
+
+    # Backfill from existing history
+    op.execute("""
+        UPDATE users SET execution_count = (
+            SELECT COUNT(*) FROM code_executions WHERE code_executions.user_id = users.id
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'execution_count')
@@ -0,0 +1,36 @@
+"""add admin stats snapshots table
+
+Revision ID: c83f5d0e7a21
+Revises: 4b7e2a9c1d3f
+Create Date: 2026-10-17 13:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c83f5d0e7a21'
+down_revision: Union[str, None] = '4b7e2a9c1d3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('admin_stats_snapshots',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('total_users', sa.Integer(), nullable=False),
+        sa.Column('total_admins', sa.Integer(), nullable=False),
+        sa.Column('active_subscriptions', sa.Integer(), nullable=False),
+        sa.Column('total_revenue', sa.Numeric(precision=12, scale=2), nullable=False),
+        sa.Column('total_executions', sa.Integer(), nullable=False),
+        sa.Column('total_languages', sa.Integer(), nullable=False),
+        sa.Column('generated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('admin_stats_snapshots')
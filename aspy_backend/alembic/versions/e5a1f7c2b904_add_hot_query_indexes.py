@@ -0,0 +1,35 @@
+"""add hot query indexes
+
+Revision ID: e5a1f7c2b904
+Revises: c83f5d0e7a21
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a1f7c2b904'
+down_revision: Union[str, None] = 'c83f5d0e7a21'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Per-user filters on the hot paths; tests/test_query_plans.py checks they are used
+    op.create_index('ix_code_executions_user_id_language_id_created_at', 'code_executions', ['user_id', 'language_id', 'created_at'], unique=False)
+    op.create_index('ix_subscriptions_user_id_status', 'subscriptions', ['user_id', 'status'], unique=False)
+    op.create_index('ix_payments_user_id_status_created_at', 'payments', ['user_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_invoices_user_id_created_at', 'invoices', ['user_id', 'created_at'], unique=False)
+    op.create_index(op.f('ix_invoices_razorpay_order_id'), 'invoices', ['razorpay_order_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_invoices_razorpay_order_id'), table_name='invoices')
+    op.drop_index('ix_invoices_user_id_created_at', table_name='invoices')
+    op.drop_index('ix_payments_user_id_status_created_at', table_name='payments')
+    op.drop_index('ix_subscriptions_user_id_status', table_name='subscriptions')
+    op.drop_index('ix_code_executions_user_id_language_id_created_at', table_name='code_executions')
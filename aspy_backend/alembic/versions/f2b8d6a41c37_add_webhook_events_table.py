@@ -0,0 +1,48 @@
+"""add webhook events table
+
+Revision ID: f2b8d6a41c37
+Revises: e5a1f7c2b904
+Create Date: 2026-10-17 15:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d6a41c37'
+down_revision: Union[str, None] = 'e5a1f7c2b904'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('webhook_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('provider', sa.String(length=20), nullable=False),
+        sa.Column('event_id', sa.String(length=100), nullable=False),
+        sa.Column('event_type', sa.String(length=100), nullable=False),
+        sa.Column('ordering_key', sa.String(length=100), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('received_at', sa.DateTime(), server_default=sa.text('now()'), nullable=True),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('provider', 'event_id', name='uq_webhook_events_provider_event_id')
+    )
+    op.create_index(op.f('ix_webhook_events_id'), 'webhook_events', ['id'], unique=False)
+    op.create_index('ix_webhook_events_status_next_attempt_at', 'webhook_events', ['status', 'next_attempt_at'], unique=False)
+    op.create_index('ix_webhook_events_ordering_key_id', 'webhook_events', ['ordering_key', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_webhook_events_ordering_key_id', table_name='webhook_events')
+    op.drop_index('ix_webhook_events_status_next_attempt_at', table_name='webhook_events')
+    op.drop_index(op.f('ix_webhook_events_id'), table_name='webhook_events')
+    op.drop_table('webhook_events')
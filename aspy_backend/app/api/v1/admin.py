@@ -1,16 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func, or_
 from typing import List, Optional
-from app.db.session import get_db
+from app.db.session import get_db, engine, async_engine, replica_engine, db_settings
+from app.db.routing import get_read_db, read_router
+from app.db.pool import pool_status
 from app.core.security import get_current_user
+from app.core.pagination import keyset_page, paginate, set_next_cursor
 from app.models.user import User, UserType
 from app.models.subscription import Subscription, Plan, SubscriptionStatus
 from app.models.invoice import Invoice
 from app.models.language import Language
-from app.models.code_execution import CodeExecution
 from app.models.payment import Payment, PaymentStatus
-from pydantic import BaseModel, EmailStr
+from app.services.translation_cache import translation_cache
+from app.services.translation import translation_flights
+from app.services.transpiler import transpilers
+from app.services.sandbox import sandbox_pool
+from app.services.execution_cache import execution_cache
+from app.services.code_policy import compiled_programs
+from app.services.entitlements import entitlements
+from app.services.principals import principals
+from app.services.passwords import password_hasher
+from app.services.oauth import apple_jwks
+from app.services.admin_stats import admin_stats
+from app.services.webhook_inbox import webhook_inbox
+from app.services.registration import bulk_onboard_users, backfill_free_subscriptions
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 
 router = APIRouter()
@@ -65,6 +80,23 @@ class LanguageCreate(BaseModel):
     name: str
     slug: str
 
+class BulkUserRow(BaseModel):
+    username: str = Field(min_length=1, max_length=100)
+    email: EmailStr
+
+class BulkOnboardRequest(BaseModel):
+    users: List[BulkUserRow] = Field(max_length=100000)
+
+class SkippedRow(BaseModel):
+    email: str
+    reason: str
+
+class BulkOnboardResponse(BaseModel):
+    created: int
+    skipped: int
+    skipped_rows: List[SkippedRow]
+    duration_ms: float
+
 class DashboardStats(BaseModel):
     total_users: int
     total_admins: int
@@ -72,46 +104,158 @@ class DashboardStats(BaseModel):
     total_revenue: float
     total_executions: int
     total_languages: int
+    generated_at: Optional[datetime] = None
 
 # Admin Endpoints
 
 @router.get("/admin/stats", response_model=DashboardStats, tags=["Admin"])
 def get_admin_dashboard_stats(
+    refresh: bool = Query(False, description="Recompute now instead of serving the latest snapshot"),
     db: Session = Depends(get_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
-    """Get admin dashboard statistics"""
-    total_users = db.query(User).filter(User.user_type == UserType.USER).count()
-    total_admins = db.query(User).filter(User.user_type == UserType.ADMIN).count()
-    active_subscriptions = db.query(Subscription).filter(Subscription.status == SubscriptionStatus.ACTIVE).count()
-    
-    # Calculate total revenue from completed payments
-    total_revenue = db.query(func.sum(Payment.amount)).filter(
-        Payment.status == PaymentStatus.COMPLETED
-    ).scalar() or 0.0
-    
-    total_executions = db.query(CodeExecution).count()
-    total_languages = db.query(Language).count()
-    
+    """Get admin dashboard statistics as of `generated_at`"""
+    return admin_stats.get(db, refresh=refresh)
+
+@router.get("/admin/metrics/translation-cache", tags=["Admin"])
+def get_translation_cache_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get hit/miss counts and memory held by the code translation cache"""
+    return translation_cache.stats()
+
+@router.get("/admin/metrics/translation-coalescing", tags=["Admin"])
+def get_translation_coalescing_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get in-flight translations, requests waiting on them per key and how many completions were saved"""
+    return translation_flights.stats()
+
+@router.get("/admin/metrics/transpiler", tags=["Admin"])
+def get_transpiler_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get the registered keyword dialects and, per language, how many snippets skipped the LLM"""
+    return transpilers.stats()
+
+@router.get("/admin/metrics/sandbox", tags=["Admin"])
+def get_sandbox_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get code execution pool size, queue depth and outcome counters"""
+    return sandbox_pool.stats()
+
+@router.get("/admin/metrics/execution-cache", tags=["Admin"])
+def get_execution_cache_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get hit/miss and admission counts for memoized program results"""
+    return execution_cache.stats()
+
+@router.get("/admin/metrics/compiled-programs", tags=["Admin"])
+def get_compiled_program_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get hit/miss counts for validated, compiled programs and how many broke the code policy"""
+    return compiled_programs.stats()
+
+@router.get("/admin/metrics/entitlements", tags=["Admin"])
+def get_entitlement_cache_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get hit/miss counts for the cached plan entitlements"""
+    return entitlements.stats()
+
+@router.get("/admin/metrics/principals", tags=["Admin"])
+def get_principal_cache_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get hit/miss counts for the cached token-to-user lookups"""
+    return principals.stats()
+
+@router.get("/admin/metrics/password-hashing", tags=["Admin"])
+def get_password_hashing_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get bcrypt pool size, queue depth, rejections and rehash counts"""
+    return password_hasher.stats()
+
+@router.get("/admin/metrics/oauth", tags=["Admin"])
+def get_oauth_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get the cached Apple signing keys and their hit/refetch counters"""
+    return {"apple_jwks": apple_jwks.stats()}
+
+@router.get("/admin/metrics/webhooks", tags=["Admin"])
+def get_webhook_metrics(
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get webhook inbox backlog by status, the oldest pending event's age and this worker's counters"""
+    return webhook_inbox.stats(db)
+
+@router.post("/admin/webhooks/{event_id}/retry", tags=["Admin"])
+def retry_webhook_event(
+    event_id: int,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Queue a webhook event that exhausted its attempts to be applied again"""
+    event = webhook_inbox.retry(db, event_id)
+    if event is None:
+        raise HTTPException(status_code=404, detail="Webhook event not found")
+    return {"id": event.id, "event_id": event.event_id, "status": event.status, "last_error": event.last_error}
+
+@router.get("/admin/metrics/db-pool", tags=["Admin"])
+def get_db_pool_metrics(
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Get this worker's database pool configuration, occupancy, checkout timings and read routing"""
     return {
-        "total_users": total_users,
-        "total_admins": total_admins,
-        "active_subscriptions": active_subscriptions,
-        "total_revenue": float(total_revenue),
-        "total_executions": total_executions,
-        "total_languages": total_languages
+        "config": db_settings.describe(),
+        "sync": pool_status(engine),
+        "async": pool_status(async_engine.sync_engine),
+        "replica": pool_status(replica_engine) if replica_engine is not None else None,
+        "read_routing": read_router.stats(),
     }
 
 @router.get("/admin/users", response_model=List[UserAdminResponse], tags=["Admin"])
 def get_all_users(
+    response: Response,
     search: Optional[str] = Query(None, description="Search by name or email"),
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Get all users with their subscription and execution details"""
-    query = db.query(User).filter(User.user_type == UserType.USER)
+    # Latest active subscription per user, joined in instead of queried per row
+    active_subscription_ids = db.query(
+        Subscription.user_id.label("user_id"),
+        func.max(Subscription.id).label("subscription_id")
+    ).filter(
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).group_by(Subscription.user_id).subquery()
+
+    query = db.query(
+        User.id,
+        User.username,
+        User.email,
+        User.user_type,
+        User.is_active,
+        User.created_at,
+        User.execution_count,
+        Subscription.status,
+        Plan.name
+    ).outerjoin(
+        active_subscription_ids, active_subscription_ids.c.user_id == User.id
+    ).outerjoin(
+        Subscription, Subscription.id == active_subscription_ids.c.subscription_id
+    ).outerjoin(
+        Plan, Plan.id == Subscription.plan_id
+    ).filter(User.user_type == UserType.USER)
     
     # Apply search filter
     if search:
@@ -123,65 +267,75 @@ def get_all_users(
             )
         )
     
-    users = query.offset(skip).limit(limit).all()
+    rows, next_cursor = paginate(query, User.created_at, User.id, cursor, limit, skip)
+    set_next_cursor(response, next_cursor)
     
-    response = []
-    for user in users:
-        # Get user's active subscription
-        active_subscription = db.query(Subscription).filter(
-            Subscription.user_id == user.id,
-            Subscription.status == SubscriptionStatus.ACTIVE
-        ).first()
-        
-        # Get execution count
-        execution_count = db.query(CodeExecution).filter(
-            CodeExecution.user_id == user.id
-        ).count()
-        
-        # For now, certificate count is 0 (implement later if you have certificates table)
-        certificate_count = 0
-        
-        response.append({
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "user_type": user.user_type.value,
-            "is_active": user.is_active,
-            "created_at": user.created_at,
-            "subscription_status": active_subscription.status.value if active_subscription else None,
-            "subscription_plan": active_subscription.plan.name if active_subscription and active_subscription.plan else None,
-            "execution_count": execution_count,
-            "certificate_count": certificate_count
-        })
-    
-    return response
+    # For now, certificate count is 0 (implement later if you have certificates table)
+    return [
+        {
+            "id": row.id,
+            "username": row.username,
+            "email": row.email,
+            "user_type": row.user_type.value,
+            "is_active": row.is_active,
+            "created_at": row.created_at,
+            "subscription_status": row.status.value if row.status else None,
+            "subscription_plan": row.name,
+            "execution_count": row.execution_count or 0,
+            "certificate_count": 0
+        }
+        for row in rows
+    ]
 
 @router.get("/admin/subscriptions", response_model=List[SubscriptionAdminResponse], tags=["Admin"])
 def get_all_subscriptions(
-    skip: int = Query(0, ge=0),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    skip: int = Query(0, ge=0, deprecated=True),
     limit: int = Query(100, ge=1, le=1000),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Get all subscriptions with user and payment details"""
-    subscriptions = db.query(Subscription).offset(skip).limit(limit).all()
+    page_user_ids = keyset_page(
+        db.query(Subscription.user_id), Subscription.created_at, Subscription.id, cursor, limit, skip
+    )
+
+    # Latest completed payment per user on this page, ranked in SQL rather than queried per subscription
+    payment_rank = func.row_number().over(
+        partition_by=Payment.user_id,
+        order_by=(Payment.created_at.desc(), Payment.id.desc())
+    ).label("rank")
+    ranked_payments = db.query(
+        Payment.user_id.label("user_id"),
+        Payment.amount.label("amount"),
+        payment_rank
+    ).filter(
+        Payment.status == PaymentStatus.COMPLETED,
+        Payment.user_id.in_(page_user_ids.subquery().select())
+    ).subquery()
+    latest_payments = db.query(ranked_payments).filter(ranked_payments.c.rank == 1).subquery()
+
+    query = db.query(Subscription, latest_payments.c.amount).options(
+        joinedload(Subscription.user),
+        joinedload(Subscription.plan)
+    ).outerjoin(
+        latest_payments, latest_payments.c.user_id == Subscription.user_id
+    )
+    rows, next_cursor = paginate(
+        query, Subscription.created_at, Subscription.id, cursor, limit, skip,
+        key=lambda row: (row[0].created_at, row[0].id)
+    )
+    set_next_cursor(response, next_cursor)
     
     response = []
-    for sub in subscriptions:
-        # Get the latest completed payment for this user
-        latest_payment = db.query(Payment).filter(
-            Payment.user_id == sub.user_id,
-            Payment.status == PaymentStatus.COMPLETED
-        ).order_by(Payment.created_at.desc()).first()
-        
-        amount_paid = latest_payment.amount if latest_payment else 0.0
-        
+    for sub, amount_paid in rows:
         response.append({
             "id": sub.id,
             "user_email": sub.user.email if sub.user else "N/A",
             "plan_name": sub.plan.name if sub.plan else "N/A",
             "status": sub.status.value if hasattr(sub.status, 'value') else str(sub.status),
-            "amount_paid": float(amount_paid),
+            "amount_paid": float(amount_paid or 0.0),
             "next_due_date": sub.current_period_end,
             "created_at": sub.created_at,
             "current_period_end": sub.current_period_end
@@ -191,7 +345,7 @@ def get_all_subscriptions(
 
 @router.get("/admin/languages", response_model=List[LanguageResponse], tags=["Admin"])
 def get_all_languages(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_admin: User = Depends(get_current_admin_user)
 ):
     """Get all supported languages"""
@@ -273,6 +427,7 @@ def toggle_user_status(
     
     user.is_active = not user.is_active
     db.commit()
+    principals.invalidate(user_id)
     
     return {
         "message": f"User {'activated' if user.is_active else 'deactivated'} successfully",
@@ -280,6 +435,34 @@ def toggle_user_status(
         "is_active": user.is_active
     }
 
+@router.post("/admin/users/bulk", response_model=BulkOnboardResponse, tags=["Admin"])
+def bulk_onboard(
+    request: BulkOnboardRequest,
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """
+    Create many users on the FREE plan at once (e.g. a school cohort).
+    Accounts have no password and sign in through a social provider.
+    Existing emails/usernames are skipped, so a failed import can be re-sent.
+    """
+    try:
+        return bulk_onboard_users(db, [row.model_dump() for row in request.users])
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/admin/subscriptions/backfill-free", tags=["Admin"])
+def backfill_free_plan(
+    db: Session = Depends(get_db),
+    current_admin: User = Depends(get_current_admin_user)
+):
+    """Put every user without an active subscription on the FREE plan"""
+    try:
+        created = backfill_free_subscriptions(db)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"created": created}
+
 @router.delete("/admin/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, tags=["Admin"])
 def delete_user(
     user_id: int,
@@ -303,5 +486,7 @@ def delete_user(
     
     db.delete(user)
     db.commit()
+    entitlements.invalidate(user_id)
+    principals.invalidate(user_id)
     
     return None
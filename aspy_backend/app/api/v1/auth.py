@@ -1,142 +1,51 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.user import UserCreate, UserLogin, UserResponse, SocialLoginRequest
 from app.schemas.token import TokenResponse
 from app.models.user import User
-from app.models.subscription import Plan, Subscription, SubscriptionStatus, PlanType
-from app.core.security import hash_password, verify_password, create_access_token, get_current_user
-from datetime import datetime
-from app.db.session import get_db
+from app.core.security import hash_password_async, verify_password_async, create_access_token, get_current_user, get_current_user_async
+from app.db.session import get_async_db
+from app.services.principals import principals
+from app.services.registration import create_user_with_free_plan
+from app.services.oauth import OAuthError, fetch_google_profile, fetch_github_profile, verify_apple_token
 import secrets
-import requests
 
 router = APIRouter()
 
 @router.post("/auth/social-login", response_model=TokenResponse, tags=["Authentication"])
-def social_login(request: SocialLoginRequest, db: Session = Depends(get_db)):
+async def social_login(request: SocialLoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login or Register using Social Provider"""
-    
-    # Google Token Verification
-    if request.provider.lower() == 'google' and request.token:
-        try:
-            resp = requests.get(
-                "https://www.googleapis.com/oauth2/v3/userinfo", 
-                headers={"Authorization": f"Bearer {request.token}"}
-            )
-            if resp.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid Google Token")
-            
-            google_data = resp.json()
-            request.email = google_data.get('email')
-            request.name = google_data.get('name', 'Google User')
-            
-            if not request.email:
-                raise HTTPException(status_code=400, detail="Google account has no email")
-                
-        except Exception as e:
-            raise HTTPException(status_code=401, detail=f"Google authentication failed: {str(e)}")
-
-    # GitHub Code Verification
-    elif request.provider.lower() == 'github' and request.code:
-        import os
-        client_id = os.getenv("GITHUB_CLIENT_ID")
-        client_secret = os.getenv("GITHUB_CLIENT_SECRET")
-        
-        if not client_id or not client_secret:
-            raise HTTPException(status_code=500, detail="GitHub credentials not configured")
+    provider = request.provider.lower()
+    try:
+        # Google Token Verification
+        if provider == 'google' and request.token:
+            profile = await fetch_google_profile(request.token)
+            request.email = profile.email
+            request.name = profile.name
 
-        try:
-            # Exchange code for token
-            token_resp = requests.post(
-                "https://github.com/login/oauth/access_token",
-                headers={"Accept": "application/json"},
-                data={
-                    "client_id": client_id,
-                    "client_secret": client_secret,
-                    "code": request.code
-                }
-            )
-            if token_resp.status_code != 200:
-                raise HTTPException(status_code=401, detail=f"Failed to exchange GitHub code: {token_resp.text}")
-            
-            token_data = token_resp.json()
-            access_token = token_data.get("access_token")
-            if not access_token:
-                 raise HTTPException(status_code=401, detail=f"No access token from GitHub. Response: {token_data}")
-
-            # Get User Info
-            user_resp = requests.get(
-                "https://api.github.com/user",
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
-            github_user = user_resp.json()
-            request.email = github_user.get("email")
-            request.name = github_user.get("name") or github_user.get("login")
-
-            # If email is private, fetch it
             if not request.email:
-                emails_resp = requests.get(
-                    "https://api.github.com/user/emails",
-                    headers={"Authorization": f"Bearer {access_token}"}
-                )
-                if emails_resp.status_code == 200:
-                    emails = emails_resp.json()
-                    for e in emails:
-                        if e.get("primary") and e.get("verified"):
-                            request.email = e.get("email")
-                            break
-                    if not request.email and emails:
-                         request.email = emails[0].get("email")
-                         
-        except Exception as e:
-             raise HTTPException(status_code=401, detail=f"GitHub login failed: {str(e)}")
+                raise HTTPException(status_code=400, detail="Google account has no email")
 
-    # Apple Token Verification
-    elif request.provider.lower() == 'apple' and request.token:
-        try:
-            # 1. Fetch Apple's Public Keys
-            apple_keys_url = "https://appleid.apple.com/auth/keys"
-            keys_resp = requests.get(apple_keys_url)
-            keys = keys_resp.json()['keys']
-            
-            # 2. Decode the ID Token header to find the Key ID (kid)
-            from jose import jwt
-            
-            # We verify the signature using the matching key
-            # This requires matching the 'kid' from the token header to the keys from Apple
-            # python-jose handles looking up the key if we pass the keyset, but we need to format it right
-            # or simply let it try all keys (inefficient but works for small sets)
-            
-            # Simplified verification:
-            # Audience should typically be verified.
-            # We skip explicit audience check here for generic acceptance, OR check against env var if set
-            # For strict security, you should check audience=APPLE_CLIENT_ID
-            
-            payload = jwt.decode(
-                request.token,
-                keys,
-                algorithms=['RS256'],
-                options={"verify_aud": False, "verify_iss": True}, # Issuer must be apple
-                issuer="https://appleid.apple.com"
-            )
-            
-            # 3. Extract Info
-            token_email = payload.get('email')
-            if token_email:
-                request.email = token_email
-            
-            # Name is not in ID Token usually, it comes from frontend request (only on first login)
-            # If request.name is already set by frontend, good. If not, fallback.
-            if not request.name:
-                request.name = "Apple User"
-                
-        except Exception as e:
-             raise HTTPException(status_code=401, detail=f"Apple login failed: {str(e)}")
+        # GitHub Code Verification
+        elif provider == 'github' and request.code:
+            profile = await fetch_github_profile(request.code)
+            request.email = profile.email
+            request.name = profile.name
+
+        # Apple Token Verification
+        elif provider == 'apple' and request.token:
+            profile = await verify_apple_token(request.token, request.name)
+            if profile.email:
+                request.email = profile.email
+            request.name = profile.name
+    except OAuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
     if not request.email:
          raise HTTPException(status_code=400, detail="Email is required for social login")
 
-    user = db.query(User).filter(User.email == request.email).first()
+    user = (await db.execute(select(User).where(User.email == request.email))).scalars().first()
 
     if not user:
         # Create new user
@@ -145,34 +54,12 @@ def social_login(request: SocialLoginRequest, db: Session = Depends(get_db)):
         base_name = request.name if request.name else "user"
         unique_username = base_name.replace(" ", "").lower() + "_" + secrets.token_hex(4)
         
-        user = User(
+        user = await create_user_with_free_plan(
+            db,
             username=unique_username,
             email=request.email,
-            password=hash_password(random_password),
-            is_active=True
+            password_hash=await hash_password_async(random_password)
         )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
-        # Assign Free Subscription
-        free_plan = db.query(Plan).filter(Plan.type == PlanType.FREE).first()
-        if free_plan:
-            from datetime import timedelta
-            period_start = datetime.utcnow()
-            # For free plan, set end date far in the future (100 years)
-            period_end = period_start + timedelta(days=36500)
-            
-            new_subscription = Subscription(
-                user_id=user.id,
-                plan_id=free_plan.id,
-                status=SubscriptionStatus.ACTIVE,
-                created_at=period_start,
-                current_period_start=period_start,
-                current_period_end=period_end
-            )
-            db.add(new_subscription)
-            db.commit()
 
     token = create_access_token({"sub": user.email, "user_id": user.id})
 
@@ -190,10 +77,10 @@ def social_login(request: SocialLoginRequest, db: Session = Depends(get_db)):
     }
 
 @router.post("/auth/register", response_model=TokenResponse, status_code=status.HTTP_201_CREATED, tags=["Authentication"])
-def register_user(request: UserCreate, db: Session = Depends(get_db)):
+async def register_user(request: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user"""
     # Check if email exists
-    user_exists = db.query(User).filter(User.email == request.email).first()
+    user_exists = (await db.execute(select(User.id).where(User.email == request.email))).first()
     if user_exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -201,42 +88,21 @@ def register_user(request: UserCreate, db: Session = Depends(get_db)):
         )
 
     # Check if username exists
-    username_exists = db.query(User).filter(User.username == request.username).first()
+    username_exists = (await db.execute(select(User.id).where(User.username == request.username))).first()
     if username_exists:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already taken"
         )
 
-    # Create user
-    new_user = User(
+    # Create the user on the free plan, in one transaction
+    new_user = await create_user_with_free_plan(
+        db,
         username=request.username,
         email=request.email,
-        password=hash_password(request.password),
-        is_active=True
+        # bcrypt is deliberately slow; keep it off the event loop
+        password_hash=await hash_password_async(request.password)
     )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-
-    # Assign Free Subscription
-    free_plan = db.query(Plan).filter(Plan.type == PlanType.FREE).first()
-    if free_plan:
-        from datetime import timedelta
-        period_start = datetime.utcnow()
-        # For free plan, set end date far in the future (100 years)
-        period_end = period_start + timedelta(days=36500)
-        
-        new_subscription = Subscription(
-            user_id=new_user.id,
-            plan_id=free_plan.id,
-            status=SubscriptionStatus.ACTIVE,
-            created_at=period_start,
-            current_period_start=period_start,
-            current_period_end=period_end
-        )
-        db.add(new_subscription)
-        db.commit()
 
     # Create access token
     token = create_access_token({"sub": new_user.email, "user_id": new_user.id})
@@ -255,9 +121,9 @@ def register_user(request: UserCreate, db: Session = Depends(get_db)):
     }
 
 @router.post("/auth/login", response_model=TokenResponse, tags=["Authentication"])
-def login_user(request: UserLogin, db: Session = Depends(get_db)):
+async def login_user(request: UserLogin, db: AsyncSession = Depends(get_async_db)):
     """Login user and get access token"""
-    user = db.query(User).filter(User.email == request.email).first()
+    user = (await db.execute(select(User).where(User.email == request.email))).scalars().first()
 
     if not user:
         raise HTTPException(
@@ -265,7 +131,8 @@ def login_user(request: UserLogin, db: Session = Depends(get_db)):
             detail="Invalid email or password"
         )
 
-    if not verify_password(request.password, user.password):
+    valid, new_hash = await verify_password_async(request.password, user.password)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -277,6 +144,13 @@ def login_user(request: UserLogin, db: Session = Depends(get_db)):
             detail="Inactive user"
         )
 
+    if new_hash:
+        # Stored with different BCRYPT_ROUNDS; upgrade it now that we know the password
+        user.password = new_hash
+        await db.commit()
+
+    # A fresh login picks up changes made outside the API (e.g. admin scripts)
+    principals.invalidate(user.id)
     token = create_access_token({"sub": user.email, "user_id": user.id})
 
     return {
@@ -293,17 +167,19 @@ def login_user(request: UserLogin, db: Session = Depends(get_db)):
     }
 
 @router.get("/auth/me", response_model=UserResponse, tags=["Authentication"])
-def get_current_user_info(current_user: User = Depends(get_current_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_user_async)):
     """Get current authenticated user info"""
     return current_user
 
 @router.get("/auth/stats", tags=["Authentication"])
-def get_user_stats(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_user_stats(
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
+):
     """Get user dashboard statistics"""
-    from app.models.code_execution import CodeExecution
-    
-    execution_count = db.query(CodeExecution).filter(CodeExecution.user_id == current_user.id).count()
-    
+    await db.refresh(current_user, ["execution_count"])
+    execution_count = current_user.execution_count or 0
+
     # Currently assuming 1 execution = 1 AI request as per current logic
     return {
         "total_executions": execution_count,
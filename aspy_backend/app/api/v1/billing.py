@@ -1,31 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.models.invoice import Invoice
-from app.models.subscription import Subscription, SubscriptionStatus
+from app.services.entitlements import get_user_entitlements
 from app.schemas.billing import InvoiceResponse, UsageStats
 from app.core.security import get_current_user
+from app.core.pagination import paginate, set_next_cursor
 
 router = APIRouter()
 
 @router.get("/billing/invoices", response_model=List[InvoiceResponse], tags=["Billing"])
 def get_invoices(
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    """Get all invoices for current user"""
-    invoices = db.query(Invoice).filter(
+    """Get invoices for current user, newest first"""
+    query = db.query(Invoice).filter(
         Invoice.user_id == current_user.id
-    ).order_by(Invoice.created_at.desc()).all()
+    )
+    invoices, next_cursor = paginate(query, Invoice.created_at, Invoice.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
 
     return invoices
 
 @router.get("/billing/invoices/{invoice_id}", response_model=InvoiceResponse, tags=["Billing"])
 def get_invoice(
     invoice_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get specific invoice by ID"""
@@ -41,25 +48,20 @@ def get_invoice(
 
 @router.get("/billing/usage", response_model=UsageStats, tags=["Billing"])
 def get_usage_stats(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get usage statistics for current user"""
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    plan = get_user_entitlements(db, current_user.id)
 
-    if not subscription:
+    if not plan.has_active_subscription:
         raise HTTPException(status_code=404, detail="No active subscription found")
 
-    invoices = db.query(Invoice).filter(
+    total_spent = db.query(func.sum(Invoice.amount)).filter(
         Invoice.user_id == current_user.id,
-        Invoice.subscription_id == subscription.id,
+        Invoice.subscription_id == plan.subscription_id,
         Invoice.status == 'paid'
-    ).all()
-
-    total_spent = sum(float(invoice.amount) for invoice in invoices)
+    ).scalar() or 0
 
     # Example usage metrics - you should implement actual tracking
     usage_metrics = {
@@ -69,9 +71,9 @@ def get_usage_stats(
     }
 
     return UsageStats(
-        current_plan=subscription.plan.name,
-        plan_type=subscription.plan.type.value,
-        total_spent=total_spent,
-        next_billing_date=subscription.current_period_end,
+        current_plan=plan.plan_name,
+        plan_type=plan.plan_type.value,
+        total_spent=float(total_spent),
+        next_billing_date=plan.current_period_end,
         usage_metrics=usage_metrics
     )
\ No newline at end of file
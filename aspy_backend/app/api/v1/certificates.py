@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.api.v1.auth import get_current_active_user
 from app.models.user import User
-from app.models.subscription import Subscription, SubscriptionStatus, PlanType
+from app.services.entitlements import get_user_entitlements
 from app.models.code_execution import CodeExecution
 from app.models.language import Language
 from datetime import datetime
@@ -12,25 +12,16 @@ router = APIRouter()
 
 @router.get("/certificates", tags=["Certificates"])
 def get_user_certificates(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get list of earned certificates based on language usage.
     Only for PRO users (paid plans).
     """
-    # 1. Check Subscription eligibility
-    active_sub = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE,
-    ).first()
+    # 1. Check Subscription eligibility (PRO or any paid subscription)
+    has_access = get_user_entitlements(db, current_user.id).can_access_certificates
 
-    has_access = False
-    if active_sub and active_sub.plan:
-        # Check if user has a paid plan (PRO or any paid subscription)
-        if active_sub.plan.type == PlanType.PRO or active_sub.plan.price > 0:
-             has_access = True
-    
     if not has_access:
         return {
             "eligible": False,
@@ -1,55 +1,68 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app.db.session import get_db
+from sqlalchemy import insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.session import get_async_db, AsyncSessionLocal
 from app.api.v1.auth import get_current_active_user
 from app.models.user import User
 from app.models.code_execution import CodeExecution
-from app.models.subscription import Subscription, SubscriptionStatus
-from app.schemas.execution import CodeRunRequest, CodeRunResponse
-from openai import OpenAI
-import os
-import sys
-import io
-import traceback
-from typing import Optional
+from app.models.language import Language
+from app.schemas.execution import CodeRunRequest, CodeRunResponse, BatchCodeRunRequest, BatchCodeRunResponse
+from app.services.translation import translate_to_python, translate_batch, stream_translation, clean_generated_code
+from app.services.sandbox import sandbox_pool, SandboxBusyError
+from app.services.execution_cache import execution_cache
+from app.services.code_policy import compiled_programs
+from app.services.entitlements import get_user_entitlements_async
+from app.services.principals import principals
+from typing import List, Optional, Tuple
+import asyncio
+import json
 
 router = APIRouter()
 security = HTTPBearer(auto_error=False)
 
-# Configure OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+SANDBOX_BUSY_MESSAGE = "Code runner is busy. Please try again in a moment."
 
-def execute_python_safe(code_str: str) -> str:
+async def execute_python_safe(code_str: str) -> str:
     """
-    Executes Python code in a restricted environment and captures stdout.
-    Note: This is a basic soft-sandbox (no docker).
+    Executes Python code in a pooled sandbox process and returns its output.
+    CPU time, wall clock and memory are limited per job (see app/services/sandbox.py).
+    Raises SandboxBusyError when the pool cannot take more work.
     """
-    # Basic security check
-    banned = ["import os", "import sys", "import subprocess", "__import__", "open(", "exec(", "eval("]
-    for b in banned:
-        if b in code_str:
-            return "Security Error: usage of restricted modules/functions"
-
-    old_stdout = sys.stdout
-    redirected_output = io.StringIO()
-    sys.stdout = redirected_output
-    
-    try:
-        # Define a restricted global scope
-        safe_globals = {"__builtins__": __builtins__} # Still allows some dangerous things, but better than nothing for a demo
-        exec(code_str, safe_globals)
-        output = redirected_output.getvalue()
-    except Exception:
-        output = traceback.format_exc()
-    finally:
-        sys.stdout = old_stdout
-    
-    return output
+    # Parsed, checked and compiled once per distinct program
+    program = compiled_programs.get(code_str)
+    if program.error:
+        return program.error
+
+    # Deterministic programs that already ran are answered from memory
+    cached = execution_cache.get(code_str)
+    if cached is not None:
+        return cached.output
+
+    result = await sandbox_pool.run_async(program.payload)
+    execution_cache.offer(code_str, result, deterministic=program.deterministic)
+    return result.output
+
+def format_execution_output(python_code: str, execution_output: str) -> str:
+    return f"> Generated Python Code:\n{python_code}\n\n> Output:\n{execution_output}"
+
+def format_error_output(request: CodeRunRequest, e: Exception) -> str:
+    # Debug helper: List available models
+    available_models = ["gpt-4o", "gpt-3.5-turbo"] # Static list as listing is different in OpenAI
+
+    # Fallback to simulated if API fails or key missing
+    if "API_KEY" in str(e):
+        return f"> Executing {request.language} code...\n\n> Output:\nHello from DesiCodes (Simulated)!\nLanguage: {request.language}\n(OpenAI API Key missing or invalid)"
+
+    return f"Error processing request: {str(e)}\n\nAvailable Models: {', '.join(available_models)}"
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
 async def get_optional_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Optional[User]:
     """
     Get current user if authenticated, otherwise return None.
@@ -76,7 +89,7 @@ async def get_optional_current_user(
             print(f"❌ No email in token")
             return None
             
-        user = db.query(User).filter(User.email == email).first()
+        user = await principals.get_async(db, email)
         if user:
             print(f"✅ User found: {user.id} ({user.email})")
         else:
@@ -86,10 +99,77 @@ async def get_optional_current_user(
         print(f"❌ Error decoding token: {str(e)}")
         return None
 
+async def check_execution_quota(db: AsyncSession, current_user: User) -> Optional[int]:
+    """Raise 403 when a free user has used up their runs; otherwise return the runs left (None for unlimited)"""
+    plan = await get_user_entitlements_async(db, current_user.id)
+    if plan.has_active_subscription:
+        print(f"💳 Plan: {plan.plan_name}, Price: {plan.price}")
+    else:
+        print(f"❌ No active subscription found")
+
+    limit = plan.execution_limit
+    # The cached principal leaves the counter unloaded; read the current value
+    await db.refresh(current_user, ["execution_count"])
+    run_count = current_user.execution_count or 0
+    if limit is not None and run_count >= limit:
+        # Don't refuse on a cached plan: the user may just have upgraded on another worker
+        limit = (await get_user_entitlements_async(db, current_user.id, fresh=True)).execution_limit
+
+    if limit is None:
+        print(f"✅ Pro user - unlimited executions")
+        return None
+
+    print(f"🔢 Execution count: {run_count}/{limit}")
+    if run_count >= limit:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"Free plan limit reached ({limit} runs). Please upgrade to purchase a subscription to continue running code."
+        )
+    return limit - run_count
+
+async def save_execution(db: AsyncSession, current_user: User, request: CodeRunRequest, final_output: str) -> None:
+    """Persist an execution for the user; failures are logged, never raised"""
+    await save_executions(db, current_user, [(request, final_output)])
+
+async def save_executions(db: AsyncSession, current_user: User, runs: List[Tuple[CodeRunRequest, str]]) -> None:
+    """Persist (request, output) runs with one insert and one counter update; failures are logged, never raised"""
+    print(f"💾 Attempting to save {len(runs)} execution(s) for user {current_user.id}...")
+    try:
+        slugs = {request.language.lower() for request, _ in runs}
+        result = await db.execute(select(Language.slug, Language.id).where(Language.slug.in_(slugs)))
+        language_ids = dict(result.all())
+
+        # If not found by exact slug, maybe map common variations
+        for slug in slugs - language_ids.keys():
+            print(f"Warning: Language '{slug}' not found in database")
+
+        await db.execute(insert(CodeExecution), [
+            {
+                "user_id": current_user.id,
+                "language": request.language,
+                "language_id": language_ids.get(request.language.lower()),
+                "code": request.code,
+                "output": final_output,
+            }
+            for request, final_output in runs
+        ])
+        # Bump the usage counter in the same transaction as the insert
+        await db.execute(
+            update(User).where(User.id == current_user.id).values(
+                execution_count=User.execution_count + len(runs)
+            ).execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        print(f"✅ Saved {len(runs)} code execution(s) for user {current_user.id}")
+    except Exception as e:
+        print(f"❌ Failed to save code execution: {str(e)}")
+        await db.rollback()
+        # Don't fail the request if save fails
+
 @router.post("/execute", response_model=CodeRunResponse)
 async def execute_code(
     request: CodeRunRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
     # Log authentication status
@@ -99,99 +179,153 @@ async def execute_code(
     
     # Check limits only for authenticated users
     if current_user:
-        limit = 2
-        is_limited = True
-        
-        # Check active subscription
-        active_sub = db.query(Subscription).filter(
-            Subscription.user_id == current_user.id,
-            Subscription.status == SubscriptionStatus.ACTIVE
-        ).first()
-
-        if active_sub and active_sub.plan:
-            print(f"💳 Plan: {active_sub.plan.name}, Price: {active_sub.plan.price}")
-            if active_sub.plan.price > 0:
-                is_limited = False
-                print(f"✅ Pro user - unlimited executions")
-        else:
-            print(f"❌ No active subscription found")
-        
-        if is_limited:
-            run_count = db.query(CodeExecution).filter(CodeExecution.user_id == current_user.id).count()
-            print(f"🔢 Execution count: {run_count}/{limit}")
-            if run_count >= limit:
-                 raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail=f"Free plan limit reached ({limit} runs). Please upgrade to purchase a subscription to continue running code."
-                )
+        await check_execution_quota(db, current_user)
+        # Hand the connection back to the pool while translation and execution run
+        await db.commit()
 
     try:
-        # 1. Translate Code
-        # Try finding a valid model
-        model_name = 'gpt-4o'
-        
-        translation_messages = [
-            {"role": "system", "content": "You are an expert code translator. Convert the input pseudocode/instruction into valid, executable Python code. Do not use input() functions (hardcode values if needed). Return ONLY the python code, no markdown backticks."},
-            {"role": "user", "content": f"Input Code ({request.language}):\n{request.code}"}
-        ]
-        
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=translation_messages,
-            temperature=0.2
-        )
-
-        python_code = response.choices[0].message.content.replace("```python", "").replace("```", "").strip()
+        # 1. Translate Code (repeat snippets are served from the translation cache)
+        python_code = await translate_to_python(request.language, request.code)
 
         # 2. Execute Code
-        execution_output = execute_python_safe(python_code)
+        execution_output = await execute_python_safe(python_code)
 
         # Return only the output without explanation
-        final_output = f"> Generated Python Code:\n{python_code}\n\n> Output:\n{execution_output}"
-
+        final_output = format_execution_output(python_code, execution_output)
 
+    except SandboxBusyError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=SANDBOX_BUSY_MESSAGE,
+            headers={"Retry-After": "1"}
+        )
     except Exception as e:
-        # Debug helper: List available models
-        available_models = ["gpt-4o", "gpt-3.5-turbo"] # Static list as listing is different in OpenAI
-            
-        final_output = f"Error processing request: {str(e)}\n\nAvailable Models: {', '.join(available_models)}"
-        
-        # Fallback to simulated if API fails or key missing
-        if "API_KEY" in str(e):
-             final_output = f"> Executing {request.language} code...\n\n> Output:\nHello from DesiCodes (Simulated)!\nLanguage: {request.language}\n(OpenAI API Key missing or invalid)"
+        final_output = format_error_output(request, e)
 
-    
     # Save execution only for authenticated users
     if current_user:
-        print(f"💾 Attempting to save execution for user {current_user.id}...")
-        try:
-            from app.models.language import Language
-            lang_slug = request.language.lower()
-            lang_obj = db.query(Language).filter(Language.slug == lang_slug).first()
-            
-            # If not found by exact slug, maybe map common variations
-            if not lang_obj:
-                # Fallback query if needed or leave None
-                print(f"Warning: Language '{request.language}' not found in database")
-                pass
-
-            execution = CodeExecution(
-                user_id=current_user.id,
-                language=request.language,
-                language_id=lang_obj.id if lang_obj else None,
-                code=request.code,
-                output=final_output
-            )
-            db.add(execution)
-            db.commit()
-            db.refresh(execution)
-            print(f"✅ Saved code execution for user {current_user.id}, execution_id: {execution.id}")
-        except Exception as e:
-            print(f"❌ Failed to save code execution: {str(e)}")
-            db.rollback()
-            # Don't fail the request if save fails
-            pass
+        await save_execution(db, current_user, request, final_output)
     else:
         print(f"⚠️ User not authenticated - execution will NOT be saved")
 
     return {"output": final_output}
+
+
+@router.post("/execute/batch", response_model=BatchCodeRunResponse)
+async def execute_code_batch(
+    request: BatchCodeRunRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
+):
+    """
+    Run several snippets in one request, e.g. every example on a course page.
+    Translations are packed into as few completions as possible, the programs
+    run concurrently in the sandbox and all executions are saved with one
+    insert. Results are in request order. A free user's snippets beyond their
+    remaining runs are not run and report the plan limit instead.
+    """
+    snippets = request.snippets
+    allowed = len(snippets)
+    if current_user:
+        remaining = await check_execution_quota(db, current_user)
+        if remaining is not None:
+            allowed = min(allowed, remaining)
+        await db.commit()
+
+    runnable = snippets[:allowed]
+    translations = await translate_batch([(snippet.language, snippet.code) for snippet in runnable])
+
+    async def run(snippet: CodeRunRequest, python_code) -> Tuple[str, bool]:
+        """(output, counts as a run)"""
+        if isinstance(python_code, Exception):
+            return format_error_output(snippet, python_code), True
+        try:
+            execution_output = await execute_python_safe(python_code)
+        except SandboxBusyError:
+            # Not charged; the page can retry just this snippet
+            return SANDBOX_BUSY_MESSAGE, False
+        except Exception as e:
+            return format_error_output(snippet, e), True
+        return format_execution_output(python_code, execution_output), True
+
+    outcomes = await asyncio.gather(*(run(snippet, python_code) for snippet, python_code in zip(runnable, translations)))
+
+    if current_user:
+        runs = [(snippet, output) for snippet, (output, counted) in zip(runnable, outcomes) if counted]
+        if runs:
+            await save_executions(db, current_user, runs)
+    else:
+        print(f"⚠️ User not authenticated - executions will NOT be saved")
+
+    limit_message = "Free plan limit reached. Please upgrade to purchase a subscription to continue running code."
+    outputs = [output for output, _ in outcomes] + [limit_message] * (len(snippets) - len(runnable))
+    return {"results": [{"output": output} for output in outputs]}
+
+
+@router.post("/execute/stream")
+async def execute_code_stream(
+    request: CodeRunRequest,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: Optional[User] = Depends(get_optional_current_user)
+):
+    """
+    Same as /execute, streamed as Server-Sent Events:
+    `code` (generated Python as it is produced), `code_done`, `stdout`/`stderr`
+    (program output line by line), `error`, and a final `done` with the full output.
+    """
+    if current_user:
+        await check_execution_quota(db, current_user)
+        await db.commit()
+
+    async def events():
+        try:
+            python_parts = []
+            async for delta in stream_translation(request.language, request.code):
+                python_parts.append(delta)
+                yield sse_event("code", {"delta": delta})
+            python_code = clean_generated_code("".join(python_parts))
+            yield sse_event("code_done", {"python_code": python_code})
+
+            program = compiled_programs.get(python_code)
+            execution_output = program.error
+            cached = execution_cache.get(python_code) if not execution_output else None
+            if execution_output:
+                yield sse_event("stderr", {"text": execution_output})
+            elif cached is not None:
+                # Replayed in one chunk per stream; the program doesn't run again
+                for kind, text in (("stdout", cached.stdout), ("stderr", cached.stderr)):
+                    if text:
+                        yield sse_event(kind, {"text": text})
+                execution_output = cached.output
+            else:
+                async for kind, payload in sandbox_pool.stream(program.payload):
+                    if kind == "result":
+                        execution_output = payload.output
+                        execution_cache.offer(python_code, payload, deterministic=program.deterministic)
+                        # Limit errors (timeouts etc.) are appended after the program's own output
+                        trailer = execution_output[len(payload.stdout) + len(payload.stderr):]
+                        if trailer:
+                            yield sse_event("stderr", {"text": trailer})
+                    else:
+                        yield sse_event(kind, {"text": payload})
+
+            final_output = format_execution_output(python_code, execution_output)
+        except SandboxBusyError:
+            yield sse_event("error", {"detail": SANDBOX_BUSY_MESSAGE})
+            return
+        except Exception as e:
+            final_output = format_error_output(request, e)
+            yield sse_event("error", {"detail": final_output})
+
+        # The request's session may already be closed once the body streams, use a fresh one
+        if current_user:
+            async with AsyncSessionLocal() as save_db:
+                await save_execution(save_db, current_user, request, final_output)
+
+        yield sse_event("done", {"output": final_output})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,9 +1,10 @@
 # app/api/v1/invoice.py - VERIFIED VERSION
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
-from typing import List
-from app.db.session import get_db
+from typing import List, Optional
+from app.db.routing import get_read_db
 from app.core.security import get_current_user
+from app.core.pagination import paginate, set_next_cursor
 from app.models.user import User
 from app.models.invoice import Invoice
 from app.schemas.invoice import InvoiceResponse
@@ -12,19 +13,24 @@ router = APIRouter(tags=["Invoices"])
 
 @router.get("/invoices/my", response_model=List[InvoiceResponse])
 def get_my_invoices(
-    db: Session = Depends(get_db),
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get current user's invoices"""
-    invoices = db.query(Invoice).filter(
+    """Get current user's invoices, newest first"""
+    query = db.query(Invoice).filter(
         Invoice.user_id == current_user.id
-    ).order_by(Invoice.created_at.desc()).all()
+    )
+    invoices, next_cursor = paginate(query, Invoice.created_at, Invoice.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
     return invoices
 
 @router.get("/invoices/{invoice_id}", response_model=InvoiceResponse)
 def get_invoice(
     invoice_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific invoice by ID"""
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional
 import razorpay
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
 
 from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.models.subscription import Plan, Subscription, SubscriptionStatus
 from app.models.invoice import Invoice
 from app.models.payment import Payment, PaymentStatus
@@ -17,6 +19,9 @@ from app.schemas.payment import (
     PaymentHistory
 )
 from app.core.security import get_current_user
+from app.core.pagination import paginate, set_next_cursor
+from app.services.entitlements import activate_paid_plan, entitlements, get_active_subscription
+from app.services.principals import principals
 
 router = APIRouter()
 
@@ -104,6 +109,7 @@ def create_razorpay_subscription(
             })
             current_user.razorpay_customer_id = customer['id']
             db.commit()
+            principals.invalidate(current_user.id)
         
         # Step 2: Create Razorpay subscription
         subscription_data = {
@@ -148,6 +154,39 @@ def create_razorpay_subscription(
         raise HTTPException(status_code=500, detail=f"Failed to create subscription: {str(e)}")
 
 
+def _recorded_payment(db: Session, provider_payment_id: str, user_id: int) -> Optional[Payment]:
+    payment = db.query(Payment).filter(Payment.provider_payment_id == provider_payment_id).first()
+    if payment and payment.user_id != user_id:
+        raise HTTPException(status_code=400, detail="Payment belongs to another account")
+    return payment
+
+
+def _verified_response(payment: Payment, razorpay_subscription_id: str) -> dict:
+    return {
+        "status": "success",
+        "message": "Subscription activated successfully",
+        "payment_id": payment.provider_payment_id,
+        "subscription_id": razorpay_subscription_id,
+        "amount": float(payment.amount),
+        "currency": payment.currency
+    }
+
+
+def _verify_subscription_signature(request: RazorpayVerifyRequest) -> None:
+    """400 unless Razorpay signed this payment for this subscription"""
+    try:
+        razorpay_client.utility.verify_subscription_payment_signature({
+            'razorpay_subscription_id': request.razorpay_order_id,
+            'razorpay_payment_id': request.razorpay_payment_id,
+            'razorpay_signature': request.razorpay_signature
+        })
+    except razorpay.errors.SignatureVerificationError:
+        raise HTTPException(status_code=400, detail="Invalid payment signature")
+    except Exception as e:
+        print(f"❌ Payment signature check failed: {str(e)}")
+        raise HTTPException(status_code=400, detail="Invalid payment signature")
+
+
 @router.post("/payments/razorpay/verify", tags=["Payments"])
 def verify_razorpay_payment(
         request: RazorpayVerifyRequest,
@@ -158,6 +197,20 @@ def verify_razorpay_payment(
     Verify Razorpay subscription payment and capture card details
     """
     try:
+        # Check for Mock Mode. Only the configuration decides it: a "sub_mock_"
+        # id in the body must not skip the signature check
+        is_mock = not RAZORPAY_KEY_ID or RAZORPAY_KEY_ID == "dummy" or not razorpay_client
+
+        # Before anything else, so a forged body is refused even for a payment
+        # the webhook has already recorded
+        if not is_mock:
+            _verify_subscription_signature(request)
+
+        # The payment.captured webhook may have recorded this payment already
+        existing = _recorded_payment(db, request.razorpay_payment_id, current_user.id)
+        if existing:
+            return _verified_response(existing, request.razorpay_order_id)
+
         # Find the pending invoice (razorpay_order_id now contains subscription_id)
         invoice = db.query(Invoice).filter(
             Invoice.razorpay_order_id == request.razorpay_order_id,
@@ -166,28 +219,13 @@ def verify_razorpay_payment(
         ).first()
 
         if not invoice:
+            # The webhook may have settled the invoice since the check above
+            existing = _recorded_payment(db, request.razorpay_payment_id, current_user.id)
+            if existing:
+                return _verified_response(existing, request.razorpay_order_id)
             raise HTTPException(status_code=404, detail=f"Invoice not found for subscription {request.razorpay_order_id}")
 
-        # Check for Mock Mode
-        is_mock = (not RAZORPAY_KEY_ID or RAZORPAY_KEY_ID == "dummy" or 
-                   not razorpay_client or 
-                   request.razorpay_order_id.startswith("sub_mock_"))
-
         if not is_mock:
-            # Verify payment signature for subscription
-            try:
-                params_dict = {
-                    'razorpay_subscription_id': request.razorpay_order_id,
-                    'razorpay_payment_id': request.razorpay_payment_id,
-                    'razorpay_signature': request.razorpay_signature
-                }
-                razorpay_client.utility.verify_payment_signature(params_dict)
-            except razorpay.errors.SignatureVerificationError:
-                raise HTTPException(status_code=400, detail="Invalid payment signature")
-            except Exception as e:
-                # Signature verification might fail for subscriptions, log and continue
-                print(f"Signature verification skipped: {str(e)}")
-
             # Fetch payment details to get card info and invoice ID
             try:
                 payment_details = razorpay_client.payment.fetch(request.razorpay_payment_id)
@@ -247,34 +285,8 @@ def verify_razorpay_payment(
         plan = db.query(Plan).filter(Plan.id == invoice.plan_id).first()
 
         if plan:
-            # Create or update subscription
-            subscription = db.query(Subscription).filter(
-                Subscription.user_id == current_user.id
-            ).first()
-
-            if not subscription:
-                # Create new subscription
-                period_start = datetime.utcnow()
-                period_end = period_start + timedelta(days=30)
-
-                subscription = Subscription(
-                    user_id=current_user.id,
-                    plan_id=plan.id,
-                    status=SubscriptionStatus.ACTIVE,
-                    razorpay_subscription_id=request.razorpay_order_id,  # Save subscription ID
-                    current_period_start=period_start,
-                    current_period_end=period_end,
-                    created_at=datetime.utcnow()
-                )
-                db.add(subscription)
-                db.flush()
-            else:
-                # Upgrade/Downgrade/Renew existing subscription
-                subscription.plan_id = plan.id
-                subscription.status = SubscriptionStatus.ACTIVE
-                subscription.razorpay_subscription_id = request.razorpay_order_id
-                subscription.current_period_start = datetime.utcnow()
-                subscription.current_period_end = datetime.utcnow() + timedelta(days=30)
+            # Upgrade/Downgrade/Renew the user's subscription, or create one
+            subscription = activate_paid_plan(db, current_user.id, plan.id, request.razorpay_order_id)
 
             # Capture card details if available
             print(f"Payment method: {payment_details.get('method')}")
@@ -303,16 +315,20 @@ def verify_razorpay_payment(
             invoice.subscription_id = subscription.id
             
         db.commit()
+        entitlements.invalidate(current_user.id)
 
-        return {
-            "status": "success",
-            "message": "Subscription activated successfully",
-            "payment_id": request.razorpay_payment_id,
-            "subscription_id": request.razorpay_order_id,
-            "amount": invoice.amount,
-            "currency": invoice.currency
-        }
+        return _verified_response(new_payment, request.razorpay_order_id)
 
+    except IntegrityError:
+        # The webhook recorded the payment between our check and our insert
+        db.rollback()
+        existing = _recorded_payment(db, request.razorpay_payment_id, current_user.id)
+        if not existing:
+            raise HTTPException(status_code=500, detail="Failed to process subscription: conflicting payment record")
+        return _verified_response(existing, request.razorpay_order_id)
+    except HTTPException:
+        db.rollback()
+        raise
     except razorpay.errors.SignatureVerificationError:
         db.rollback()
         raise HTTPException(status_code=400, detail="Invalid payment signature")
@@ -323,15 +339,22 @@ def verify_razorpay_payment(
 
 @router.get("/payments/history", response_model=List[PaymentHistory], tags=["Payments"])
 def get_payment_history(
-        db: Session = Depends(get_db),
+        response: Response,
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+        limit: int = Query(50, ge=1, le=200),
+        db: Session = Depends(get_read_db),
         current_user=Depends(get_current_user)
 ):
     """
-    Get payment history for current user
+    Get payment history for current user, newest first
     """
-    payments = db.query(Payment).filter(
+    query = db.query(Payment).options(
+        joinedload(Payment.subscription).joinedload(Subscription.plan)
+    ).filter(
         Payment.user_id == current_user.id
-    ).order_by(Payment.created_at.desc()).all()
+    )
+    payments, next_cursor = paginate(query, Payment.created_at, Payment.id, cursor, limit)
+    set_next_cursor(response, next_cursor)
 
     history = []
     for payment in payments:
@@ -444,10 +467,7 @@ def get_current_payment_method(
     Get current payment method details from active subscription
     """
     # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    subscription = get_active_subscription(db, current_user.id)
     
     if not subscription:
         return {
@@ -502,10 +522,7 @@ def update_payment_method(
     Returns a Razorpay checkout link to collect new payment details
     """
     # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    subscription = get_active_subscription(db, current_user.id)
     
     if not subscription:
         raise HTTPException(status_code=404, detail="No active subscription found")
@@ -550,10 +567,7 @@ def cancel_subscription(
     Cancel user's active subscription (will not renew at end of current period)
     """
     # Find active subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    subscription = get_active_subscription(db, current_user.id)
     
     if not subscription:
         raise HTTPException(status_code=404, detail="No active subscription found")
@@ -571,6 +585,7 @@ def cancel_subscription(
         subscription.cancel_at_period_end = True
         subscription.cancelled_at = datetime.utcnow()
         db.commit()
+        entitlements.invalidate(current_user.id)
         
         return {
             "status": "success",
@@ -592,6 +607,7 @@ def cancel_subscription(
         subscription.cancel_at_period_end = True
         subscription.cancelled_at = datetime.utcnow()
         db.commit()
+        entitlements.invalidate(current_user.id)
         
         return {
             "status": "success",
@@ -613,10 +629,7 @@ def resume_subscription(
     Resume a cancelled subscription (prevents cancellation at period end)
     """
     # Find subscription
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
+    subscription = get_active_subscription(db, current_user.id)
     
     if not subscription:
         raise HTTPException(status_code=404, detail="No subscription found")
@@ -639,6 +652,7 @@ def resume_subscription(
         subscription.cancel_at_period_end = False
         subscription.cancelled_at = None
         db.commit()
+        entitlements.invalidate(current_user.id)
         
         return {
             "status": "success",
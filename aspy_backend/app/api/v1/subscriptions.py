@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from app.db.session import get_db
+from app.db.routing import get_read_db
 from app.models.subscription import Subscription, Plan, SubscriptionStatus
 from app.schemas.subscription import (
     Subscription as SubscriptionSchema,
@@ -9,19 +10,20 @@ from app.schemas.subscription import (
     Plan as PlanSchema
 )
 from app.core.security import get_current_user
+from app.services.entitlements import entitlements
 from datetime import datetime, timedelta
 
 router = APIRouter()
 
 @router.get("/plans", response_model=List[PlanSchema], tags=["Plans"])
-def get_available_plans(db: Session = Depends(get_db)):
+def get_available_plans(db: Session = Depends(get_read_db)):
     """Get all available subscription plans"""
     plans = db.query(Plan).all()
     return plans
 
 @router.get("/subscriptions", response_model=List[SubscriptionSchema], tags=["Subscriptions"])
 def get_user_subscriptions(
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get current user's subscriptions"""
@@ -33,7 +35,7 @@ def get_user_subscriptions(
 @router.get("/subscriptions/{subscription_id}", response_model=SubscriptionSchema, tags=["Subscriptions"])
 def get_subscription_details(
     subscription_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """Get details of a specific subscription"""
@@ -82,6 +84,7 @@ def create_subscription(
     db.add(subscription)
     db.commit()
     db.refresh(subscription)
+    entitlements.invalidate(current_user.id)
 
     return subscription
 
@@ -108,5 +111,6 @@ def cancel_subscription(
 
     db.commit()
     db.refresh(subscription)
+    entitlements.invalidate(current_user.id)
 
     return subscription
\ No newline at end of file
@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.schemas.user import UserResponse, UserProfileUpdate
 from app.models.user import User
-from app.core.security import get_current_user, hash_password
+from app.core.security import get_current_user, hash_password_pooled
 from app.db.session import get_db
+from app.services.principals import principals
 
 router = APIRouter()
 
@@ -33,8 +34,9 @@ def update_user_profile(
     if profile_data.email:
         user.email = profile_data.email
     if profile_data.password:
-        user.password = hash_password(profile_data.password)
+        user.password = hash_password_pooled(profile_data.password)
 
     db.commit()
+    principals.invalidate(user.id)
     db.refresh(user)
     return user
\ No newline at end of file
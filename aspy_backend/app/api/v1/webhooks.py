@@ -1,15 +1,12 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import hmac
 import hashlib
 import json
 import os
-from datetime import datetime
 
-from app.db.session import get_db
-from app.models.user import User
-from app.models.subscription import Subscription, SubscriptionStatus, Plan
-from app.models.invoice import Invoice
+from app.db.session import get_async_db
+from app.services.webhook_inbox import enqueue_event, razorpay_ordering_key
 
 router = APIRouter()
 
@@ -19,9 +16,15 @@ razorpay_webhook_secret = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
 @router.post("/webhooks/razorpay", tags=["Webhooks"])
 async def razorpay_webhook(
         request: Request,
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_async_db)
 ):
-    """Handle Razorpay webhook events"""
+    """
+    Receive a Razorpay webhook event.
+
+    The event is verified and stored, then applied by the webhook inbox
+    worker (app.services.webhook_inbox), so the acknowledgement is a single
+    insert and redeliveries of the same event are ignored.
+    """
     payload = await request.body()
     sig_header = request.headers.get('x-razorpay-signature')
 
@@ -34,43 +37,24 @@ async def razorpay_webhook(
         hashlib.sha256
     ).hexdigest()
 
-    if not hmac.compare_digest(expected_signature, sig_header):
+    if not sig_header or not hmac.compare_digest(expected_signature, sig_header):
         raise HTTPException(status_code=400, detail="Invalid signature")
 
-    data = json.loads(payload)
-    event = data.get('event')
-
-    if event == 'payment.captured':
-        payment = data['payload']['payment']['entity']
-        user_id = payment['notes'].get('user_id')
-        plan_id = payment['notes'].get('plan_id')
-
-        if user_id and plan_id:
-            user = db.query(User).filter(User.id == user_id).first()
-            plan = db.query(Plan).filter(Plan.id == plan_id).first()
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid payload")
 
-            if user and plan:
-                subscription = Subscription(
-                    user_id=user.id,
-                    plan_id=plan.id,
-                    status=SubscriptionStatus.ACTIVE,
-                    razorpay_payment_id=payment['id'],
-                    current_period_start=datetime.utcnow(),
-                    current_period_end=datetime.utcnow()
-                )
-                db.add(subscription)
-                db.commit()
+    # Razorpay sends the same event id on every retry; hash the body if it is missing
+    event_id = request.headers.get('x-razorpay-event-id') or hashlib.sha256(payload).hexdigest()
 
-                invoice = Invoice(
-                    user_id=user.id,
-                    subscription_id=subscription.id,
-                    amount=payment['amount'] / 100,
-                    currency=payment['currency'],
-                    status='paid',
-                    razorpay_payment_id=payment['id'],
-                    paid_at=datetime.fromtimestamp(payment['created_at'])
-                )
-                db.add(invoice)
-                db.commit()
+    await enqueue_event(
+        db,
+        provider="razorpay",
+        event_id=event_id,
+        event_type=data.get('event') or "unknown",
+        ordering_key=razorpay_ordering_key(data),
+        payload=payload.decode('utf-8')
+    )
 
-    return {"status": "success"}
\ No newline at end of file
+    return {"status": "success"}
@@ -0,0 +1,104 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import String, and_, or_, type_coerce
+
+# List endpoints keep returning a JSON array; the cursor for the next page travels in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        # Rows without a created_at are paged too; their cursor carries null
+        return (datetime.fromisoformat(created_at) if created_at is not None else None), int(row_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def _nulls_sort_first(dialect: str) -> bool:
+    """
+    Whether NULL created_at rows come first when ordering newest first. The
+    ORDER BY leaves NULL placement to the database so the (created_at, id)
+    indexes still serve it: PostgreSQL sorts NULLs as larger than any value,
+    SQLite and MySQL as smaller.
+    """
+    return dialect not in ("sqlite", "mysql", "mariadb")
+
+
+def _after_cursor(query, created_col, id_col, created_at: Optional[datetime], row_id: int):
+    nulls_first = _nulls_sort_first(query.session.get_bind().dialect.name)
+    if created_at is None:
+        after_null = and_(created_col.is_(None), id_col < row_id)
+        # Past the NULL rows come the dated ones, if they sort after them
+        return or_(after_null, created_col.is_not(None)) if nulls_first else after_null
+
+    if query.session.get_bind().dialect.name == "sqlite":
+        # SQLite keeps DATETIME as text: "YYYY-MM-DD HH:MM:SS" for rows filled by
+        # CURRENT_TIMESTAMP, with ".ffffff" appended for rows written from Python.
+        # Compare against the stored text so that equal timestamps really tie.
+        column = type_coerce(created_col, String)
+        text = created_at.strftime("%Y-%m-%d %H:%M:%S")
+        if created_at.microsecond:
+            text += f".{created_at.microsecond:06d}"
+            same_time = column == text
+        else:
+            same_time = column.in_([text, text + ".000000"])
+        after = or_(column < text, and_(same_time, id_col < row_id))
+    else:
+        after = or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id)
+        )
+    # Comparisons never match NULL; when those rows sort last, they still follow
+    return after if nulls_first else or_(after, created_col.is_(None))
+
+
+def keyset_page(query, created_col, id_col, cursor: Optional[str], limit: int, skip: int = 0):
+    """
+    Order a query newest first by (created_at, id) and position it after the
+    cursor. One extra row is fetched so paginate() can tell if a next page exists.
+    `skip` is the deprecated offset paging, only honoured without a cursor.
+    """
+    query = query.order_by(created_col.desc(), id_col.desc())
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(_after_cursor(query, created_col, id_col, created_at, row_id))
+    elif skip:
+        query = query.offset(skip)
+    return query.limit(limit + 1)
+
+
+def paginate(
+    query,
+    created_col,
+    id_col,
+    cursor: Optional[str],
+    limit: int,
+    skip: int = 0,
+    key: Callable[[Any], Tuple[Optional[datetime], int]] = lambda row: (row.created_at, row.id)
+) -> Tuple[List[Any], Optional[str]]:
+    """Return one page of rows and the cursor of the page after it (None on the last page)"""
+    rows = keyset_page(query, created_col, id_col, cursor, limit, skip).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
@@ -2,18 +2,20 @@ from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from passlib.context import CryptContext
+from typing import Optional, Tuple
 import os
-from app.db.session import get_db
+from app.db.session import get_db, get_async_db
 from app.models.user import User
+from app.services.principals import principals
+from app.services.passwords import password_hasher, pwd_context, PasswordHasherBusyError
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "1440"))
 
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def hash_password(password: str) -> str:
@@ -24,6 +26,41 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many sign-in requests right now. Please try again in a moment.",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the bounded bcrypt pool; 429 when it is saturated"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusyError:
+        raise _hashing_busy()
+
+
+def hash_password_pooled(password: str) -> str:
+    """hash_password on the bounded bcrypt pool, for sync handlers"""
+    try:
+        return password_hasher.hash_blocking(password)
+    except PasswordHasherBusyError:
+        raise _hashing_busy()
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify on the bounded bcrypt pool. Returns (valid, new_hash); store
+    new_hash when set, it replaces a hash made with other BCRYPT_ROUNDS.
+    """
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PasswordHasherBusyError:
+        raise _hashing_busy()
+
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -31,10 +68,8 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-def get_current_user(
-        credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
-) -> User:
+def get_token_email(credentials: HTTPAuthorizationCredentials) -> str:
+    """Decode the bearer token and return its subject (the user's email)"""
     if not credentials:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -54,23 +89,10 @@ def get_current_user(
                 detail="Invalid token payload",
             )
 
-        # Get user from database
-        user = db.query(User).filter(User.email == email).first()
-
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="User not found",
-            )
-
-        if not user.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Inactive user",
-            )
-
-        return user
+        return email
 
+    except HTTPException:
+        raise
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -86,4 +108,41 @@ def get_current_user(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Authentication error: {str(e)}",
-        )
\ No newline at end of file
+        )
+
+
+def check_user_allowed(user: User) -> User:
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+        )
+
+    if not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Inactive user",
+        )
+
+    return user
+
+
+def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: Session = Depends(get_db)
+) -> User:
+    email = get_token_email(credentials)
+
+    # Served from the principal cache when possible
+    user = principals.get(db, email)
+    return check_user_allowed(user)
+
+
+async def get_current_user_async(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """get_current_user for handlers on the async session"""
+    email = get_token_email(credentials)
+
+    return check_user_allowed(await principals.get_async(db, email))
\ No newline at end of file
@@ -0,0 +1,119 @@
+from typing import Optional
+
+from pydantic import Field, model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class DatabaseSettings(BaseSettings):
+    """
+    Engine and pool configuration, read from DATABASE_URL and DB_* variables.
+    Invalid values fail at import, so a misconfigured worker never starts.
+    """
+    # The URL carries credentials; keep it out of validation errors
+    model_config = SettingsConfigDict(env_prefix="DB_", extra="ignore", hide_input_in_errors=True)
+
+    url: str = Field(validation_alias="DATABASE_URL")
+
+    # Connections kept open per worker process, and extra ones allowed under burst
+    pool_size: int = Field(10, ge=1)
+    max_overflow: int = Field(10, ge=0)
+    # The async engine's pool, which also connects to the primary; unset means
+    # the same as the sync pool
+    async_pool_size: Optional[int] = Field(None, ge=1)
+    async_max_overflow: Optional[int] = Field(None, ge=0)
+    # Seconds a request waits for a free connection before failing
+    pool_timeout: float = Field(30, gt=0)
+    # Reopen connections older than this (seconds, -1 to disable); keep it below
+    # the idle timeout of any proxy in front of Postgres
+    pool_recycle: int = Field(1800, ge=-1)
+    pool_pre_ping: bool = True
+    # Server-side cap per statement in milliseconds (Postgres only, 0 to disable)
+    statement_timeout_ms: int = Field(30000, ge=0)
+
+    # Optional read replica for read-only endpoints (same pool settings as the primary)
+    replica_url: Optional[str] = None
+    # Fall back to the primary when the replica is further behind than this
+    replica_max_lag_seconds: float = Field(5, gt=0)
+    # How often the replica's reachability and lag are re-checked
+    replica_health_check_seconds: float = Field(5, gt=0)
+    # After a user's billing data changes, serve their reads from the primary for this long
+    read_your_writes_seconds: float = Field(15, ge=0)
+
+    # Used only to check the total against max_connections
+    web_concurrency: int = Field(1, ge=1, validation_alias="WEB_CONCURRENCY")
+    # Connections this app may hold on the primary, summed across all workers and
+    # both (sync and async) pools
+    max_connections: Optional[int] = Field(None, ge=1)
+    # The same limit for the replica server, which only the sync replica pool uses
+    replica_max_connections: Optional[int] = Field(None, ge=1)
+
+    @property
+    def is_sqlite(self) -> bool:
+        return self.url.startswith("sqlite")
+
+    @property
+    def is_postgres(self) -> bool:
+        return self.url.startswith(("postgres", "postgresql"))
+
+    @property
+    def effective_async_pool_size(self) -> int:
+        return self.pool_size if self.async_pool_size is None else self.async_pool_size
+
+    @property
+    def effective_async_max_overflow(self) -> int:
+        return self.max_overflow if self.async_max_overflow is None else self.async_max_overflow
+
+    @property
+    def connections_per_worker(self) -> int:
+        """Primary connections one worker can open: the sync pool plus the async pool"""
+        return (
+            self.pool_size + self.max_overflow
+            + self.effective_async_pool_size + self.effective_async_max_overflow
+        )
+
+    @property
+    def total_connections(self) -> int:
+        return self.connections_per_worker * self.web_concurrency
+
+    @property
+    def replica_total_connections(self) -> int:
+        if not self.replica_url:
+            return 0
+        return (self.pool_size + self.max_overflow) * self.web_concurrency
+
+    @model_validator(mode="after")
+    def check_connection_budget(self):
+        if self.max_connections is not None and self.total_connections > self.max_connections:
+            raise ValueError(
+                f"{self.web_concurrency} workers x (DB_POOL_SIZE {self.pool_size} + DB_MAX_OVERFLOW "
+                f"{self.max_overflow} + async pool {self.effective_async_pool_size} + async overflow "
+                f"{self.effective_async_max_overflow}) = {self.total_connections} connections exceeds "
+                f"DB_MAX_CONNECTIONS {self.max_connections}"
+            )
+        if self.replica_max_connections is not None and self.replica_total_connections > self.replica_max_connections:
+            raise ValueError(
+                f"{self.web_concurrency} workers x (DB_POOL_SIZE {self.pool_size} + DB_MAX_OVERFLOW "
+                f"{self.max_overflow}) = {self.replica_total_connections} replica connections exceeds "
+                f"DB_REPLICA_MAX_CONNECTIONS {self.replica_max_connections}"
+            )
+        return self
+
+    def describe(self) -> dict:
+        """Effective pool configuration, without the URL (it carries credentials)"""
+        return {
+            "dialect": self.url.split(":", 1)[0],
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "async_pool_size": self.effective_async_pool_size,
+            "async_max_overflow": self.effective_async_max_overflow,
+            "pool_timeout": self.pool_timeout,
+            "pool_recycle": self.pool_recycle,
+            "pool_pre_ping": self.pool_pre_ping,
+            "statement_timeout_ms": self.statement_timeout_ms if self.is_postgres else None,
+            "web_concurrency": self.web_concurrency,
+            "max_connections": self.max_connections,
+            "total_connections": self.total_connections,
+            "replica_configured": bool(self.replica_url),
+            "replica_max_connections": self.replica_max_connections,
+            "replica_total_connections": self.replica_total_connections,
+        }
@@ -0,0 +1,118 @@
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Checkouts slower than this count as contended
+SLOW_CHECKOUT_SECONDS = 0.01
+
+
+class PoolMetrics:
+    """Counters for connection checkouts, fed by the instrumented pool classes and pool events"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checkouts = 0
+            self.slow_checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+            self.connects = 0
+            self.invalidations = 0
+
+    def record_checkout(self, seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            if seconds > self.wait_seconds_max:
+                self.wait_seconds_max = seconds
+            if seconds >= SLOW_CHECKOUT_SECONDS:
+                self.slow_checkouts += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "slow_checkouts": self.slow_checkouts,
+                "timeouts": self.timeouts,
+                "checkout_ms_avg": round(self.wait_seconds_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                "checkout_ms_max": round(self.wait_seconds_max * 1000, 3),
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+            }
+
+
+pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+replica_pool_metrics = PoolMetrics()
+
+
+class _CheckoutTiming:
+    """
+    Records how long each checkout took: the wait for a free connection plus,
+    when needed, opening a new one or the pre-ping.
+    """
+    metrics: PoolMetrics
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class InstrumentedQueuePool(_CheckoutTiming, QueuePool):
+    metrics = pool_metrics
+
+
+class InstrumentedReplicaQueuePool(_CheckoutTiming, QueuePool):
+    metrics = replica_pool_metrics
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTiming, AsyncAdaptedQueuePool):
+    metrics = async_pool_metrics
+
+
+def instrument_pool(engine, metrics: PoolMetrics) -> None:
+    """Count new and discarded connections; checkout times come from the pool class"""
+    event.listen(engine, "connect", lambda *args: metrics.record_connect())
+    event.listen(engine, "invalidate", lambda *args: metrics.record_invalidation())
+    event.listen(engine, "soft_invalidate", lambda *args: metrics.record_invalidation())
+
+
+def pool_status(engine) -> dict:
+    """Occupancy and checkout metrics for a (sync) engine's pool; pass AsyncEngine.sync_engine for async"""
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
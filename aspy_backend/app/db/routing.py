@@ -0,0 +1,355 @@
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Set
+
+from fastapi import Depends, Request
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from jose import jwt, JWTError
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import operators, visitors
+from sqlalchemy.sql.dml import Delete, Insert, Update
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter
+
+from app.core.security import SECRET_KEY, ALGORITHM
+from app.db.session import SessionLocal, ReplicaSessionLocal, replica_engine, db_settings
+from app.models.user import User
+from app.models.subscription import Subscription
+from app.models.payment import Payment
+from app.models.invoice import Invoice
+
+# Writes to these rows make the owning user's next reads go to the primary
+READ_YOUR_WRITES_MODELS = (User, Subscription, Payment, Invoice)
+# Column naming a row's owner in each of their tables, for Core INSERT/UPDATE/DELETE
+OWNER_COLUMNS = {model.__tablename__: "id" if model is User else "user_id" for model in READ_YOUR_WRITES_MODELS}
+MAX_TRACKED_WRITERS = 100000
+
+# The marker above only lives in the worker that committed the write. The
+# response to a request that wrote the caller's billing data also carries a
+# signed, short-lived claim (cookie for browsers, header for other clients)
+# that any worker's get_read_db honours.
+READ_YOUR_WRITES_COOKIE = "read_your_writes"
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+# Users whose billing data the current request committed
+_request_writes: ContextVar[Optional[Set[int]]] = ContextVar("request_writes", default=None)
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_is_in_recovery() "
+    "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) "
+    "ELSE 0 END"
+)
+
+optional_bearer = HTTPBearer(auto_error=False)
+
+
+class ReadOnlySessionError(RuntimeError):
+    pass
+
+
+class ReadRouter:
+    """
+    Chooses the session for read-only requests: the replica when one is
+    configured, reachable and within the lag budget, unless the requesting
+    user wrote billing data recently, in which case the primary.
+    """
+
+    def __init__(self, replica_sessionmaker, primary_sessionmaker, replica_engine, settings):
+        self.replica_sessionmaker = replica_sessionmaker
+        self.primary_sessionmaker = primary_sessionmaker
+        self.replica_engine = replica_engine
+        self.max_lag_seconds = settings.replica_max_lag_seconds
+        self.health_check_seconds = settings.replica_health_check_seconds
+        self.read_your_writes_seconds = settings.read_your_writes_seconds
+
+        self._lock = threading.Lock()
+        self._recent_writers: Dict[int, float] = {}
+        self._replica_ok = False
+        self._replica_lag: Optional[float] = None
+        self._checked_at = 0.0
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.read_your_writes_hits = 0
+        self.fallbacks = 0
+
+    @property
+    def replica_configured(self) -> bool:
+        return self.replica_sessionmaker is not None
+
+    def note_write(self, user_id: int) -> None:
+        if not self.replica_configured or not self.read_your_writes_seconds:
+            return
+        with self._lock:
+            if len(self._recent_writers) >= MAX_TRACKED_WRITERS:
+                self._prune(time.monotonic())
+            self._recent_writers[user_id] = time.monotonic() + self.read_your_writes_seconds
+
+    def wrote_recently(self, user_id: Optional[int]) -> bool:
+        if user_id is None:
+            return False
+        with self._lock:
+            until = self._recent_writers.get(user_id)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._recent_writers[user_id]
+                return False
+            return True
+
+    def replica_available(self) -> bool:
+        """Cached health check: reachable and not lagging beyond the budget"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.health_check_seconds:
+                return self._replica_ok
+            # Claim this check so concurrent requests keep using the previous answer
+            self._checked_at = now
+
+        ok, lag = self._check_replica()
+        with self._lock:
+            if ok != self._replica_ok:
+                print(f"{'✅' if ok else '⚠️'} Read replica {'available' if ok else 'unavailable, reading from primary'} (lag: {lag})")
+            self._replica_ok = ok
+            self._replica_lag = lag
+        return ok
+
+    def session(self, user_id: Optional[int] = None, claimed_write: bool = False) -> Session:
+        """claimed_write: the caller showed a read-your-writes claim from another worker"""
+        use_replica = False
+        if self.replica_configured:
+            if claimed_write or self.wrote_recently(user_id):
+                with self._lock:
+                    self.read_your_writes_hits += 1
+            elif self.replica_available():
+                use_replica = True
+            else:
+                with self._lock:
+                    self.fallbacks += 1
+
+        with self._lock:
+            if use_replica:
+                self.replica_reads += 1
+            else:
+                self.primary_reads += 1
+
+        db = (self.replica_sessionmaker if use_replica else self.primary_sessionmaker)()
+        db.info["read_only"] = True
+        return db
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "replica_configured": self.replica_configured,
+                "replica_available": self._replica_ok if self.replica_configured else None,
+                "replica_lag_seconds": self._replica_lag,
+                "max_lag_seconds": self.max_lag_seconds,
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "read_your_writes_hits": self.read_your_writes_hits,
+                "fallbacks": self.fallbacks,
+                "tracked_writers": len(self._recent_writers),
+            }
+
+    def _check_replica(self):
+        try:
+            with self.replica_engine.connect() as conn:
+                if self.replica_engine.dialect.name == "postgresql":
+                    lag = float(conn.execute(REPLICA_LAG_SQL).scalar() or 0)
+                else:
+                    conn.execute(text("SELECT 1"))
+                    lag = 0.0
+            return lag <= self.max_lag_seconds, lag
+        except Exception as e:
+            print(f"Read replica health check failed: {str(e)}")
+            return False, None
+
+    def _prune(self, now: float) -> None:
+        expired = [user_id for user_id, until in self._recent_writers.items() if until < now]
+        for user_id in expired:
+            del self._recent_writers[user_id]
+        if len(self._recent_writers) >= MAX_TRACKED_WRITERS:
+            self._recent_writers.clear()
+
+
+read_router = ReadRouter(ReplicaSessionLocal, SessionLocal, replica_engine, db_settings)
+
+
+def _written_user_id(instance) -> Optional[int]:
+    if isinstance(instance, User):
+        return instance.id
+    return getattr(instance, "user_id", None)
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_written_users(session, flush_context, instances):
+    if session.info.get("read_only"):
+        raise ReadOnlySessionError("Attempted to write through a read-only (get_read_db) session")
+
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, READ_YOUR_WRITES_MODELS):
+            user_id = _written_user_id(instance)
+            if user_id is not None:
+                session.info.setdefault("written_user_ids", set()).add(int(user_id))
+
+
+def _remember_write(user_id: int) -> None:
+    read_router.note_write(user_id)
+    request_writes = _request_writes.get()
+    if request_writes is not None:
+        request_writes.add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_written_users(session):
+    for user_id in session.info.pop("written_user_ids", ()):
+        _remember_write(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written_users(session):
+    session.info.pop("written_user_ids", None)
+
+
+def _user_ids(values: Iterable) -> Set[int]:
+    user_ids = set()
+    for value in values:
+        if isinstance(value, (list, tuple, set, frozenset)):
+            user_ids |= _user_ids(value)
+        elif value is not None:
+            try:
+                user_ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return user_ids
+
+
+def _statement_user_ids(statement, owner_column: str, rows: list) -> Set[int]:
+    """
+    Owners of the rows a Core INSERT/UPDATE/DELETE writes: the owner column's
+    values for an INSERT, the "owner = x" / "owner IN (...)" terms of the
+    WHERE clause otherwise. Writes that can't be attributed are not tracked.
+    """
+    if isinstance(statement, Insert):
+        if not any(owner_column in row for row in rows):
+            # Values given with .values() instead of as execute() parameters
+            rows = [statement.compile().params]
+        return _user_ids(row.get(owner_column) for row in rows)
+
+    if statement.whereclause is None:
+        return set()
+    values = []
+    for node in visitors.iterate(statement.whereclause):
+        if (
+            isinstance(node, BinaryExpression)
+            and node.operator in (operators.eq, operators.in_op)
+            and getattr(node.left, "name", None) == owner_column
+            and isinstance(node.right, BindParameter)
+        ):
+            value = node.right.effective_value
+            if value is None:
+                value = [row.get(node.right.key) for row in rows]
+            values.append(value)
+    return _user_ids(values)
+
+
+@event.listens_for(Engine, "before_execute")
+def _collect_statement_writes(conn, clauseelement, multiparams, params, execution_options):
+    """
+    Core statements (bulk inserts, UPDATE ... WHERE) don't go through a flush;
+    record their owners on the connection and note them when it commits.
+    """
+    if not isinstance(clauseelement, (Insert, Update, Delete)):
+        return
+    owner_column = OWNER_COLUMNS.get(getattr(clauseelement.table, "name", None))
+    if owner_column is None:
+        return
+    rows = [row for row in list(multiparams) + [params] if isinstance(row, dict) and row]
+    user_ids = _statement_user_ids(clauseelement, owner_column, rows)
+    if user_ids:
+        conn.info.setdefault("written_user_ids", set()).update(user_ids)
+
+
+@event.listens_for(Engine, "commit")
+def _remember_statement_writes(conn):
+    for user_id in conn.info.pop("written_user_ids", ()):
+        _remember_write(user_id)
+
+
+@event.listens_for(Engine, "rollback")
+def _forget_statement_writes(conn):
+    conn.info.pop("written_user_ids", None)
+
+
+def _token_user_id(credentials: Optional[HTTPAuthorizationCredentials]) -> Optional[int]:
+    if not credentials:
+        return None
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        user_id = payload.get("user_id")
+        return int(user_id) if user_id is not None else None
+    except (JWTError, ValueError, TypeError):
+        return None
+
+
+def issue_write_claim(user_id: int, seconds: float) -> str:
+    """A token saying user_id wrote billing data; it has no "sub", so it can't authenticate"""
+    return jwt.encode({"read_your_writes": user_id, "exp": int(time.time() + seconds)}, SECRET_KEY, algorithm=ALGORITHM)
+
+
+def claimed_writer(claim: Optional[str]) -> Optional[int]:
+    """The user a read-your-writes claim was issued to, or None if it is missing, forged or expired"""
+    if not claim:
+        return None
+    try:
+        user_id = jwt.decode(claim, SECRET_KEY, algorithms=[ALGORITHM]).get("read_your_writes")
+        return int(user_id) if user_id is not None else None
+    except (JWTError, ValueError, TypeError):
+        return None
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    """Hand the caller a read-your-writes claim when the request committed their billing data"""
+    request_writes: Set[int] = set()
+    token = _request_writes.set(request_writes)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_writes.reset(token)
+
+    if request_writes and read_router.replica_configured and read_router.read_your_writes_seconds:
+        authorization = request.headers.get("authorization", "")
+        scheme, _, credentials = authorization.partition(" ")
+        user_id = _token_user_id(
+            HTTPAuthorizationCredentials(scheme=scheme, credentials=credentials)
+        ) if scheme.lower() == "bearer" and credentials else None
+        if user_id in request_writes:
+            seconds = read_router.read_your_writes_seconds
+            claim = issue_write_claim(user_id, seconds)
+            response.headers[READ_YOUR_WRITES_HEADER] = claim
+            response.set_cookie(
+                READ_YOUR_WRITES_COOKIE, claim, max_age=int(seconds) + 1,
+                httponly=True, secure=True, samesite="none"
+            )
+    return response
+
+
+def get_read_db(
+    request: Request,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer),
+):
+    """
+    Session for endpoints that only read. Served by the read replica when
+    healthy, by the primary otherwise or right after the caller changed
+    their billing data (on this worker, or on any worker when the request
+    carries the claim read_your_writes_middleware issued). Flushing through
+    it raises ReadOnlySessionError.
+    """
+    user_id = _token_user_id(credentials)
+    claim = request.headers.get(READ_YOUR_WRITES_HEADER) or request.cookies.get(READ_YOUR_WRITES_COOKIE)
+    claimed_write = user_id is not None and claimed_writer(claim) == user_id
+    db = read_router.session(user_id, claimed_write)
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,17 +1,124 @@
+from typing import Optional
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
-import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_engine(DATABASE_URL)
+from app.db.config import DatabaseSettings
+from app.db.pool import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    InstrumentedReplicaQueuePool,
+    async_pool_metrics,
+    instrument_pool,
+    pool_metrics,
+    replica_pool_metrics,
+)
+
+db_settings = DatabaseSettings()
+DATABASE_URL = db_settings.url
+
+# Async drivers for the schemes DATABASE_URL is written with
+ASYNC_DRIVERS = {
+    "postgres": "postgresql+asyncpg",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _is_memory_sqlite(url: str) -> bool:
+    return url in ("sqlite://", "sqlite:///:memory:")
+
+
+def _is_postgres(url: str) -> bool:
+    return url.startswith(("postgres", "postgresql"))
+
+
+def engine_options(settings: DatabaseSettings, url: Optional[str] = None, poolclass=InstrumentedQueuePool) -> dict:
+    url = url or settings.url
+    options = {
+        "pool_pre_ping": settings.pool_pre_ping,
+        "pool_recycle": settings.pool_recycle,
+    }
+    if _is_memory_sqlite(url):
+        # In-memory SQLite lives in a single connection; keep SQLAlchemy's default pool
+        return options
+
+    options.update(
+        poolclass=poolclass,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+    )
+    if _is_postgres(url) and settings.statement_timeout_ms:
+        options["connect_args"] = {"options": f"-c statement_timeout={settings.statement_timeout_ms}"}
+    return options
+
+
+def async_engine_args(settings: DatabaseSettings):
+    """The async URL and options for the same database, with the async pool's sizes"""
+    url = make_url(settings.url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+    options = {
+        "pool_pre_ping": settings.pool_pre_ping,
+        "pool_recycle": settings.pool_recycle,
+    }
+    if not _is_memory_sqlite(settings.url):
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=settings.effective_async_pool_size,
+            max_overflow=settings.effective_async_max_overflow,
+            pool_timeout=settings.pool_timeout,
+        )
+
+    if settings.is_postgres:
+        connect_args = {}
+        # asyncpg takes ssl as an argument rather than libpq's sslmode query parameter
+        sslmode = url.query.get("sslmode")
+        if sslmode:
+            url = url.difference_update_query(["sslmode"])
+            connect_args["ssl"] = sslmode
+        if settings.statement_timeout_ms:
+            connect_args["server_settings"] = {"statement_timeout": str(settings.statement_timeout_ms)}
+        if connect_args:
+            options["connect_args"] = connect_args
+    return url, options
+
+
+engine = create_engine(DATABASE_URL, **engine_options(db_settings))
+instrument_pool(engine, pool_metrics)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only endpoints go through app.db.routing.get_read_db, which picks this or the primary
+replica_engine = None
+ReplicaSessionLocal = None
+if db_settings.replica_url:
+    replica_engine = create_engine(
+        db_settings.replica_url,
+        **engine_options(db_settings, db_settings.replica_url, InstrumentedReplicaQueuePool)
+    )
+    instrument_pool(replica_engine, replica_pool_metrics)
+    ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+_async_url, _async_options = async_engine_args(db_settings)
+async_engine = create_async_engine(_async_url, **_async_options)
+instrument_pool(async_engine.sync_engine, async_pool_metrics)
+# expire_on_commit=False: attributes stay readable after commit without an implicit (sync) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
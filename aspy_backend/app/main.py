@@ -2,7 +2,16 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from app.core.pagination import NEXT_CURSOR_HEADER
 from app.api.v1 import auth, users, subscriptions, payments, webhooks, billing, execution, certificates, contact, admin
+from app.db.session import db_settings, async_engine
+from app.db.routing import READ_YOUR_WRITES_HEADER, read_your_writes_middleware
+from app.services.sandbox import sandbox_pool
+from app.services.passwords import password_hasher
+from app.services.translation import close_openai_client
+from app.services.oauth import close_oauth_client
+from app.services.admin_stats import admin_stats, ADMIN_STATS_REFRESHER_ENABLED
+from app.services.webhook_inbox import webhook_inbox, WEBHOOK_WORKER_ENABLED
 
 app = FastAPI(
     title="ASPY Backend",
@@ -24,6 +33,8 @@ default_origins = [
 ]
 env_origins = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.strip()]
 allowed_origins = list(dict.fromkeys(default_origins + env_origins))
+# Registered before CORS so CORS stays outermost and answers preflights itself
+app.middleware("http")(read_your_writes_middleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -38,8 +49,10 @@ app.add_middleware(
         "Access-Control-Allow-Headers",
         "Access-Control-Request-Method",
         "Access-Control-Request-Headers",
+        READ_YOUR_WRITES_HEADER,
     ],
-    expose_headers=["*"],
+    # The wildcard is ignored for credentialed requests, so list headers clients must read
+    expose_headers=["*", NEXT_CURSOR_HEADER, READ_YOUR_WRITES_HEADER],
     max_age=600,
 )
 
@@ -54,6 +67,55 @@ app.include_router(certificates.router, prefix="/api/v1")
 app.include_router(contact.router, prefix="/api/v1")
 app.include_router(admin.router, prefix="/api/v1")
 
+@app.on_event("startup")
+def log_database_pool():
+    config = db_settings.describe()
+    print(
+        f"🗄️ Database pool: {config['pool_size']} + {config['max_overflow']} overflow per worker "
+        f"(async {config['async_pool_size']} + {config['async_max_overflow']}), "
+        f"{config['total_connections']} across {config['web_concurrency']} workers"
+    )
+
+@app.on_event("startup")
+def start_sandbox_pool():
+    # Warm the code execution workers before the first request arrives
+    sandbox_pool.start()
+
+@app.on_event("startup")
+def start_admin_stats_refresher():
+    if ADMIN_STATS_REFRESHER_ENABLED:
+        admin_stats.start()
+
+@app.on_event("startup")
+def start_webhook_inbox():
+    if WEBHOOK_WORKER_ENABLED:
+        webhook_inbox.start()
+
+@app.on_event("shutdown")
+def stop_sandbox_pool():
+    sandbox_pool.shutdown()
+
+@app.on_event("shutdown")
+def stop_admin_stats_refresher():
+    admin_stats.stop()
+
+@app.on_event("shutdown")
+def stop_webhook_inbox():
+    webhook_inbox.stop()
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    await close_openai_client()
+    await close_oauth_client()
+
+@app.on_event("shutdown")
+async def close_async_engine():
+    await async_engine.dispose()
+
 @app.get("/")
 def root():
     return {"message": "DesiCodes Backend API", "status": "running"}
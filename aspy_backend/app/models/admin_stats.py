@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, Numeric, DateTime
+from app.db.base import Base
+
+class AdminStatsSnapshot(Base):
+    __tablename__ = "admin_stats_snapshots"
+
+    # Single row (id=1), rewritten by app.services.admin_stats
+    id = Column(Integer, primary_key=True)
+    total_users = Column(Integer, nullable=False, default=0)
+    total_admins = Column(Integer, nullable=False, default=0)
+    active_subscriptions = Column(Integer, nullable=False, default=0)
+    total_revenue = Column(Numeric(12, 2), nullable=False, default=0)
+    total_executions = Column(Integer, nullable=False, default=0)
+    total_languages = Column(Integer, nullable=False, default=0)
+    generated_at = Column(DateTime, nullable=False)
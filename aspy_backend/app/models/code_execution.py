@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
 
 class CodeExecution(Base):
     __tablename__ = "code_executions"
+    __table_args__ = (
+        # Per-user history and certificates: languages used and first use of each
+        Index("ix_code_executions_user_id_language_id_created_at", "user_id", "language_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -1,10 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Numeric, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base import Base
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        # Invoice listings, newest first per user
+        Index("ix_invoices_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -13,7 +17,7 @@ class Invoice(Base):
     amount = Column(Numeric(10, 2))
     currency = Column(String, default="USD")
     status = Column(String, default="pending")
-    razorpay_order_id = Column(String, nullable=True)
+    razorpay_order_id = Column(String, nullable=True, index=True)
     invoice_url = Column(String(500), nullable=True)  # Razorpay invoice download URL
     plan_id = Column(Integer, ForeignKey("plans.id"), nullable=True)
     created_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class TranslationCacheEntry(Base):
+    __tablename__ = "translation_cache"
+
+    # sha256 of (prompt version, model, normalized language, normalized code)
+    cache_key = Column(String(64), primary_key=True)
+    language = Column(String)
+    prompt_version = Column(String(20))
+    python_code = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from app.db.base import Base
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    __table_args__ = (
+        # Provider retries of the same event are acknowledged without a second row
+        UniqueConstraint("provider", "event_id", name="uq_webhook_events_provider_event_id"),
+        # The worker's scan for due events, oldest first
+        Index("ix_webhook_events_status_next_attempt_at", "status", "next_attempt_at"),
+        # Earlier unfinished events for the same subscription block later ones
+        Index("ix_webhook_events_ordering_key_id", "ordering_key", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(20), nullable=False, default="razorpay")
+    event_id = Column(String(100), nullable=False)  # x-razorpay-event-id
+    event_type = Column(String(100), nullable=False)
+    ordering_key = Column(String(100), nullable=True)  # e.g. "subscription:sub_xxx"
+    payload = Column(Text, nullable=False)  # raw, signature-verified request body
+    status = Column(String(20), nullable=False, default="pending")  # pending, processing, processed, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False)
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    received_at = Column(DateTime, server_default=func.now())
+    processed_at = Column(DateTime, nullable=True)
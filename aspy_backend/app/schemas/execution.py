@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, Field
 
 class CodeRunRequest(BaseModel):
     language: str
@@ -6,3 +7,11 @@ class CodeRunRequest(BaseModel):
 
 class CodeRunResponse(BaseModel):
     output: str
+
+class BatchCodeRunRequest(BaseModel):
+    # A course page's examples, run in one round trip
+    snippets: List[CodeRunRequest] = Field(min_length=1, max_length=50)
+
+class BatchCodeRunResponse(BaseModel):
+    # One result per snippet, in request order
+    results: List[CodeRunResponse]
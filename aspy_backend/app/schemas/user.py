@@ -31,4 +31,5 @@ class UserResponse(BaseModel):
 
 class UserProfileUpdate(BaseModel):
     username: str
-    email: EmailStr
\ No newline at end of file
+    email: EmailStr
+    password: Optional[str] = None
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.session import SessionLocal
+from app.models.admin_stats import AdminStatsSnapshot
+from app.models.language import Language
+from app.models.payment import Payment, PaymentStatus
+from app.models.subscription import Subscription, SubscriptionStatus
+from app.models.user import User, UserType
+
+# How often each worker recomputes the snapshot in the background
+ADMIN_STATS_REFRESH_SECONDS = int(os.getenv("ADMIN_STATS_REFRESH_SECONDS", "60"))
+# A snapshot older than this is recomputed inline (e.g. when the refresher is disabled)
+ADMIN_STATS_MAX_AGE_SECONDS = int(os.getenv("ADMIN_STATS_MAX_AGE_SECONDS", "300"))
+# How long a worker serves the snapshot from memory before re-reading the table
+ADMIN_STATS_CACHE_SECONDS = int(os.getenv("ADMIN_STATS_CACHE_SECONDS", "10"))
+ADMIN_STATS_REFRESHER_ENABLED = os.getenv("ADMIN_STATS_REFRESHER", "true").lower() in ("1", "true", "yes")
+
+SNAPSHOT_ID = 1
+
+
+def compute_dashboard_stats(db: Session) -> dict:
+    """Run the aggregate queries behind the admin dashboard"""
+    users = db.query(
+        func.coalesce(func.sum(case((User.user_type == UserType.USER, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((User.user_type == UserType.ADMIN, 1), else_=0)), 0),
+        # The per-user counter avoids a COUNT(*) over code_executions
+        func.coalesce(func.sum(User.execution_count), 0)
+    ).one()
+
+    active_subscriptions = db.query(func.count(Subscription.id)).filter(
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).scalar()
+
+    # Calculate total revenue from completed payments
+    total_revenue = db.query(func.sum(Payment.amount)).filter(
+        Payment.status == PaymentStatus.COMPLETED
+    ).scalar() or 0.0
+
+    total_languages = db.query(func.count(Language.id)).scalar()
+
+    return {
+        "total_users": int(users[0]),
+        "total_admins": int(users[1]),
+        "active_subscriptions": active_subscriptions or 0,
+        "total_revenue": float(total_revenue),
+        "total_executions": int(users[2]),
+        "total_languages": total_languages or 0,
+    }
+
+
+def _snapshot_to_dict(snapshot: AdminStatsSnapshot) -> dict:
+    return {
+        "total_users": snapshot.total_users,
+        "total_admins": snapshot.total_admins,
+        "active_subscriptions": snapshot.active_subscriptions,
+        "total_revenue": float(snapshot.total_revenue),
+        "total_executions": snapshot.total_executions,
+        "total_languages": snapshot.total_languages,
+        "generated_at": snapshot.generated_at,
+    }
+
+
+def refresh_snapshot(db: Session) -> dict:
+    """Recompute the dashboard stats and store them as the current snapshot"""
+    stats = compute_dashboard_stats(db)
+    try:
+        snapshot = db.merge(AdminStatsSnapshot(id=SNAPSHOT_ID, generated_at=datetime.utcnow(), **stats))
+        db.commit()
+    except IntegrityError:
+        # Another worker created the row first; update it instead
+        db.rollback()
+        snapshot = db.merge(AdminStatsSnapshot(id=SNAPSHOT_ID, generated_at=datetime.utcnow(), **stats))
+        db.commit()
+    return _snapshot_to_dict(snapshot)
+
+
+class AdminStatsService:
+    """
+    Serves the admin dashboard from the `admin_stats_snapshots` row, kept
+    current by a background thread in each worker. Reads are a cached
+    primary-key lookup, so /admin/stats no longer scales with table sizes.
+    """
+
+    def __init__(self, refresh_seconds: int, max_age_seconds: int, cache_seconds: int):
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.cache_seconds = cache_seconds
+        self._cached: Optional[dict] = None
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self, db: Session, refresh: bool = False) -> dict:
+        if not refresh:
+            with self._lock:
+                if self._cached is not None and time.monotonic() - self._cached_at < self.cache_seconds:
+                    return self._cached
+
+            snapshot = db.get(AdminStatsSnapshot, SNAPSHOT_ID)
+            if snapshot is not None and datetime.utcnow() - snapshot.generated_at < timedelta(seconds=self.max_age_seconds):
+                return self._remember(_snapshot_to_dict(snapshot))
+
+        return self._remember(refresh_snapshot(db))
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="admin-stats-refresher", daemon=True)
+        self._thread.start()
+        print(f"📊 Admin stats refresher started (every {self.refresh_seconds}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _remember(self, stats: dict) -> dict:
+        with self._lock:
+            self._cached = stats
+            self._cached_at = time.monotonic()
+        return stats
+
+    def _run(self) -> None:
+        while True:
+            db = SessionLocal()
+            try:
+                self._remember(refresh_snapshot(db))
+            except Exception as e:
+                db.rollback()
+                print(f"Admin stats refresh failed: {str(e)}")
+            finally:
+                db.close()
+            if self._stop.wait(self.refresh_seconds):
+                return
+
+
+admin_stats = AdminStatsService(
+    refresh_seconds=ADMIN_STATS_REFRESH_SECONDS,
+    max_age_seconds=ADMIN_STATS_MAX_AGE_SECONDS,
+    cache_seconds=ADMIN_STATS_CACHE_SECONDS
+)
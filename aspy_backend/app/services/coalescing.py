@@ -0,0 +1,119 @@
+"""
+Single-flight request coalescing.
+
+When many requests need the same expensive result at the same time (a
+classroom pressing Run on the same snippet), only the first one computes it;
+the others await its future. A result is shared only while it is in flight;
+caching it afterwards is up to the caller.
+"""
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _LeaderGone(Exception):
+    """The computing request was cancelled; a waiter takes over"""
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0, "leader_failures": 0, "max_waiters": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Return fn()'s result, sharing one call among concurrent callers with the same key"""
+        joined, result = await self.join(key)
+        if joined:
+            return result
+        return await self._lead(key, fn)
+
+    async def join(self, key: str) -> Tuple[bool, Any]:
+        """
+        (True, result) once the in-flight call for key finishes, or (False, None)
+        if there is none. Raises the call's exception if it failed.
+        """
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                return False, None
+            try:
+                return True, await self.wait(key, future)
+            except _LeaderGone:
+                continue
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    async def wait(self, key: str, future: asyncio.Future) -> Any:
+        """Await another caller's in-flight result; raises its exception if it failed"""
+        with self._lock:
+            waiters = self._waiters.get(key, 0) + 1
+            self._waiters[key] = waiters
+            self._counters["coalesced"] += 1
+            self._counters["max_waiters"] = max(self._counters["max_waiters"], waiters)
+        try:
+            # Shielded so a waiter that goes away doesn't cancel everyone's result
+            return await asyncio.shield(future)
+        finally:
+            with self._lock:
+                remaining = self._waiters.get(key, 1) - 1
+                if remaining > 0:
+                    self._waiters[key] = remaining
+                else:
+                    self._waiters.pop(key, None)
+
+    def lead(self, key: str) -> asyncio.Future:
+        """Register the caller as the one computing key; finish with resolve() or reject()"""
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        with self._lock:
+            self._counters["leaders"] += 1
+        return future
+
+    def resolve(self, key: str, future: asyncio.Future, result: Any) -> None:
+        self._finish(key, future)
+        if not future.done():
+            future.set_result(result)
+
+    def reject(self, key: str, future: asyncio.Future, error: BaseException) -> None:
+        self._finish(key, future)
+        with self._lock:
+            self._counters["leader_failures"] += 1
+        if future.done():
+            return
+        if isinstance(error, (asyncio.CancelledError, GeneratorExit)):
+            # The leader's client went away; that is no reason to fail the waiters
+            error = _LeaderGone()
+        future.set_exception(error)
+        # Mark it retrieved: with no waiters nobody else will
+        future.exception()
+
+    def stats(self, top: int = 10) -> dict:
+        with self._lock:
+            waiting = sorted(self._waiters.items(), key=lambda item: item[1], reverse=True)
+            return {
+                "in_flight": len(self._calls),
+                "waiting": sum(self._waiters.values()),
+                # Keys are hashes; the prefix is enough to tell hot keys apart
+                "top_keys": [{"key": key[:12], "waiters": count} for key, count in waiting[:top]],
+                **self._counters,
+            }
+
+    async def _lead(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        future = self.lead(key)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self.reject(key, future, e)
+            raise
+        self.resolve(key, future, result)
+        return result
+
+    def _finish(self, key: str, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
@@ -0,0 +1,181 @@
+"""
+Validation and compilation of generated programs before they run.
+
+Each program is parsed once and the policy is checked on the AST's nodes:
+imports must come from ALLOWED_MODULES, the builtins that run or load code
+are refused however they are referenced ("f = eval"), and dunders, the usual
+way from an object to builtins, may not be named as attributes, names or
+attribute-name strings. This is a filter for generated code, not a sandbox:
+a program that computes an attribute name at runtime still gets past it, and
+the sandbox's process limits are what contain it. Accepted programs are compiled, and the
+code object is marshalled so it can be sent to the sandbox workers as is.
+Verdicts and compiled code are cached by source hash, so a repeated program
+skips parsing, checking and compiling.
+"""
+import ast
+import hashlib
+import marshal
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Union
+
+from app.services.execution_cache import DETERMINISTIC_MODULES, DUNDER_STRING_PATTERN, is_deterministic_tree
+
+COMPILED_PROGRAM_CACHE_MAX_ENTRIES = int(os.getenv("COMPILED_PROGRAM_CACHE_MAX_ENTRIES", "5000"))
+COMPILED_PROGRAM_CACHE_MAX_BYTES = int(os.getenv("COMPILED_PROGRAM_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+SECURITY_ERROR = "Security Error: usage of restricted modules/functions"
+
+# Modules that evaluate strings as code (typing.get_type_hints() and ForwardRef
+# eval string annotations); never allowed, whatever else lists them
+STRING_EVALUATING_MODULES = frozenset({"typing", "typing_extensions", "annotationlib"})
+# Everything else is refused, including modules that reach the OS indirectly
+# (io.open, timeit.timeit("import os; ..."))
+ALLOWED_MODULES = (
+    DETERMINISTIC_MODULES | frozenset({"__future__", "calendar", "datetime", "random", "time"})
+) - STRING_EVALUATING_MODULES
+BANNED_BUILTINS = frozenset({
+    "__import__", "open", "exec", "eval", "compile", "breakpoint", "globals", "locals", "vars",
+})
+# Dunders are how sandbox escapes reach builtins ("().__class__.__bases__..."); names
+# that only start with "__" (self.__balance) are private, not dunders
+ALLOWED_DUNDER_ATTRIBUTES = frozenset({"__init__", "__name__", "__doc__"})
+ALLOWED_DUNDER_NAMES = frozenset({"__name__", "__doc__"})
+ALLOWED_DUNDER_STRINGS = ALLOWED_DUNDER_ATTRIBUTES | {"__main__"}
+
+
+def is_dunder(name: str) -> bool:
+    return len(name) > 4 and name.startswith("__") and name.endswith("__")
+
+
+def _annotations(node: ast.AST) -> list:
+    if isinstance(node, ast.arg):
+        return [node.annotation]
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return [node.returns]
+    if isinstance(node, ast.AnnAssign):
+        return [node.annotation]
+    return []
+
+
+def policy_violation(tree: ast.AST) -> Optional[str]:
+    """The reason tree breaks the import/builtin policy, or None if it doesn't"""
+    for node in ast.walk(tree):
+        # String annotations are evaluated by allowed modules too
+        # (functools.singledispatch's register() calls get_type_hints())
+        for annotation in _annotations(node):
+            if annotation is not None and any(
+                isinstance(part, ast.Constant) and isinstance(part.value, str) for part in ast.walk(annotation)
+            ):
+                return SECURITY_ERROR
+
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""] if not node.level else [""]
+        else:
+            modules = ()
+        if any(module.split(".")[0] not in ALLOWED_MODULES for module in modules):
+            return SECURITY_ERROR
+
+        if isinstance(node, ast.Name) and (
+            node.id in BANNED_BUILTINS or (is_dunder(node.id) and node.id not in ALLOWED_DUNDER_NAMES)
+        ):
+            return SECURITY_ERROR
+        if isinstance(node, ast.Attribute) and is_dunder(node.attr) and node.attr not in ALLOWED_DUNDER_ATTRIBUTES:
+            return SECURITY_ERROR
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and any(
+            name not in ALLOWED_DUNDER_STRINGS for name in DUNDER_STRING_PATTERN.findall(node.value)
+        ):
+            return SECURITY_ERROR
+    return None
+
+
+@dataclass(frozen=True)
+class CompiledProgram:
+    # A marshalled code object, or the source when it doesn't compile (the
+    # sandbox then reports the SyntaxError exactly as before)
+    payload: Union[bytes, str]
+    # Set when the program breaks the policy; it must not be run
+    error: Optional[str] = None
+    # See app.services.execution_cache; computed from the same parse
+    deterministic: bool = False
+
+    @property
+    def size(self) -> int:
+        return len(self.payload) + len(self.error or "")
+
+
+def compile_program(code: str) -> CompiledProgram:
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        # Fails the same way on every run
+        return CompiledProgram(payload=code, deterministic=True)
+
+    error = policy_violation(tree)
+    if error:
+        return CompiledProgram(payload=b"", error=error)
+    return CompiledProgram(
+        payload=marshal.dumps(compile(tree, "<string>", "exec")),
+        deterministic=is_deterministic_tree(tree)
+    )
+
+
+class CompiledProgramCache:
+    """In-process LRU of compile_program() results keyed by source hash, bounded by entries and bytes"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, CompiledProgram]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "rejected": 0, "evictions": 0}
+
+    def get(self, code: str) -> CompiledProgram:
+        key = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        with self._lock:
+            program = self._entries.get(key)
+            if program is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+                if program.error:
+                    self._counters["rejected"] += 1
+                return program
+            self._counters["misses"] += 1
+
+        program = compile_program(code)
+        with self._lock:
+            if program.error:
+                self._counters["rejected"] += 1
+            if not self.max_entries or program.size > self.max_bytes:
+                return program
+            if key not in self._entries:
+                self._entries[key] = program
+                self._bytes += program.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.size
+                self._counters["evictions"] += 1
+        return program
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                **self._counters,
+            }
+
+
+compiled_programs = CompiledProgramCache(COMPILED_PROGRAM_CACHE_MAX_ENTRIES, COMPILED_PROGRAM_CACHE_MAX_BYTES)
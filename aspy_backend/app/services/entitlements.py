@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus
+
+# Runs allowed on free (price == 0) plans and for users without a plan; paid plans are unlimited
+FREE_EXECUTION_LIMIT = int(os.getenv("FREE_EXECUTION_LIMIT", "2"))
+ENTITLEMENT_CACHE_TTL_SECONDS = int(os.getenv("ENTITLEMENT_CACHE_TTL_SECONDS", "60"))
+ENTITLEMENT_CACHE_MAX_ENTRIES = int(os.getenv("ENTITLEMENT_CACHE_MAX_ENTRIES", "50000"))
+# Billing period started by a verified checkout or a captured payment
+PAID_PLAN_PERIOD = timedelta(days=30)
+
+
+@dataclass(frozen=True)
+class UserEntitlements:
+    """A user's effective plan, resolved from their active subscription"""
+    user_id: int
+    subscription_id: Optional[int] = None
+    plan_id: Optional[int] = None
+    plan_name: Optional[str] = None
+    plan_type: Optional[PlanType] = None
+    price: int = 0
+    current_period_end: Optional[datetime] = None
+    features: Dict = field(default_factory=dict)
+
+    @property
+    def has_active_subscription(self) -> bool:
+        return self.subscription_id is not None
+
+    @property
+    def is_paid(self) -> bool:
+        return self.plan_type == PlanType.PRO or self.price > 0
+
+    @property
+    def execution_limit(self) -> Optional[int]:
+        """None means unlimited"""
+        return None if self.is_paid else FREE_EXECUTION_LIMIT
+
+    @property
+    def can_access_certificates(self) -> bool:
+        return self.is_paid
+
+
+def _parse_features(features) -> Dict:
+    # Seed scripts store features as a JSON string, newer rows as JSON
+    if isinstance(features, str):
+        try:
+            return json.loads(features)
+        except ValueError:
+            return {}
+    return features or {}
+
+
+class EntitlementResolver:
+    """
+    Resolves entitlements with one subscription+plan join and caches them per
+    user. Call invalidate(user_id) after any subscription or payment write;
+    the TTL bounds staleness across workers.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[int, Tuple[float, UserEntitlements]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, db: Session, user_id: int, fresh: bool = False) -> UserEntitlements:
+        if not fresh:
+            cached = self._get_cached(user_id)
+            if cached is not None:
+                return cached
+
+        row = db.execute(self._active_plan_query(user_id)).first()
+        return self._store(user_id, row)
+
+    async def resolve_async(self, db: AsyncSession, user_id: int, fresh: bool = False) -> UserEntitlements:
+        if not fresh:
+            cached = self._get_cached(user_id)
+            if cached is not None:
+                return cached
+
+        row = (await db.execute(self._active_plan_query(user_id))).first()
+        return self._store(user_id, row)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    @staticmethod
+    def _active_plan_query(user_id: int):
+        return select(
+            Subscription.id,
+            Subscription.current_period_end,
+            Plan.id,
+            Plan.name,
+            Plan.type,
+            Plan.price,
+            Plan.features
+        ).join(Plan, Subscription.plan_id == Plan.id).where(
+            Subscription.user_id == user_id,
+            Subscription.status == SubscriptionStatus.ACTIVE
+        ).order_by(Subscription.id.desc()).limit(1)
+
+    def _store(self, user_id: int, row) -> UserEntitlements:
+        if row:
+            resolved = UserEntitlements(
+                user_id=user_id,
+                subscription_id=row[0],
+                current_period_end=row[1],
+                plan_id=row[2],
+                plan_name=row[3],
+                plan_type=row[4],
+                price=row[5] or 0,
+                features=_parse_features(row[6])
+            )
+        else:
+            resolved = UserEntitlements(user_id=user_id)
+
+        self._put(user_id, resolved)
+        return resolved
+
+    def _get_cached(self, user_id: int) -> Optional[UserEntitlements]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _put(self, user_id: int, resolved: UserEntitlements) -> None:
+        with self._lock:
+            if len(self._entries) >= self.max_entries and user_id not in self._entries:
+                # Drop the oldest entry; dicts keep insertion order
+                self._entries.pop(next(iter(self._entries)))
+            self._entries.pop(user_id, None)
+            self._entries[user_id] = (time.monotonic(), resolved)
+
+
+entitlements = EntitlementResolver(ENTITLEMENT_CACHE_TTL_SECONDS, ENTITLEMENT_CACHE_MAX_ENTRIES)
+
+
+def get_user_entitlements(db: Session, user_id: int, fresh: bool = False) -> UserEntitlements:
+    return entitlements.resolve(db, user_id, fresh=fresh)
+
+
+async def get_user_entitlements_async(db: AsyncSession, user_id: int, fresh: bool = False) -> UserEntitlements:
+    return await entitlements.resolve_async(db, user_id, fresh=fresh)
+
+
+def get_active_subscription(db: Session, user_id: int) -> Optional[Subscription]:
+    """
+    Load the user's active Subscription row for endpoints that need to read
+    or modify it, using the cached entitlement for a primary-key lookup.
+    """
+    plan = entitlements.resolve(db, user_id)
+    if not plan.has_active_subscription:
+        # A cached "no subscription" may predate a purchase on another worker
+        plan = entitlements.resolve(db, user_id, fresh=True)
+        if not plan.has_active_subscription:
+            return None
+
+    subscription = db.get(Subscription, plan.subscription_id)
+    if subscription is None or subscription.status != SubscriptionStatus.ACTIVE:
+        plan = entitlements.resolve(db, user_id, fresh=True)
+        subscription = db.get(Subscription, plan.subscription_id) if plan.has_active_subscription else None
+    return subscription
+
+
+def activate_paid_plan(db: Session, user_id: int, plan_id: int,
+                       razorpay_subscription_id: Optional[str] = None) -> Subscription:
+    """
+    Put the user on plan_id for one PAID_PLAN_PERIOD starting now. Shared by
+    /payments/razorpay/verify and the payment.captured webhook, whichever
+    arrives first. The user's current subscription (the active one, else the
+    latest) is updated in place, so an upgrade replaces the FREE plan rather
+    than adding a second active subscription. Callers commit and invalidate.
+    """
+    subscription = db.query(Subscription).filter(
+        Subscription.user_id == user_id
+    ).order_by(
+        (Subscription.status == SubscriptionStatus.ACTIVE).desc(),
+        Subscription.id.desc()
+    ).first()
+
+    now = datetime.utcnow()
+    if subscription is None:
+        subscription = Subscription(user_id=user_id, created_at=now)
+        db.add(subscription)
+
+    subscription.plan_id = plan_id
+    subscription.status = SubscriptionStatus.ACTIVE
+    subscription.current_period_start = now
+    subscription.current_period_end = now + PAID_PLAN_PERIOD
+    if razorpay_subscription_id:
+        subscription.razorpay_subscription_id = razorpay_subscription_id
+    db.flush()
+    return subscription
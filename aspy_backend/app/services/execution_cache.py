@@ -0,0 +1,219 @@
+"""
+Memoized results for deterministic generated programs.
+
+The same tutorial snippet translates to the same Python every time, and most
+of those programs print the same thing on every run. Such programs are run
+once; later runs return the stored stdout/stderr without touching the
+sandbox. A result is admitted only when:
+
+- the program is deterministic according to an AST check: it imports
+  only pure standard modules and uses no builtins or constructs whose result
+  varies between runs or processes (input, id, hash, sets of strings, dunders)
+  and doesn't patch imported modules (math.pi = 3)
+- the run finished on its own (ok or a Python exception, not a time/CPU/memory limit)
+- the run was isolated: a fresh process that no earlier job could have altered
+- the output contains no memory addresses (default reprs like "<Foo object at 0x...>")
+"""
+import ast
+import hashlib
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from app.services.sandbox import (
+    SandboxResult, STATUS_OK, STATUS_ERROR,
+    SANDBOX_CPU_SECONDS, SANDBOX_MEMORY_MB, SANDBOX_MAX_OUTPUT_BYTES,
+)
+
+EXECUTION_CACHE_MAX_ENTRIES = int(os.getenv("EXECUTION_CACHE_MAX_ENTRIES", "5000"))
+EXECUTION_CACHE_MAX_BYTES = int(os.getenv("EXECUTION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Bump when the sandbox changes in a way that can change a program's output
+SANDBOX_RUNTIME_VERSION = "1"
+
+# Modules whose functions return the same thing for the same input
+DETERMINISTIC_MODULES = frozenset({
+    "abc", "array", "bisect", "cmath", "collections", "copy", "dataclasses", "decimal",
+    "enum", "fractions", "functools", "heapq", "itertools", "json", "math", "numbers",
+    "operator", "pprint", "re", "statistics", "string", "textwrap",
+})
+
+# Builtins that read the outside world or expose per-process state
+NONDETERMINISTIC_BUILTINS = frozenset({
+    "input", "open", "id", "hash", "vars", "dir", "globals", "locals",
+    "set", "frozenset", "breakpoint", "help", "memoryview", "__import__",
+    "eval", "exec", "compile", "getattr", "setattr", "delattr",
+})
+
+MEMORY_ADDRESS_PATTERN = re.compile(r"\bat 0x[0-9a-fA-F]+")
+# A dunder anywhere in a string: getattr(x, "__class__"), "{0.__class__}".format(x), or
+# code that gets evaluated ("[__import__('os')...]" as an annotation). Needs a letter or
+# digit, so "____" separator lines don't count.
+DUNDER_STRING_PATTERN = re.compile(r"__\w*[^\W_]\w*__")
+
+
+def is_deterministic(code: str) -> bool:
+    """True if every run of code should print the same output"""
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        # Fails the same way every time
+        return True
+    return is_deterministic_tree(tree)
+
+
+def is_deterministic_tree(tree: ast.AST) -> bool:
+    imported = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if isinstance(node, ast.ImportFrom):
+                names = [node.module or ""]
+            else:
+                names = [alias.name for alias in node.names]
+            if any(name.split(".")[0] not in DETERMINISTIC_MODULES for name in names):
+                return False
+            imported.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.Name) and node.id in NONDETERMINISTIC_BUILTINS | {"__builtins__"}:
+            return False
+        elif isinstance(node, ast.Attribute) and node.attr.startswith("__"):
+            return False
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str) and any(
+            name != "__main__" for name in DUNDER_STRING_PATTERN.findall(node.value)
+        ):
+            return False
+        elif isinstance(node, (ast.Set, ast.SetComp, ast.Await, ast.AsyncFor, ast.AsyncWith)):
+            # Set iteration order depends on the per-process string hash seed
+            return False
+
+    # Patching a module ("math.pi = 3") changes what it returns to everyone
+    # sharing the interpreter; such programs are never cached
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Delete)):
+            targets = node.targets if isinstance(node, (ast.Assign, ast.Delete)) else [node.target]
+            if any(_assigns_into(target, imported) for target in targets):
+                return False
+    return True
+
+
+def _assigns_into(target: ast.AST, names: set) -> bool:
+    """True if target sets an attribute or item reached from one of names"""
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return any(_assigns_into(element, names) for element in target.elts)
+    if isinstance(target, ast.Starred):
+        return _assigns_into(target.value, names)
+    if not isinstance(target, (ast.Attribute, ast.Subscript)):
+        return False
+    while isinstance(target, (ast.Attribute, ast.Subscript)):
+        target = target.value
+    return isinstance(target, ast.Name) and target.id in names
+
+
+def execution_cache_key(code: str) -> str:
+    raw = "\0".join([
+        SANDBOX_RUNTIME_VERSION,
+        sys.version,
+        str(SANDBOX_CPU_SECONDS),
+        str(SANDBOX_MEMORY_MB),
+        str(SANDBOX_MAX_OUTPUT_BYTES),
+        code,
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ExecutionResultCache:
+    """
+    In-process LRU of sandbox results for deterministic programs, bounded by
+    entry count and by bytes. Call get() before running a program and
+    offer() with its result afterwards; offer() decides admission.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, SandboxResult]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, "misses": 0, "admitted": 0, "evictions": 0,
+            "rejected_nondeterministic": 0, "rejected_status": 0, "rejected_output": 0,
+            "rejected_unisolated": 0,
+        }
+
+    @staticmethod
+    def _entry_size(key: str, result: SandboxResult) -> int:
+        return len(key) + len(result.stdout.encode("utf-8")) + len(result.stderr.encode("utf-8"))
+
+    def get(self, code: str) -> Optional[SandboxResult]:
+        if not self.max_entries:
+            return None
+        key = execution_cache_key(code)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self._counters["hits"] += 1
+            else:
+                self._counters["misses"] += 1
+            return result
+
+    def offer(self, code: str, result: SandboxResult, deterministic: Optional[bool] = None) -> bool:
+        """
+        Store result if the program and its run qualify; returns whether it was
+        stored. Pass deterministic when the caller has already classified code.
+        """
+        if not self.max_entries:
+            return False
+        if result.status not in (STATUS_OK, STATUS_ERROR):
+            return self._reject("rejected_status")
+        if not result.isolated:
+            return self._reject("rejected_unisolated")
+        if MEMORY_ADDRESS_PATTERN.search(result.stdout) or MEMORY_ADDRESS_PATTERN.search(result.stderr):
+            return self._reject("rejected_output")
+        if not (is_deterministic(code) if deterministic is None else deterministic):
+            return self._reject("rejected_nondeterministic")
+
+        key = execution_cache_key(code)
+        size = self._entry_size(key, result)
+        if size > self.max_bytes:
+            return self._reject("rejected_output")
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._entry_size(key, previous)
+            self._entries[key] = result
+            self._bytes += size
+            self._counters["admitted"] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                old_key, old_result = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_result)
+                self._counters["evictions"] += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hit_rate": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+                **self._counters,
+            }
+
+    def _reject(self, counter: str) -> bool:
+        with self._lock:
+            self._counters[counter] += 1
+        return False
+
+
+execution_cache = ExecutionResultCache(EXECUTION_CACHE_MAX_ENTRIES, EXECUTION_CACHE_MAX_BYTES)
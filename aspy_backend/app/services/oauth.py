@@ -0,0 +1,279 @@
+"""
+Social login provider clients (Google, GitHub, Apple).
+
+All provider calls share one keep-alive httpx.AsyncClient with explicit
+timeouts, so a slow provider fails the request instead of hanging it, and
+repeat logins reuse open TLS connections.
+"""
+import asyncio
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import httpx
+from jose import jwk, jwt
+from jose.backends.base import Key
+
+GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
+GITHUB_TOKEN_URL = "https://github.com/login/oauth/access_token"
+GITHUB_USER_URL = "https://api.github.com/user"
+GITHUB_EMAILS_URL = "https://api.github.com/user/emails"
+APPLE_KEYS_URL = "https://appleid.apple.com/auth/keys"
+APPLE_ISSUER = "https://appleid.apple.com"
+
+OAUTH_TIMEOUT_SECONDS = float(os.getenv("OAUTH_TIMEOUT_SECONDS", "10"))
+OAUTH_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OAUTH_CONNECT_TIMEOUT_SECONDS", "5"))
+OAUTH_MAX_CONNECTIONS = int(os.getenv("OAUTH_MAX_CONNECTIONS", "50"))
+# Used when Apple's response has no Cache-Control max-age
+APPLE_JWKS_DEFAULT_TTL_SECONDS = int(os.getenv("APPLE_JWKS_DEFAULT_TTL_SECONDS", "3600"))
+# Tokens with an unknown kid trigger a refetch at most this often
+APPLE_JWKS_MIN_REFETCH_SECONDS = int(os.getenv("APPLE_JWKS_MIN_REFETCH_SECONDS", "60"))
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class OAuthError(Exception):
+    """A provider rejected the credentials or could not be reached"""
+
+    def __init__(self, detail: str, status_code: int = 401):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+@dataclass
+class SocialProfile:
+    email: Optional[str]
+    name: Optional[str]
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(OAUTH_TIMEOUT_SECONDS, connect=OAUTH_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=OAUTH_MAX_CONNECTIONS,
+                max_keepalive_connections=OAUTH_MAX_CONNECTIONS
+            ),
+            headers={"Accept": "application/json"}
+        )
+    return _client
+
+
+async def close_oauth_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _json_body(resp: httpx.Response, error: str, expected: type = dict):
+    """The response's JSON body; a provider answering with anything else is an auth failure"""
+    try:
+        body = resp.json()
+    except ValueError:
+        raise OAuthError(error)
+    if not isinstance(body, expected):
+        raise OAuthError(error)
+    return body
+
+
+async def fetch_google_profile(access_token: str) -> SocialProfile:
+    try:
+        resp = await get_http_client().get(
+            GOOGLE_USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+    except httpx.HTTPError as e:
+        raise OAuthError(f"Google authentication failed: {str(e) or type(e).__name__}")
+    if resp.status_code != 200:
+        raise OAuthError("Invalid Google Token")
+
+    google_data = _json_body(resp, "Invalid Google Token")
+    return SocialProfile(email=google_data.get("email"), name=google_data.get("name", "Google User"))
+
+
+async def fetch_github_profile(code: str) -> SocialProfile:
+    client_id = os.getenv("GITHUB_CLIENT_ID")
+    client_secret = os.getenv("GITHUB_CLIENT_SECRET")
+    if not client_id or not client_secret:
+        raise OAuthError("GitHub credentials not configured", status_code=500)
+
+    client = get_http_client()
+    try:
+        token_resp = await client.post(
+            GITHUB_TOKEN_URL,
+            data={"client_id": client_id, "client_secret": client_secret, "code": code}
+        )
+        if token_resp.status_code != 200:
+            raise OAuthError(f"Failed to exchange GitHub code: {token_resp.text}")
+
+        token_data = _json_body(token_resp, f"Failed to exchange GitHub code: {token_resp.text}")
+        access_token = token_data.get("access_token")
+        if not access_token:
+            raise OAuthError(f"No access token from GitHub. Response: {token_data}")
+
+        # Profile and emails in parallel: a private email needs the second call anyway
+        headers = {"Authorization": f"Bearer {access_token}"}
+        user_resp, emails_resp = await asyncio.gather(
+            client.get(GITHUB_USER_URL, headers=headers),
+            client.get(GITHUB_EMAILS_URL, headers=headers)
+        )
+    except httpx.HTTPError as e:
+        raise OAuthError(f"GitHub login failed: {str(e) or type(e).__name__}")
+
+    if user_resp.status_code != 200:
+        raise OAuthError(f"GitHub login failed: {user_resp.text}")
+    github_user = _json_body(user_resp, f"GitHub login failed: {user_resp.text}")
+    email = github_user.get("email")
+
+    if not email and emails_resp.status_code == 200:
+        emails = _json_body(emails_resp, f"GitHub login failed: {emails_resp.text}", list)
+        for e in emails:
+            if e.get("primary") and e.get("verified"):
+                email = e.get("email")
+                break
+        if not email and emails:
+            email = emails[0].get("email")
+
+    return SocialProfile(email=email, name=github_user.get("name") or github_user.get("login"))
+
+
+class JWKSCache:
+    """
+    A provider's signing keys, indexed by kid and parsed once.
+
+    Keys are kept for the response's Cache-Control max-age. Once that runs
+    out they are still served while a background task refetches them, so
+    verification normally does no network I/O. A token signed with a kid we
+    don't know (Apple rotated its keys) waits for one refetch, rate limited
+    so that forged kids can't hammer the provider.
+    """
+
+    def __init__(self, url: str, default_ttl_seconds: int, min_refetch_seconds: int):
+        self.url = url
+        self.default_ttl_seconds = default_ttl_seconds
+        self.min_refetch_seconds = min_refetch_seconds
+        self._keys: Dict[str, Key] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self._background: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.fetches = 0
+        self.fetch_failures = 0
+        self.unknown_kids = 0
+
+    async def get_key(self, kid: str) -> Optional[Key]:
+        """The parsed key for kid, or None if the provider doesn't publish it"""
+        key = self._keys.get(kid)
+        if key is not None:
+            if time.monotonic() < self._expires_at:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._refresh_in_background()
+            return key
+
+        self.unknown_kids += 1
+        if not self._keys or time.monotonic() - self._fetched_at >= self.min_refetch_seconds:
+            await self.refresh()
+        return self._keys.get(kid)
+
+    async def refresh(self) -> None:
+        """Refetch the keys; concurrent callers share one request"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        fetched_at = self._fetched_at
+        async with self._lock:
+            if self._fetched_at != fetched_at:
+                # Someone else fetched while we waited
+                return
+            await self._fetch()
+
+    def stats(self) -> dict:
+        return {
+            "keys": sorted(self._keys),
+            "expires_in_seconds": round(max(0.0, self._expires_at - time.monotonic()), 1) if self._keys else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fetches": self.fetches,
+            "fetch_failures": self.fetch_failures,
+            "unknown_kids": self.unknown_kids,
+        }
+
+    def clear(self) -> None:
+        self._keys = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+
+    def _refresh_in_background(self) -> None:
+        if self._background is None or self._background.done():
+            self._background = asyncio.create_task(self._refresh_quietly())
+
+    async def _refresh_quietly(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            # Keep serving the keys we have; the next stale hit retries
+            print(f"⚠️ JWKS refresh from {self.url} failed: {str(e)}")
+
+    async def _fetch(self) -> None:
+        self.fetches += 1
+        try:
+            resp = await get_http_client().get(self.url)
+            resp.raise_for_status()
+            keys = {}
+            for entry in resp.json()["keys"]:
+                if entry.get("kid"):
+                    keys[entry["kid"]] = jwk.construct(entry, entry.get("alg", "RS256"))
+        except Exception:
+            self.fetch_failures += 1
+            # Don't retry an unknown kid straight away either
+            self._fetched_at = time.monotonic()
+            raise
+
+        now = time.monotonic()
+        self._keys = keys
+        self._fetched_at = now
+        self._expires_at = now + self._ttl(resp.headers.get("cache-control", ""))
+
+    def _ttl(self, cache_control: str) -> int:
+        directives = cache_control.lower()
+        if "no-store" in directives or "no-cache" in directives:
+            return 0
+        match = MAX_AGE_PATTERN.search(directives)
+        return int(match.group(1)) if match else self.default_ttl_seconds
+
+
+apple_jwks = JWKSCache(APPLE_KEYS_URL, APPLE_JWKS_DEFAULT_TTL_SECONDS, APPLE_JWKS_MIN_REFETCH_SECONDS)
+
+
+async def verify_apple_token(id_token: str, name: Optional[str] = None) -> SocialProfile:
+    try:
+        kid = jwt.get_unverified_header(id_token).get("kid")
+        key = await apple_jwks.get_key(kid) if kid else None
+        if key is None:
+            raise OAuthError("Apple login failed: unknown signing key")
+
+        # The issuer must be Apple; the audience is not checked
+        payload = jwt.decode(
+            id_token,
+            key,
+            algorithms=["RS256"],
+            options={"verify_aud": False, "verify_iss": True},
+            issuer=APPLE_ISSUER
+        )
+    except OAuthError:
+        raise
+    except Exception as e:
+        raise OAuthError(f"Apple login failed: {str(e)}")
+
+    # Apple sends the name only to the frontend, and only on the first login
+    return SocialProfile(email=payload.get("email"), name=name or "Apple User")
@@ -0,0 +1,123 @@
+"""
+Password hashing on a dedicated, bounded thread pool.
+
+bcrypt costs a few hundred milliseconds of CPU per call. Running it on the
+event loop or Starlette's shared threadpool lets a burst of logins starve
+every other request, so hashes and verifications run here instead: at most
+PASSWORD_HASH_WORKERS at a time (bcrypt releases the GIL, so this scales
+with cores), up to PASSWORD_HASH_MAX_QUEUE waiting, and beyond that callers
+get PasswordHasherBusyError (429 at the API).
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
+
+from passlib.context import CryptContext
+
+# Work factor for new hashes. Hashes made with other rounds are upgraded on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Pinning min and max to the configured rounds makes verify_and_update()
+# return a new hash whenever a stored one was made with different rounds
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class PasswordHasherBusyError(Exception):
+    """Raised when every hashing thread is busy and the queue is full"""
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._busy_seconds = 0.0
+        self._counters = {"hashes": 0, "verifications": 0, "failed_verifications": 0, "rehashes": 0, "rejected": 0}
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue fn on the pool; raises PasswordHasherBusyError instead of queueing without bound"""
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._counters["rejected"] += 1
+                raise PasswordHasherBusyError("Password hashing queue is full")
+            self._pending += 1
+
+        def timed():
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._busy_seconds += time.perf_counter() - start
+
+        future = self._executor.submit(timed)
+        future.add_done_callback(self._done)
+        return future
+
+    def hash_blocking(self, password: str) -> str:
+        """For sync handlers: waits on the pool, so they are bounded like async ones"""
+        return self.submit(self._hash, password).result()
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(self._hash, password))
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(valid, new_hash); new_hash is set when the stored hash should be replaced"""
+        return await asyncio.wrap_future(self.submit(self._verify_and_update, password, hashed))
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = self._counters["hashes"] + self._counters["verifications"]
+            return {
+                "workers": self.workers,
+                "in_flight": self._pending,
+                "queued": max(0, self._pending - self.workers),
+                "max_queue": self.max_queue,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "avg_ms": round(self._busy_seconds * 1000 / calls, 1) if calls else 0.0,
+                **self._counters,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _hash(self, password: str) -> str:
+        self._count("hashes")
+        return pwd_context.hash(password)
+
+    def _verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        self._count("verifications")
+        try:
+            valid, new_hash = pwd_context.verify_and_update(password, hashed)
+        except ValueError:
+            # Not a hash at all, e.g. accounts onboarded without a password
+            valid, new_hash = False, None
+        if not valid:
+            self._count("failed_verifications")
+        elif new_hash:
+            self._count("rehashes")
+        return valid, new_hash
+
+
+password_hasher = PasswordHasher()
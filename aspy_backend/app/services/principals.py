@@ -0,0 +1,114 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.models.user import User
+
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+# Columns kept in the cached copy. The password hash stays out of memory, and
+# execution_count changes on every run, so both load from the row when read.
+PRINCIPAL_ATTRIBUTES = (
+    "id", "username", "email", "user_type", "razorpay_customer_id",
+    "is_active", "is_superuser", "created_at", "updated_at",
+)
+
+
+class PrincipalCache:
+    """
+    Caches the authenticated User per token subject (email) so resolving the
+    caller costs no query. Entries are detached copies; a hit is merged into
+    the request's session without loading it. Call invalidate(user_id)
+    after any write to a user row; the TTL bounds staleness across workers.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: Dict[str, Tuple[float, User]] = {}
+        self._emails_by_user: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db: Session, email: str) -> Optional[User]:
+        cached = self._get_cached(email)
+        if cached is not None:
+            return db.merge(cached, load=False)
+
+        user = db.query(User).filter(User.email == email).first()
+        self._store(email, user)
+        return user
+
+    async def get_async(self, db: AsyncSession, email: str) -> Optional[User]:
+        cached = self._get_cached(email)
+        if cached is not None:
+            return await db.merge(cached, load=False)
+
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalars().first()
+        self._store(email, user)
+        return user
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            email = self._emails_by_user.pop(user_id, None)
+            if email is not None:
+                self._entries.pop(email, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._emails_by_user.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _get_cached(self, email: str) -> Optional[User]:
+        if not self.ttl_seconds:
+            return None
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def _store(self, email: str, user: Optional[User]) -> None:
+        # Unknown subjects aren't cached, so a user registered on another worker resolves at once
+        if user is None or not self.ttl_seconds:
+            return
+
+        snapshot = User(**{attr: getattr(user, attr) for attr in PRINCIPAL_ATTRIBUTES})
+        make_transient_to_detached(snapshot)
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries and email not in self._entries:
+                # Drop the oldest entry; dicts keep insertion order
+                oldest_email, (_, oldest) = next(iter(self._entries.items()))
+                del self._entries[oldest_email]
+                self._emails_by_user.pop(oldest.id, None)
+            previous_email = self._emails_by_user.get(snapshot.id)
+            if previous_email is not None:
+                # The user's email changed since that entry was cached
+                self._entries.pop(previous_email, None)
+            self._entries.pop(email, None)
+            self._entries[email] = (time.monotonic(), snapshot)
+            self._emails_by_user[snapshot.id] = email
+
+
+principals = PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES)
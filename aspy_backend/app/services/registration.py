@@ -0,0 +1,192 @@
+"""
+Account creation: single sign-ups and bulk onboarding.
+
+Every account starts on the FREE plan. A sign-up writes the user and the
+free subscription in one transaction; bulk onboarding does the same for
+thousands of rows at a time with multi-row INSERTs.
+"""
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus
+from app.services.entitlements import entitlements
+
+# Free plans don't expire; end the period far in the future (100 years)
+FREE_PLAN_PERIOD = timedelta(days=36500)
+ONBOARDING_BATCH_SIZE = int(os.getenv("ONBOARDING_BATCH_SIZE", "5000"))
+
+# Stored for accounts created without a password (bulk onboarding). It is not a
+# valid hash, so password login always fails; those users sign in with a social
+# provider or set a password later.
+UNUSABLE_PASSWORD = "!"
+
+_free_plan_id: Optional[int] = None
+
+
+def _free_plan_query():
+    return select(Plan.id).where(Plan.type == PlanType.FREE).order_by(Plan.id).limit(1)
+
+
+def get_free_plan_id(db: Session) -> Optional[int]:
+    """The FREE plan's id, looked up once per process"""
+    global _free_plan_id
+    if _free_plan_id is None:
+        _free_plan_id = db.execute(_free_plan_query()).scalar()
+    return _free_plan_id
+
+
+async def get_free_plan_id_async(db: AsyncSession) -> Optional[int]:
+    global _free_plan_id
+    if _free_plan_id is None:
+        _free_plan_id = (await db.execute(_free_plan_query())).scalar()
+    return _free_plan_id
+
+
+def forget_free_plan_id() -> None:
+    """Call after changing plans in-process; the next sign-up looks the FREE plan up again"""
+    global _free_plan_id
+    _free_plan_id = None
+
+
+def free_subscription_values(user_id: Optional[int], plan_id: int, now: datetime) -> dict:
+    return {
+        "user_id": user_id,
+        "plan_id": plan_id,
+        "status": SubscriptionStatus.ACTIVE,
+        "created_at": now,
+        "current_period_start": now,
+        "current_period_end": now + FREE_PLAN_PERIOD,
+        "cancel_at_period_end": False,
+    }
+
+
+async def create_user_with_free_plan(db: AsyncSession, username: str, email: str, password_hash: str) -> User:
+    """Insert the user and their FREE subscription in one transaction"""
+    now = datetime.utcnow()
+    user = User(
+        username=username,
+        email=email,
+        password=password_hash,
+        is_active=True,
+        created_at=now
+    )
+    db.add(user)
+
+    free_plan_id = await get_free_plan_id_async(db)
+    if free_plan_id:
+        # Linked through the relationship, so one flush inserts both rows
+        db.add(Subscription(user=user, **free_subscription_values(None, free_plan_id, now)))
+    await db.commit()
+    entitlements.invalidate(user.id)
+    return user
+
+
+def _chunks(rows: List[dict], size: int) -> Iterable[List[dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def bulk_onboard_users(db: Session, rows: List[Dict[str, str]], batch_size: int = ONBOARDING_BATCH_SIZE) -> dict:
+    """
+    Create users (dicts with username and email) on the FREE plan.
+
+    Each batch is one transaction of two multi-row INSERTs (users, then their
+    subscriptions), so an interrupted import can simply be re-run: rows whose
+    email or username already exists are skipped, as are duplicates within
+    the input. Accounts get UNUSABLE_PASSWORD.
+    """
+    started = time.perf_counter()
+    free_plan_id = get_free_plan_id(db)
+    if not free_plan_id:
+        raise ValueError("No FREE plan found. Please run seed_plans.py first.")
+
+    created = 0
+    skipped: List[dict] = []
+    seen_emails, seen_usernames = set(), set()
+
+    for batch in _chunks(rows, batch_size):
+        emails = [row["email"] for row in batch]
+        usernames = [row["username"] for row in batch]
+        taken_emails = set(db.execute(select(User.email).where(User.email.in_(emails))).scalars())
+        taken_usernames = set(db.execute(select(User.username).where(User.username.in_(usernames))).scalars())
+
+        new_users = []
+        for row in batch:
+            email, username = row["email"], row["username"]
+            if email in taken_emails or email in seen_emails:
+                skipped.append({"email": email, "reason": "email already registered"})
+            elif username in taken_usernames or username in seen_usernames:
+                skipped.append({"email": email, "reason": "username already taken"})
+            else:
+                new_users.append({"username": username, "email": email, "password": UNUSABLE_PASSWORD, "is_active": True})
+            seen_emails.add(email)
+            seen_usernames.add(username)
+
+        if not new_users:
+            continue
+
+        now = datetime.utcnow()
+        for user in new_users:
+            user["created_at"] = now
+        # executemany; SQLAlchemy sends it as multi-row INSERT ... RETURNING
+        user_ids = db.execute(
+            insert(User).returning(User.id, sort_by_parameter_order=True),
+            new_users
+        ).scalars().all()
+        db.execute(
+            insert(Subscription),
+            [free_subscription_values(user_id, free_plan_id, now) for user_id in user_ids]
+        )
+        db.commit()
+        created += len(user_ids)
+
+    return {
+        "created": created,
+        "skipped": len(skipped),
+        "skipped_rows": skipped,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+
+
+def backfill_free_subscriptions(db: Session, batch_size: int = ONBOARDING_BATCH_SIZE) -> int:
+    """
+    Give every user without an active subscription the FREE plan, one
+    multi-row INSERT per batch of users. Returns how many were created.
+    """
+    free_plan_id = get_free_plan_id(db)
+    if not free_plan_id:
+        raise ValueError("No FREE plan found. Please run seed_plans.py first.")
+
+    has_active = select(Subscription.id).where(
+        Subscription.user_id == User.id,
+        Subscription.status == SubscriptionStatus.ACTIVE
+    ).exists()
+
+    created = 0
+    last_id = 0
+    while True:
+        user_ids = db.execute(
+            select(User.id).where(and_(User.id > last_id, ~has_active)).order_by(User.id).limit(batch_size)
+        ).scalars().all()
+        if not user_ids:
+            break
+
+        now = datetime.utcnow()
+        db.execute(
+            insert(Subscription),
+            [free_subscription_values(user_id, free_plan_id, now) for user_id in user_ids]
+        )
+        db.commit()
+        for user_id in user_ids:
+            entitlements.invalidate(user_id)
+        created += len(user_ids)
+        last_id = user_ids[-1]
+
+    return created
@@ -0,0 +1,471 @@
+"""
+Pre-forked pool of sandbox processes for running generated Python.
+
+Each worker is a separate interpreter started with memory limits. It never
+runs user code itself: it is a clean template that forks a child per job, so
+nothing a program does to interpreter state (sys.modules, module attributes,
+builtins) is visible to the next job. The child gets its own CPU-time budget
+and the worker enforces the wall-clock deadline, killing the child if it is
+exceeded. Output is captured inside the child and relayed back over a pipe
+line by line, so it can be streamed and nothing touches the API process's
+sys.stdout. Where fork() is unavailable, jobs run in the worker and every
+worker is retired after one job.
+
+This module is imported by the worker processes, keep it free of app imports.
+"""
+import asyncio
+import contextlib
+import io
+import marshal
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional, Tuple, Union
+
+try:
+    import resource
+except ImportError:  # Windows dev machines: no rlimits, wall clock still applies
+    resource = None
+
+SANDBOX_POOL_SIZE = int(os.getenv("SANDBOX_POOL_SIZE", str(min(os.cpu_count() or 2, 8))))
+SANDBOX_MAX_QUEUE = int(os.getenv("SANDBOX_MAX_QUEUE", "64"))
+SANDBOX_QUEUE_TIMEOUT = float(os.getenv("SANDBOX_QUEUE_TIMEOUT", "10"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+SANDBOX_WALL_SECONDS = float(os.getenv("SANDBOX_WALL_SECONDS", "10"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_MAX_OUTPUT_BYTES = int(os.getenv("SANDBOX_MAX_OUTPUT_BYTES", str(64 * 1024)))
+SANDBOX_MAX_JOBS_PER_WORKER = int(os.getenv("SANDBOX_MAX_JOBS_PER_WORKER", "200"))
+SANDBOX_START_TIMEOUT = 15.0
+# The worker times its child out itself; the parent only steps in if the worker hangs
+SANDBOX_WORKER_GRACE_SECONDS = 2.0
+# One fresh process per job; without fork() workers are retired after each job instead
+FORK_PER_JOB = hasattr(os, "fork")
+# Imported by each worker before it starts forking, so jobs find them already loaded
+SANDBOX_PREWARM_MODULES = ("collections", "datetime", "decimal", "fractions", "functools", "itertools",
+                           "json", "math", "random", "re", "statistics", "string", "textwrap")
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+STATUS_TIMEOUT = "timeout"
+STATUS_CPU_LIMIT = "cpu_limit"
+STATUS_CRASHED = "crashed"
+
+# Statuses of jobs that were killed, by the pool counter they are reported under
+STATUS_COUNTERS = {STATUS_TIMEOUT: "timeouts", STATUS_CPU_LIMIT: "cpu_limits", STATUS_CRASHED: "crashes"}
+
+
+class SandboxBusyError(Exception):
+    """Raised when the pool's queue is full or no worker frees up in time"""
+
+
+@dataclass
+class SandboxResult:
+    stdout: str
+    stderr: str
+    status: str
+    duration_ms: float
+    # Ran in a process no earlier job touched, so no other program affected the output
+    isolated: bool = False
+
+    @property
+    def output(self) -> str:
+        output = self.stdout + self.stderr
+        if self.status == STATUS_TIMEOUT:
+            output += f"\nExecution Error: time limit exceeded ({SANDBOX_WALL_SECONDS:g}s)"
+        elif self.status == STATUS_CPU_LIMIT:
+            output += f"\nExecution Error: CPU time limit exceeded ({SANDBOX_CPU_SECONDS}s)"
+        elif self.status == STATUS_CRASHED:
+            output += "\nExecution Error: program was terminated (memory limit exceeded?)"
+        return output
+
+
+class _PipeWriter(io.TextIOBase):
+    """
+    Stand-in for sys.stdout/sys.stderr inside a worker. Complete lines are
+    forwarded to the parent as soon as they are printed so output can be
+    streamed; both streams share one byte budget per job.
+    """
+
+    def __init__(self, conn, kind: str, budget: list):
+        self.conn = conn
+        self.kind = kind
+        self.budget = budget
+        self._buffer = []
+        self._buffered = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if "\n" in text or self._buffered >= 4096:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        data = "".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+
+        remaining = self.budget[0]
+        if remaining <= 0:
+            return
+        if len(data) > remaining:
+            data = data[:remaining] + "\n... output truncated ...\n"
+        self.budget[0] -= len(data)
+        self.conn.send((self.kind, data))
+
+
+def _execute(conn, job: Union[str, bytes], cpu_seconds: int, max_output: int) -> str:
+    """Run one program, streaming its output over conn; returns its status"""
+    if resource is not None and cpu_seconds > 0:
+        # RLIMIT_CPU is cumulative for the process, so move the soft limit
+        # forward by one job's budget; SIGXCPU terminates the process.
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = int(usage.ru_utime + usage.ru_stime) + 1
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (used + cpu_seconds, hard))
+
+    budget = [max_output]
+    stdout = _PipeWriter(conn, "stdout", budget)
+    stderr = _PipeWriter(conn, "stderr", budget)
+    status = STATUS_OK
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+        try:
+            program = marshal.loads(job) if isinstance(job, bytes) else job
+            exec(program, {"__builtins__": __builtins__, "__name__": "__main__"})
+        except BaseException:
+            status = STATUS_ERROR
+            # Drop this frame so the traceback starts at the user's code
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_tb.tb_next)
+        finally:
+            stdout.flush()
+            stderr.flush()
+    return status
+
+
+def _run_forked(conn, job: Union[str, bytes], cpu_seconds: int, wall_seconds: float, max_output: int) -> str:
+    """
+    Run one program in a forked child and relay its messages to conn. The
+    child's messages go through a pipe of its own, so a child killed halfway
+    through a message can't corrupt the worker's stream.
+    """
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            # The program only gets its own pipe, not the worker's line to the API
+            conn.close()
+            reader.close()
+            writer.send(("done", _execute(writer, job, cpu_seconds, max_output)))
+        finally:
+            os._exit(0)
+    writer.close()
+
+    deadline = time.monotonic() + wall_seconds
+    status = None
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not reader.poll(remaining):
+                status = STATUS_TIMEOUT
+                os.kill(pid, signal.SIGKILL)
+                break
+            message = reader.recv()
+            if message[0] == "done":
+                status = message[1]
+                break
+            conn.send(message)
+    except (EOFError, OSError):
+        # The child died before finishing; its exit status says why
+        pass
+    finally:
+        reader.close()
+
+    _, wait_status = os.waitpid(pid, 0)
+    if status is None:
+        killed_by = os.WTERMSIG(wait_status) if os.WIFSIGNALED(wait_status) else None
+        status = STATUS_CPU_LIMIT if killed_by == getattr(signal, "SIGXCPU", None) else STATUS_CRASHED
+    return status
+
+
+def _worker_main(conn, cpu_seconds: int, wall_seconds: float, memory_bytes: int, max_output: int) -> None:
+    """
+    Worker loop: receive a program (source, or a marshalled code object from
+    app.services.code_policy), run it, stream back ("stdout"|"stderr", text)
+    messages while it runs and finish with ("done", status).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None and memory_bytes > 0:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+    if FORK_PER_JOB:
+        for name in SANDBOX_PREWARM_MODULES:
+            __import__(name)
+
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        if FORK_PER_JOB:
+            status = _run_forked(conn, job, cpu_seconds, wall_seconds, max_output)
+        else:
+            status = _execute(conn, job, cpu_seconds, max_output)
+        conn.send(("done", status))
+
+
+class _Worker:
+    def __init__(self, ctx, cpu_seconds: int, wall_seconds: float, memory_bytes: int, max_output: int):
+        parent_conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(child_conn, cpu_seconds, wall_seconds, memory_bytes, max_output),
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs = 0
+
+    def wait_ready(self, timeout: float) -> None:
+        if not self.conn.poll(timeout):
+            self.kill()
+            raise RuntimeError("Sandbox worker failed to start")
+        self.conn.recv()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(timeout=1)
+        self.conn.close()
+
+
+class SandboxPool:
+    def __init__(
+        self,
+        size: int = SANDBOX_POOL_SIZE,
+        max_queue: int = SANDBOX_MAX_QUEUE,
+        queue_timeout: float = SANDBOX_QUEUE_TIMEOUT,
+        cpu_seconds: int = SANDBOX_CPU_SECONDS,
+        wall_seconds: float = SANDBOX_WALL_SECONDS,
+        memory_mb: int = SANDBOX_MEMORY_MB,
+        max_output: int = SANDBOX_MAX_OUTPUT_BYTES,
+        max_jobs_per_worker: int = SANDBOX_MAX_JOBS_PER_WORKER,
+    ):
+        self.size = max(1, size)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.cpu_seconds = cpu_seconds
+        self.wall_seconds = wall_seconds
+        self.memory_bytes = memory_mb * 1024 * 1024
+        self.max_output = max_output
+        # Without a fork per job the worker itself runs user code and can't be reused
+        self.max_jobs_per_worker = max_jobs_per_worker if FORK_PER_JOB else 1
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = False
+        self._pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._counters = {"completed": 0, "errors": 0, "timeouts": 0, "cpu_limits": 0, "crashes": 0, "rejected": 0, "recycled": 0}
+
+    def start(self) -> None:
+        """Spawn all workers up front so the first request doesn't pay interpreter start-up"""
+        with self._lock:
+            if self._started:
+                return
+            workers = [self._new_worker(wait=False) for _ in range(self.size)]
+            for worker in workers:
+                worker.wait_ready(SANDBOX_START_TIMEOUT)
+                self._idle.put(worker)
+            # Threads only wait on pipes; one per worker plus one per queued job
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.size + self.max_queue,
+                thread_name_prefix="sandbox"
+            )
+            self._started = True
+        print(f"🧪 Sandbox pool started with {self.size} workers")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def run(self, code: Union[str, bytes], on_output: Optional[Callable[[str, str], None]] = None) -> SandboxResult:
+        """
+        Run code (source, or a marshalled code object) on the next free worker,
+        blocking the calling thread.
+        on_output, if given, is called with ("stdout"|"stderr", text) as output arrives.
+        """
+        if not self._started:
+            self.start()
+
+        with self._lock:
+            if self._pending >= self.size + self.max_queue:
+                self._counters["rejected"] += 1
+                raise SandboxBusyError("Sandbox queue is full")
+            self._pending += 1
+
+        try:
+            try:
+                worker = self._idle.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                with self._lock:
+                    self._counters["rejected"] += 1
+                raise SandboxBusyError("No sandbox worker became available")
+            return self._run_on(worker, code, on_output)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def run_async(self, code: Union[str, bytes]) -> SandboxResult:
+        if not self._started:
+            await asyncio.get_running_loop().run_in_executor(None, self.start)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.run, code)
+
+    async def stream(self, code: Union[str, bytes]) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        Yield ("stdout"|"stderr", text) while the program runs, then a final
+        ("result", SandboxResult). Raises SandboxBusyError like run().
+        """
+        loop = asyncio.get_running_loop()
+        if not self._started:
+            await loop.run_in_executor(None, self.start)
+
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        def on_output(kind: str, text: str) -> None:
+            loop.call_soon_threadsafe(chunks.put_nowait, (kind, text))
+
+        job = loop.run_in_executor(self._executor, self.run, code, on_output)
+        # Chunk callbacks are scheduled before the job's completion callback,
+        # so once the job is done everything it printed is already queued.
+        while not (job.done() and chunks.empty()):
+            getter = asyncio.ensure_future(chunks.get())
+            await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+            else:
+                getter.cancel()
+        yield "result", job.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "in_flight": self._pending,
+                "max_queue": self.max_queue,
+                "cpu_seconds": self.cpu_seconds,
+                "wall_seconds": self.wall_seconds,
+                "memory_mb": self.memory_bytes // (1024 * 1024),
+                "fork_per_job": FORK_PER_JOB,
+                **self._counters,
+            }
+
+    def _new_worker(self, wait: bool = True) -> _Worker:
+        worker = _Worker(self._ctx, self.cpu_seconds, self.wall_seconds, self.memory_bytes, self.max_output)
+        if wait:
+            worker.wait_ready(SANDBOX_START_TIMEOUT)
+        return worker
+
+    def _replace(self, worker: _Worker, counter: str) -> None:
+        worker.kill()
+        with self._lock:
+            self._counters[counter] += 1
+            if not self._started:
+                return
+        try:
+            self._idle.put(self._new_worker())
+        except Exception as e:
+            print(f"❌ Failed to replace sandbox worker: {str(e)}")
+
+    def _run_on(self, worker: _Worker, code: Union[str, bytes], on_output: Optional[Callable[[str, str], None]]) -> SandboxResult:
+        started = time.perf_counter()
+        deadline = started + self.wall_seconds + SANDBOX_WORKER_GRACE_SECONDS
+        output = {"stdout": [], "stderr": []}
+        isolated = FORK_PER_JOB or worker.jobs == 0
+
+        def result(status: str) -> SandboxResult:
+            return SandboxResult(
+                "".join(output["stdout"]),
+                "".join(output["stderr"]),
+                status,
+                round((time.perf_counter() - started) * 1000, 2),
+                isolated
+            )
+
+        try:
+            worker.conn.send(code)
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or not worker.conn.poll(remaining):
+                    self._replace(worker, "timeouts")
+                    return result(STATUS_TIMEOUT)
+                message = worker.conn.recv()
+                if message[0] == "done":
+                    status = message[1]
+                    break
+                output[message[0]].append(message[1])
+                if on_output is not None:
+                    on_output(message[0], message[1])
+        except (EOFError, BrokenPipeError, OSError):
+            worker.process.join(timeout=1)
+            hit_cpu_limit = worker.process.exitcode == -getattr(signal, "SIGXCPU", -1)
+            self._replace(worker, "cpu_limits" if hit_cpu_limit else "crashes")
+            return result(STATUS_CPU_LIMIT if hit_cpu_limit else STATUS_CRASHED)
+
+        worker.jobs += 1
+        with self._lock:
+            if status in STATUS_COUNTERS:
+                # The job's process was killed, the worker is still fine
+                self._counters[STATUS_COUNTERS[status]] += 1
+            else:
+                self._counters["completed"] += 1
+                if status == STATUS_ERROR:
+                    self._counters["errors"] += 1
+
+        if worker.jobs >= self.max_jobs_per_worker:
+            self._replace(worker, "recycled")
+        else:
+            self._idle.put(worker)
+        return result(status)
+
+
+sandbox_pool = SandboxPool()
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+from openai import AsyncOpenAI
+
+from app.services.translation_cache import translation_cache, make_cache_key
+from app.services.coalescing import SingleFlight
+from app.services.transpiler import transpilers
+
+TRANSLATION_MODEL = os.getenv("OPENAI_TRANSLATION_MODEL", "gpt-4o")
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "30"))
+OPENAI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OPENAI_CONNECT_TIMEOUT_SECONDS", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+# Completions allowed in flight per worker; the rest wait here instead of piling onto OpenAI
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))
+# Batch translation packs up to this many snippets (and characters of source) into one completion
+TRANSLATION_BATCH_MAX_SNIPPETS = int(os.getenv("TRANSLATION_BATCH_MAX_SNIPPETS", "8"))
+TRANSLATION_BATCH_MAX_CHARS = int(os.getenv("TRANSLATION_BATCH_MAX_CHARS", "12000"))
+
+# Bump whenever the prompt or the post-processing below changes, so that
+# translations produced by an older prompt are no longer served from cache.
+PROMPT_VERSION = "1"
+
+SYSTEM_PROMPT = (
+    "You are an expert code translator. Convert the input pseudocode/instruction into valid, "
+    "executable Python code. Do not use input() functions (hardcode values if needed). "
+    "Return ONLY the python code, no markdown backticks."
+)
+
+BATCH_SYSTEM_PROMPT = (
+    "You are an expert code translator. Convert each numbered input pseudocode/instruction into "
+    "valid, executable Python code. Do not use input() functions (hardcode values if needed). "
+    "Translate every snippet independently. Respond with a JSON object of the form "
+    '{"translations": [{"id": <snippet number>, "python_code": "<python code>"}]} '
+    "containing one entry per snippet, with no markdown backticks inside python_code."
+)
+
+_client: Optional[AsyncOpenAI] = None
+_completion_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+# Concurrent misses for the same snippet share one completion
+translation_flights = SingleFlight("translation")
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """
+    Create the OpenAI client on first use so a missing key fails the request, not the import.
+    All completions share one keep-alive connection pool.
+    """
+    global _client
+    if _client is None:
+        timeout = httpx.Timeout(OPENAI_TIMEOUT_SECONDS, connect=OPENAI_CONNECT_TIMEOUT_SECONDS)
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=timeout,
+            max_retries=OPENAI_MAX_RETRIES,
+            http_client=httpx.AsyncClient(
+                timeout=timeout,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                )
+            )
+        )
+    return _client
+
+
+async def close_openai_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def build_translation_messages(language: str, code: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Input Code ({language}):\n{code}"}
+    ]
+
+
+def build_batch_translation_messages(snippets: List[Tuple[str, str]]) -> list:
+    parts = [f"### Snippet {i} ({language})\n{code}" for i, (language, code) in enumerate(snippets)]
+    return [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": "\n\n".join(parts)}
+    ]
+
+
+def clean_generated_code(content: str) -> str:
+    return (content or "").replace("```python", "").replace("```", "").strip()
+
+
+def translation_cache_key(language: str, code: str) -> str:
+    return make_cache_key(language, code, PROMPT_VERSION, TRANSLATION_MODEL)
+
+
+async def _cache_get(key: str) -> Optional[str]:
+    # The shared tier is a blocking DB read, keep it off the event loop
+    if translation_cache.use_db:
+        return await run_in_threadpool(translation_cache.get, key)
+    return translation_cache.get(key)
+
+
+async def _cache_set(key: str, python_code: str, language: str) -> None:
+    if translation_cache.use_db:
+        await run_in_threadpool(translation_cache.set, key, python_code, language, PROMPT_VERSION)
+    else:
+        translation_cache.set(key, python_code, language=language, prompt_version=PROMPT_VERSION)
+
+
+async def translate_to_python(language: str, code: str) -> str:
+    """
+    Translate a snippet to Python. Keyword dialects the language's transpiler
+    understands never reach the model; repeats are served from the translation
+    cache, and identical snippets requested while a completion is in flight
+    wait for it instead of starting their own.
+    """
+    python_code = transpilers.transpile(language, code)
+    if python_code is not None:
+        return python_code
+
+    key = translation_cache_key(language, code)
+    cached = await _cache_get(key)
+    if cached is not None:
+        return cached
+
+    return await translation_flights.do(key, lambda: _complete(key, language, code))
+
+
+async def _complete(key: str, language: str, code: str) -> str:
+    async with _completion_slots:
+        response = await get_openai_client().chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=build_translation_messages(language, code),
+            temperature=0.2
+        )
+    python_code = clean_generated_code(response.choices[0].message.content)
+
+    if python_code:
+        await _cache_set(key, python_code, language)
+    return python_code
+
+
+async def stream_translation(language: str, code: str) -> AsyncIterator[str]:
+    """
+    Yield the generated Python as the model produces it. A transpiled snippet,
+    a cache hit, or the result of an identical translation already in flight
+    is yielded as a single chunk. Callers should run the joined chunks through
+    clean_generated_code(), which is also what gets cached.
+    """
+    python_code = transpilers.transpile(language, code)
+    if python_code is not None:
+        yield python_code
+        return
+
+    key = translation_cache_key(language, code)
+    cached = await _cache_get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    joined, python_code = await translation_flights.join(key)
+    if joined:
+        yield python_code
+        return
+
+    flight = translation_flights.lead(key)
+    deltas: asyncio.Queue = asyncio.Queue()
+    producer = asyncio.ensure_future(_lead_stream(key, language, code, flight, deltas))
+    try:
+        while True:
+            delta = await deltas.get()
+            if delta is None:
+                break
+            yield delta
+        # Raises the completion's error, if it failed
+        await producer
+    finally:
+        if not producer.done():
+            # The client went away mid-stream; a waiter takes over (see SingleFlight.reject)
+            producer.cancel()
+        elif not producer.cancelled():
+            producer.exception()
+
+
+async def _lead_stream(key: str, language: str, code: str, flight: asyncio.Future, deltas: asyncio.Queue) -> None:
+    """Run the streamed completion for stream_translation() and settle its flight; None in deltas marks the end"""
+    try:
+        python_code = await _stream_completion(key, language, code, deltas)
+    except BaseException as e:
+        translation_flights.reject(key, flight, e)
+        raise
+    finally:
+        deltas.put_nowait(None)
+    translation_flights.resolve(key, flight, python_code)
+
+
+async def _stream_completion(key: str, language: str, code: str, deltas: asyncio.Queue) -> str:
+    """
+    Read a streamed completion into deltas and return the cleaned code. The
+    completion slot is released as soon as the model is done, however slowly
+    the client reads the chunks.
+    """
+    parts = []
+    async with _completion_slots:
+        stream = await get_openai_client().chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=build_translation_messages(language, code),
+            temperature=0.2,
+            stream=True
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                deltas.put_nowait(delta)
+
+    python_code = clean_generated_code("".join(parts))
+    if python_code:
+        await _cache_set(key, python_code, language)
+    return python_code
+
+
+def _pack(snippets: List[Tuple[str, Tuple[str, str]]]) -> List[List[Tuple[str, Tuple[str, str]]]]:
+    """Split (key, (language, code)) pairs into groups that fit one completion"""
+    groups, group, size = [], [], 0
+    for item in snippets:
+        code_size = len(item[1][1])
+        if group and (len(group) >= TRANSLATION_BATCH_MAX_SNIPPETS or size + code_size > TRANSLATION_BATCH_MAX_CHARS):
+            groups.append(group)
+            group, size = [], 0
+        group.append(item)
+        size += code_size
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def _translate_group(group: List[Tuple[str, Tuple[str, str]]]) -> Dict[str, str]:
+    """One JSON-mode completion for the group; returns key -> python code for the snippets it answered"""
+    if len(group) == 1:
+        key, (language, code) = group[0]
+        return {key: await translate_to_python(language, code)}
+
+    async with _completion_slots:
+        response = await get_openai_client().chat.completions.create(
+            model=TRANSLATION_MODEL,
+            messages=build_batch_translation_messages([snippet for _, snippet in group]),
+            temperature=0.2,
+            response_format={"type": "json_object"}
+        )
+    try:
+        translations = json.loads(response.choices[0].message.content or "{}").get("translations") or []
+    except (ValueError, AttributeError):
+        # Malformed answer; every snippet falls back to its own completion
+        return {}
+    by_id = {str(item.get("id")): item.get("python_code") for item in translations if isinstance(item, dict)}
+
+    answered = {}
+    for i, (key, (language, _)) in enumerate(group):
+        python_code = clean_generated_code(by_id.get(str(i)) or "")
+        if python_code:
+            answered[key] = python_code
+            await _cache_set(key, python_code, language)
+    return answered
+
+
+async def translate_batch(snippets: List[Tuple[str, str]]) -> List[Union[str, Exception]]:
+    """
+    Translate many (language, code) snippets with as few completions as possible.
+
+    Transpiled and cached snippets cost nothing and repeats within the batch
+    are translated once. The rest are packed into JSON-mode completions that run
+    concurrently; a snippet the model left out is retried on its own.
+    Results are in input order, with the exception for snippets that failed.
+    """
+    keys = [translation_cache_key(language, code) for language, code in snippets]
+    results: Dict[str, Union[str, Exception]] = {}
+    pending: Dict[str, Tuple[str, str]] = {}
+    for key, snippet in zip(keys, snippets):
+        if key in results or key in pending:
+            continue
+        transpiled = transpilers.transpile(*snippet)
+        if transpiled is not None:
+            results[key] = transpiled
+            continue
+        cached = await _cache_get(key)
+        if cached is not None:
+            results[key] = cached
+        else:
+            pending[key] = snippet
+
+    # Snippets another request is translating right now are waited for, not packed
+    joining = [key for key in pending if translation_flights.in_flight(key)]
+    groups = _pack([(key, snippet) for key, snippet in pending.items() if key not in joining])
+    joined, outcomes = await asyncio.gather(
+        asyncio.gather(*(translation_flights.join(key) for key in joining), return_exceptions=True),
+        asyncio.gather(*(_translate_group(group) for group in groups), return_exceptions=True)
+    )
+    retry = []
+    for key, outcome in zip(joining, joined):
+        if isinstance(outcome, Exception):
+            results[key] = outcome
+        elif outcome[0]:
+            results[key] = outcome[1]
+        else:
+            retry.append(key)
+    for group, outcome in zip(groups, outcomes):
+        for key, _ in group:
+            if isinstance(outcome, Exception):
+                results[key] = outcome
+            elif key in outcome:
+                results[key] = outcome[key]
+            else:
+                retry.append(key)
+
+    if retry:
+        singles = await asyncio.gather(*(translate_to_python(*pending[key]) for key in retry), return_exceptions=True)
+        results.update(zip(retry, singles))
+
+    return [results[key] for key in keys]
@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.db.session import SessionLocal
+from app.models.translation_cache import TranslationCacheEntry
+
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "5000"))
+TRANSLATION_CACHE_MAX_BYTES = int(os.getenv("TRANSLATION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TRANSLATION_CACHE_DB_ENABLED = os.getenv("TRANSLATION_CACHE_DB", "false").lower() in ("1", "true", "yes")
+
+
+def normalize_language(language: str) -> str:
+    return (language or "").strip().lower()
+
+
+def normalize_code(code: str) -> str:
+    """
+    Normalize source so that copies of the same snippet hash identically.
+    Only line endings and trailing whitespace are touched; indentation is
+    significant for most of our dialects and is left alone.
+    """
+    lines = (code or "").replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def make_cache_key(language: str, code: str, prompt_version: str, model: str) -> str:
+    raw = "\0".join([prompt_version, model, normalize_language(language), normalize_code(code)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TranslationCache:
+    """
+    Two-tier cache of LLM translations.
+
+    The first tier is a bounded in-process LRU (by entry count and by bytes).
+    The optional second tier is the `translation_cache` table, shared by all
+    workers, and is consulted only on a local miss.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, use_db: bool = False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.use_db = use_db
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(key: str, value: str) -> int:
+        return len(key) + len(value.encode("utf-8"))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self.use_db:
+            value = self._db_get(key)
+            if value is not None:
+                with self._lock:
+                    self.db_hits += 1
+                self._store(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str, language: Optional[str] = None, prompt_version: Optional[str] = None) -> None:
+        self._store(key, value)
+        if self.use_db:
+            self._db_set(key, value, language, prompt_version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.db_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+                "db_tier_enabled": self.use_db,
+            }
+
+    def _store(self, key: str, value: str) -> None:
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= self._entry_size(key, previous)
+
+            self._entries[key] = value
+            self._bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                old_key, old_value = self._entries.popitem(last=False)
+                self._bytes -= self._entry_size(old_key, old_value)
+                self.evictions += 1
+
+    def _db_get(self, key: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            entry = db.query(TranslationCacheEntry.python_code).filter(
+                TranslationCacheEntry.cache_key == key
+            ).first()
+            return entry[0] if entry else None
+        except Exception as e:
+            print(f"Translation cache read failed: {str(e)}")
+            return None
+        finally:
+            db.close()
+
+    def _db_set(self, key: str, value: str, language: Optional[str], prompt_version: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(_insert_ignoring_existing(db.get_bind().dialect.name).values(
+                cache_key=key,
+                language=normalize_language(language) if language else None,
+                prompt_version=prompt_version,
+                python_code=value
+            ))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Translation cache write failed: {str(e)}")
+        finally:
+            db.close()
+
+
+def _insert_ignoring_existing(dialect: str):
+    """
+    INSERT that leaves an existing row alone. Every writer of a key stores the
+    same translation, so the first one wins and concurrent writers don't
+    conflict on the primary key.
+    """
+    table = TranslationCacheEntry.__table__
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing(index_elements=["cache_key"])
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing(index_elements=["cache_key"])
+    # Other databases: a concurrent writer's IntegrityError is logged and ignored below
+    return table.insert()
+
+
+translation_cache = TranslationCache(
+    max_entries=TRANSLATION_CACHE_MAX_ENTRIES,
+    max_bytes=TRANSLATION_CACHE_MAX_BYTES,
+    use_db=TRANSLATION_CACHE_DB_ENABLED
+)
@@ -0,0 +1,328 @@
+"""
+Deterministic transpilers for DesiCode keyword languages.
+
+Most snippets are Python written with a dialect's own keywords ("agar x > 5:",
+"likho x"). Those are translated here by rewriting keyword tokens to Python
+in place, so the author's comments and layout are kept, and parsing the result
+to check it, which takes microseconds and needs no network. Keywords that map
+to a plain name (likho -> print) are only rewritten where a call goes; used
+as a variable, parameter or attribute they are left as the author's name. The LLM is only used for input a transpiler can't handle
+(free-form pseudocode, natural-language instructions).
+
+A transpiler only answers when it is sure. The output must parse, must be a
+closed program (every name it reads is defined, imported or a builtin) and
+must not have bare top-level values such as "hello" or "10 + 5", whose
+author meant them to be shown. Anything else returns None and goes to the LLM,
+so a missing keyword costs speed, never correctness.
+
+Transpilers are registered per Language.slug; slugs without one get the
+plain-Python transpiler. More dialects can be loaded from a JSON file,
+{"<slug>": {"<keyword or phrase>": "<python>"}}, named by
+TRANSPILER_DIALECTS_FILE.
+"""
+import ast
+import builtins
+import io
+import json
+import keyword
+import os
+import threading
+import tokenize
+from typing import Dict, List, Optional, Protocol, Set, Tuple
+
+TRANSPILER_ENABLED = os.getenv("TRANSPILER_ENABLED", "true").lower() in ("1", "true", "yes")
+TRANSPILER_DIALECTS_FILE = os.getenv("TRANSPILER_DIALECTS_FILE", "")
+
+# Dialect keywords (romanized) -> Python. Phrases are matched as consecutive words.
+ENGLISH_KEYWORDS = {
+    "display": "print",
+    "show": "print",
+    "else if": "elif",
+    "true": "True",
+    "false": "False",
+    "none": "None",
+}
+
+HINDI_KEYWORDS = {
+    "agar": "if",
+    "warna agar": "elif",
+    "nahi to agar": "elif",
+    "warna": "else",
+    "nahi to": "else",
+    "jab tak": "while",
+    "har": "for",
+    "mein": "in",
+    "likho": "print",
+    "dikhao": "print",
+    "kaam": "def",
+    "wapas karo": "return",
+    "wapas": "return",
+    "sach": "True",
+    "jhooth": "False",
+    "khali": "None",
+    "aur": "and",
+    "ya": "or",
+    "nahi": "not",
+    "ruko": "break",
+    "aage badho": "continue",
+    "lambai": "len",
+}
+
+BENGALI_KEYWORDS = {
+    "jodi": "if",
+    "nahole jodi": "elif",
+    "nahole": "else",
+    "jotokkhon": "while",
+    "protiti": "for",
+    "moddhe": "in",
+    "dekhao": "print",
+    "lekho": "print",
+    "kaj": "def",
+    "ferot dao": "return",
+    "ferot": "return",
+    "sotti": "True",
+    "mittha": "False",
+    "ebong": "and",
+    "othoba": "or",
+    "thamo": "break",
+}
+
+ASSAMESE_KEYWORDS = {
+    "jodi": "if",
+    "nohole jodi": "elif",
+    "nohole": "else",
+    "dekhuwa": "print",
+    "likha": "print",
+    "ghurai dia": "return",
+    "aru": "and",
+    "ba": "or",
+    "nohoy": "not",
+}
+
+PRINT = "print"
+BUILTIN_NAMES = frozenset(dir(builtins))
+# Programs using these need the LLM's rewrite (e.g. input() has no stdin in the sandbox)
+UNSUPPORTED_CALLS = frozenset({"input"})
+
+
+class Transpiler(Protocol):
+    def transpile(self, code: str) -> Optional[str]:
+        """Python source for code, or None to fall back to the LLM"""
+
+
+class KeywordTranspiler:
+    """Python with a dialect's keywords: tokens are rewritten in place, then parsed and checked"""
+
+    def __init__(self, slug: str, keywords: Dict[str, str]):
+        self.slug = slug
+        # Phrases by first word, longest first so "warna agar" wins over "warna"
+        self._phrases: Dict[str, List[Tuple[Tuple[str, ...], str]]] = {}
+        for phrase, python in keywords.items():
+            words = tuple(phrase.split())
+            self._phrases.setdefault(words[0], []).append((words, python))
+        for candidates in self._phrases.values():
+            candidates.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def transpile(self, code: str) -> Optional[str]:
+        try:
+            tokens = list(tokenize.generate_tokens(io.StringIO(code).readline))
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            return None
+
+        rewritten, produced = self._rewrite(tokens)
+        try:
+            # Tokens keep their source positions, so comments and layout survive
+            python_code = tokenize.untokenize(rewritten)
+            tree = ast.parse(python_code)
+        except (SyntaxError, ValueError):
+            return None
+        # "show = 3" left alone next to "show(x)" -> print(x) is fine, but a
+        # program that defines a name a keyword was rewritten to is ambiguous
+        if produced & defined_names(tree) or not is_self_contained(tree):
+            return None
+        return python_code
+
+    def _rewrite(self, tokens: List[tokenize.TokenInfo]) -> Tuple[List[tuple], Set[str]]:
+        """Rewritten 5-tuple tokens for untokenize, and the non-keyword names produced"""
+        out: List[tuple] = []
+        produced: Set[str] = set()
+        line_start = True
+        wrap_call = False  # inside "likho x" being rewritten to print(x)
+        previous = None  # last token that wasn't whitespace or a comment
+        prev_end = (1, 0)
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token.type in (tokenize.NEWLINE, tokenize.COMMENT, tokenize.ENDMARKER) and wrap_call:
+                out.append((tokenize.OP, ")", prev_end, prev_end, token.line))
+                wrap_call = False
+
+            match = self._match(tokens, i) if token.type == tokenize.NAME else None
+            if match is not None and previous is not None and previous.string == "." and previous.type == tokenize.OP:
+                match = None  # an attribute, never a keyword
+            wrap = False
+            if match is not None:
+                length, python = match
+                next_token = tokens[i + length] if i + length < len(tokens) else None
+                wrap = (
+                    python == PRINT and line_start and not _is_open_paren(next_token)
+                    and _starts_print_arguments(next_token)
+                )
+                if not keyword.iskeyword(python) and not (wrap or _is_open_paren(next_token)):
+                    match = None  # a variable, parameter or argument name that happens to be a keyword
+
+            if match is None:
+                out.append(tuple(token))
+                prev_end = token.end
+                i += 1
+            else:
+                last = tokens[i + length - 1]
+                out.append((tokenize.NAME, python, token.start, last.end, token.line))
+                if not keyword.iskeyword(python):
+                    produced.add(python)
+                prev_end = last.end
+                i += length
+                # A statement-level print without parentheses takes the rest of the line
+                if wrap:
+                    paren_end = next_token.start if next_token.start[0] == last.end[0] else last.end
+                    out.append((tokenize.OP, "(", last.end, paren_end, token.line))
+                    prev_end = paren_end
+                    wrap_call = not _ends_line(next_token)
+                    if not wrap_call:
+                        out.append((tokenize.OP, ")", prev_end, prev_end, token.line))
+
+            if token.type not in (tokenize.NL, tokenize.COMMENT):
+                previous = tokens[i - 1]
+            line_start = token.type in (tokenize.NEWLINE, tokenize.NL, tokenize.INDENT, tokenize.DEDENT)
+        return out, produced
+
+    def _match(self, tokens: List[tokenize.TokenInfo], start: int) -> Optional[Tuple[int, str]]:
+        for words, python in self._phrases.get(tokens[start].string, ()):
+            end = start + len(words)
+            if end <= len(tokens) and all(
+                tokens[start + offset].type == tokenize.NAME and tokens[start + offset].string == word
+                for offset, word in enumerate(words)
+            ):
+                return len(words), python
+        return None
+
+
+def _is_open_paren(token: Optional[tokenize.TokenInfo]) -> bool:
+    return token is not None and token.type == tokenize.OP and token.string == "("
+
+
+def _ends_line(token: Optional[tokenize.TokenInfo]) -> bool:
+    return token is None or token.type in (tokenize.NEWLINE, tokenize.COMMENT, tokenize.ENDMARKER)
+
+
+def _starts_print_arguments(token: Optional[tokenize.TokenInfo]) -> bool:
+    """True if token can follow a paren-less print: a value, or the end of the line"""
+    if _ends_line(token):
+        return True
+    if token.type == tokenize.OP:
+        return token.string in ("[", "{", "-", "+", "~")
+    return token.type in (tokenize.NAME, tokenize.NUMBER, tokenize.STRING)
+
+
+def defined_names(tree: ast.AST) -> Set[str]:
+    """Names the program binds: assignment targets, defs, parameters, imports"""
+    defined = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            defined.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            defined.add(node.name)
+        elif isinstance(node, ast.arg):
+            defined.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                defined.add((alias.asname or alias.name).split(".")[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            defined.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            defined.update(node.names)
+        elif isinstance(node, ast.MatchAs) and node.name:
+            defined.add(node.name)
+        elif isinstance(node, ast.MatchStar) and node.name:
+            defined.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            defined.add(node.rest)
+    return defined
+
+
+def is_self_contained(tree: ast.Module) -> bool:
+    """
+    True if the program reads only names it defines, imports or gets from
+    builtins, avoids UNSUPPORTED_CALLS and has no bare top-level values.
+    """
+    for statement in tree.body:
+        if isinstance(statement, ast.Expr) and not isinstance(statement.value, ast.Call):
+            return False
+
+    loaded = {
+        node.id for node in ast.walk(tree) if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load)
+    }
+    if loaded & UNSUPPORTED_CALLS:
+        return False
+    return not (loaded - defined_names(tree) - BUILTIN_NAMES)
+
+
+class TranspilerRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._transpilers: Dict[str, Transpiler] = {}
+        self._default: Transpiler = KeywordTranspiler("python", {})
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def register(self, slug: str, transpiler: Transpiler) -> None:
+        self._transpilers[normalize_slug(slug)] = transpiler
+
+    def get(self, slug: str) -> Transpiler:
+        return self._transpilers.get(normalize_slug(slug), self._default)
+
+    def transpile(self, slug: str, code: str) -> Optional[str]:
+        """Python for code in the language slug, or None when the LLM is needed"""
+        if not self.enabled:
+            return None
+        try:
+            python_code = self.get(slug).transpile(code)
+        except Exception as e:
+            # A transpiler bug must not fail the run; the LLM still can
+            print(f"⚠️ Transpiler for '{slug}' failed: {str(e)}")
+            python_code = None
+        # Slugs come from requests; only registered ones get their own counters
+        counted = normalize_slug(slug) if normalize_slug(slug) in self._transpilers else "other"
+        self._count(counted, "transpiled" if python_code is not None else "fallbacks")
+        return python_code
+
+    def load_file(self, path: str) -> None:
+        with open(path, encoding="utf-8") as f:
+            for slug, keywords in json.load(f).items():
+                self.register(slug, KeywordTranspiler(slug, keywords))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "dialects": sorted(self._transpilers),
+                "by_language": {slug: dict(counts) for slug, counts in self._counters.items()},
+            }
+
+    def _count(self, slug: str, counter: str) -> None:
+        with self._lock:
+            counts = self._counters.setdefault(slug, {"transpiled": 0, "fallbacks": 0})
+            counts[counter] += 1
+
+
+def normalize_slug(slug: str) -> str:
+    return (slug or "").strip().lower()
+
+
+transpilers = TranspilerRegistry(enabled=TRANSPILER_ENABLED)
+transpilers.register("english", KeywordTranspiler("english", ENGLISH_KEYWORDS))
+transpilers.register("hindi", KeywordTranspiler("hindi", HINDI_KEYWORDS))
+transpilers.register("bengali", KeywordTranspiler("bengali", BENGALI_KEYWORDS))
+transpilers.register("assamese", KeywordTranspiler("assamese", ASSAMESE_KEYWORDS))
+if TRANSPILER_DIALECTS_FILE:
+    transpilers.load_file(TRANSPILER_DIALECTS_FILE)
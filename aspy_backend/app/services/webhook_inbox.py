@@ -0,0 +1,349 @@
+"""
+Webhook inbox: acknowledge provider events fast, apply them in the background.
+
+The webhook endpoint only verifies the signature and inserts the raw event
+into `webhook_events` (one row per provider event id, so redeliveries are
+no-ops). A background thread in each worker then applies due events:
+
+- idempotently: a payment is applied once, keyed by its provider payment id
+- in order per subscription: an event waits while an earlier one with the
+  same ordering key is still pending or being processed
+- with retries: a failed event is retried with exponential backoff, and
+  after WEBHOOK_MAX_ATTEMPTS it is parked as `failed` for an admin to retry
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+
+from app.db.session import SessionLocal
+from app.models.invoice import Invoice
+from app.models.payment import Payment, PaymentStatus
+from app.models.subscription import Plan
+from app.models.user import User
+from app.models.webhook_event import WebhookEvent
+from app.services.entitlements import activate_paid_plan, entitlements
+
+WEBHOOK_WORKER_ENABLED = os.getenv("WEBHOOK_WORKER", "true").lower() in ("1", "true", "yes")
+# Idle workers look for due retries this often; new events wake them at once
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "5"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_RETRY_BASE_SECONDS = int(os.getenv("WEBHOOK_RETRY_BASE_SECONDS", "10"))
+WEBHOOK_RETRY_MAX_SECONDS = int(os.getenv("WEBHOOK_RETRY_MAX_SECONDS", "3600"))
+# An event left `processing` this long (its worker died) is picked up again
+WEBHOOK_LOCK_TIMEOUT_SECONDS = int(os.getenv("WEBHOOK_LOCK_TIMEOUT_SECONDS", "300"))
+
+PENDING = "pending"
+PROCESSING = "processing"
+PROCESSED = "processed"
+FAILED = "failed"
+
+
+def razorpay_ordering_key(data: dict) -> Optional[str]:
+    """Events for the same subscription (or, failing that, the same user) are applied in order"""
+    payload = data.get("payload") or {}
+    subscription = (payload.get("subscription") or {}).get("entity") or {}
+    if subscription.get("id"):
+        return f"subscription:{subscription['id']}"
+
+    for name in ("invoice", "payment"):
+        entity = (payload.get(name) or {}).get("entity") or {}
+        if entity.get("subscription_id"):
+            return f"subscription:{entity['subscription_id']}"
+
+    notes = ((payload.get("payment") or {}).get("entity") or {}).get("notes") or {}
+    if isinstance(notes, dict) and notes.get("user_id"):
+        return f"user:{notes['user_id']}"
+    return None
+
+
+def apply_payment_captured(db: Session, data: dict) -> List[int]:
+    """Record the payment and activate the plan; returns the user ids whose entitlements changed"""
+    payment = data["payload"]["payment"]["entity"]
+
+    # Already applied: an earlier delivery, or the checkout's /payments/razorpay/verify
+    if db.query(Payment.id).filter(Payment.provider_payment_id == payment["id"]).first():
+        return []
+
+    notes = payment.get("notes") or {}
+    user_id = notes.get("user_id")
+    plan_id = notes.get("plan_id")
+    if not user_id or not plan_id:
+        return []
+
+    # Notes arrive as strings; asyncpg will not coerce them for integer columns
+    user = db.get(User, int(user_id))
+    plan = db.get(Plan, int(plan_id))
+    if not user or not plan:
+        return []
+
+    now = datetime.utcnow()
+    razorpay_subscription_id = payment.get("subscription_id")
+    subscription = activate_paid_plan(db, user.id, plan.id, razorpay_subscription_id)
+
+    paid_at = datetime.fromtimestamp(payment["created_at"])
+    new_payment = Payment(
+        user_id=user.id,
+        subscription_id=subscription.id,
+        amount=payment["amount"] / 100,
+        currency=payment["currency"],
+        status=PaymentStatus.COMPLETED,
+        provider="razorpay",
+        provider_payment_id=payment["id"],
+        provider_order_id=razorpay_subscription_id or payment.get("order_id"),
+        razorpay_invoice_id=payment.get("invoice_id"),
+        payment_method_details={"method": payment.get("method", "razorpay"), "id": payment["id"]},
+        created_at=paid_at,
+        completed_at=now
+    )
+    db.add(new_payment)
+    db.flush()
+
+    # Settle the invoice the checkout left pending, so verify finds the payment
+    # already recorded instead of a second invoice appearing
+    invoice = _pending_checkout_invoice(db, user.id, plan.id, razorpay_subscription_id)
+    if invoice is None:
+        invoice = Invoice(user_id=user.id, plan_id=plan.id, currency=payment["currency"])
+        db.add(invoice)
+    invoice.subscription_id = subscription.id
+    invoice.payment_id = new_payment.id
+    invoice.amount = payment["amount"] / 100
+    invoice.status = 'paid'
+    invoice.paid_at = paid_at
+    return [user.id]
+
+
+def _pending_checkout_invoice(db: Session, user_id: int, plan_id: int,
+                              razorpay_subscription_id: Optional[str]) -> Optional[Invoice]:
+    query = db.query(Invoice).filter(Invoice.user_id == user_id, Invoice.status == 'pending')
+    if razorpay_subscription_id:
+        query = query.filter(Invoice.razorpay_order_id == razorpay_subscription_id)
+    else:
+        query = query.filter(Invoice.plan_id == plan_id)
+    return query.order_by(Invoice.id.desc()).first()
+
+
+# Event types without a handler are stored and marked processed
+RAZORPAY_HANDLERS: Dict[str, Callable[[Session, dict], List[int]]] = {
+    "payment.captured": apply_payment_captured,
+}
+
+
+async def enqueue_event(db: AsyncSession, provider: str, event_id: str, event_type: str,
+                        ordering_key: Optional[str], payload: str) -> bool:
+    """Store a verified event; False if it was already received (a redelivery)"""
+    db.add(WebhookEvent(
+        provider=provider,
+        event_id=event_id,
+        event_type=event_type,
+        ordering_key=ordering_key,
+        payload=payload,
+        status=PENDING,
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        webhook_inbox.count("duplicates")
+        return False
+    webhook_inbox.count("received")
+    webhook_inbox.notify()
+    return True
+
+
+class WebhookInbox:
+    """
+    Applies stored webhook events from a background thread in each worker.
+    Workers claim events with a conditional UPDATE, so several processes can
+    share the table without applying an event twice.
+    """
+
+    def __init__(self, poll_seconds: float, batch_size: int, max_attempts: int,
+                 retry_base_seconds: int, retry_max_seconds: int, lock_timeout_seconds: int):
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lock_timeout_seconds = lock_timeout_seconds
+        self._handlers = {"razorpay": RAZORPAY_HANDLERS}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"received": 0, "duplicates": 0, "processed": 0, "retries": 0, "failed": 0}
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="webhook-inbox", daemon=True)
+        self._thread.start()
+        print(f"📬 Webhook inbox worker started (polling every {self.poll_seconds}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def notify(self) -> None:
+        """Wake this worker's thread; called after an event is stored"""
+        self._wake.set()
+
+    def count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[counter] += n
+
+    def process_due(self, db: Session) -> int:
+        """Apply up to batch_size due events; returns how many were claimed"""
+        now = datetime.utcnow()
+        # Reclaim events whose worker died mid-way
+        db.execute(
+            update(WebhookEvent)
+            .where(
+                WebhookEvent.status == PROCESSING,
+                WebhookEvent.locked_at < now - timedelta(seconds=self.lock_timeout_seconds)
+            )
+            .values(status=PENDING, locked_at=None)
+        )
+        db.commit()
+
+        earlier = aliased(WebhookEvent)
+        blocked = select(earlier.id).where(
+            earlier.ordering_key == WebhookEvent.ordering_key,
+            earlier.id < WebhookEvent.id,
+            earlier.status.in_((PENDING, PROCESSING))
+        ).exists()
+        due_ids = db.execute(
+            select(WebhookEvent.id)
+            .where(
+                WebhookEvent.status == PENDING,
+                WebhookEvent.next_attempt_at <= now,
+                ~blocked
+            )
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+
+        claimed = 0
+        for event_id in due_ids:
+            if self._stop.is_set():
+                break
+            if self._claim(db, event_id):
+                claimed += 1
+                self._process(db, event_id)
+        return claimed
+
+    def retry(self, db: Session, event_id: int) -> Optional[WebhookEvent]:
+        """Queue a failed event again with a fresh set of attempts"""
+        event = db.get(WebhookEvent, event_id)
+        if event is None:
+            return None
+        if event.status == FAILED:
+            event.status = PENDING
+            event.attempts = 0
+            event.next_attempt_at = datetime.utcnow()
+            db.commit()
+            self.notify()
+        return event
+
+    def stats(self, db: Session) -> dict:
+        by_status = dict(
+            db.query(WebhookEvent.status, func.count(WebhookEvent.id)).group_by(WebhookEvent.status).all()
+        )
+        oldest_pending = db.query(func.min(WebhookEvent.received_at)).filter(WebhookEvent.status == PENDING).scalar()
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "worker_running": self._thread is not None,
+            "events": {status: by_status.get(status, 0) for status in (PENDING, PROCESSING, PROCESSED, FAILED)},
+            "oldest_pending_seconds": (
+                round((datetime.utcnow() - oldest_pending).total_seconds(), 1) if oldest_pending else None
+            ),
+            "max_attempts": self.max_attempts,
+            **counters,
+        }
+
+    def _claim(self, db: Session, event_id: int) -> bool:
+        result = db.execute(
+            update(WebhookEvent)
+            .where(and_(WebhookEvent.id == event_id, WebhookEvent.status == PENDING))
+            .values(status=PROCESSING, locked_at=datetime.utcnow(), attempts=WebhookEvent.attempts + 1)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    def _process(self, db: Session, event_id: int) -> None:
+        event = db.get(WebhookEvent, event_id)
+        try:
+            handler = self._handlers.get(event.provider, {}).get(event.event_type)
+            changed_users = handler(db, json.loads(event.payload)) if handler else []
+            # The event's effects and its completion commit together
+            event.status = PROCESSED
+            event.processed_at = datetime.utcnow()
+            event.locked_at = None
+            event.last_error = None
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._schedule_retry(db, event_id, e)
+            return
+
+        self.count("processed")
+        for user_id in changed_users:
+            entitlements.invalidate(user_id)
+
+    def _schedule_retry(self, db: Session, event_id: int, error: Exception) -> None:
+        event = db.get(WebhookEvent, event_id)
+        event.locked_at = None
+        event.last_error = f"{type(error).__name__}: {str(error)}"[:2000]
+        if event.attempts >= self.max_attempts:
+            # Parked: later events for the same key are no longer held back
+            event.status = FAILED
+            self.count("failed")
+            print(f"❌ Webhook event {event.event_id} ({event.event_type}) failed after {event.attempts} attempts: {event.last_error}")
+        else:
+            delay = min(self.retry_base_seconds * 2 ** (event.attempts - 1), self.retry_max_seconds)
+            event.status = PENDING
+            event.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            self.count("retries")
+            print(f"⚠️ Webhook event {event.event_id} ({event.event_type}) failed, retrying in {delay}s: {event.last_error}")
+        db.commit()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.clear()
+            db = SessionLocal()
+            try:
+                claimed = self.process_due(db)
+            except Exception as e:
+                db.rollback()
+                claimed = 0
+                print(f"Webhook inbox poll failed: {str(e)}")
+            finally:
+                db.close()
+            if claimed:
+                # Finishing an event may have unblocked the next one for its key
+                continue
+            self._wake.wait(self.poll_seconds)
+
+
+webhook_inbox = WebhookInbox(
+    poll_seconds=WEBHOOK_POLL_SECONDS,
+    batch_size=WEBHOOK_BATCH_SIZE,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    retry_base_seconds=WEBHOOK_RETRY_BASE_SECONDS,
+    retry_max_seconds=WEBHOOK_RETRY_MAX_SECONDS,
+    lock_timeout_seconds=WEBHOOK_LOCK_TIMEOUT_SECONDS
+)
@@ -1,63 +1,30 @@
 """
 Script to assign free subscriptions to users who don't have any subscription
 """
-import sqlite3
-from datetime import datetime, timedelta
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.db.session import SessionLocal
+from app.services.registration import backfill_free_subscriptions
+import app.models.code_execution, app.models.invoice, app.models.language, app.models.payment  # noqa: F401
 
-db_path = os.path.join(os.path.dirname(__file__), '..', 'dev.db')
 
 def assign_free_subscriptions():
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
+    db = SessionLocal()
     try:
-        # Find the FREE plan ID
-        cursor.execute("SELECT id FROM plans WHERE type = 'FREE' LIMIT 1")
-        result = cursor.fetchone()
-        
-        if not result:
-            print("❌ Error: No FREE plan found. Please run seed_plans.py first.")
-            return
-        
-        free_plan_id = result[0]
-        print(f"Found FREE plan with ID: {free_plan_id}")
-        
-        # Find all users without an active subscription
-        cursor.execute("""
-            SELECT u.id, u.username, u.email
-            FROM users u
-            WHERE NOT EXISTS (
-                SELECT 1 FROM subscriptions s 
-                WHERE s.user_id = u.id AND s.status = 'ACTIVE'
-            )
-        """)
-        
-        users = cursor.fetchall()
-        print(f"Found {len(users)} users without active subscriptions")
-        
-        period_start = datetime.utcnow()
-        # For free plan, set end date far in the future (100 years)
-        period_end = period_start + timedelta(days=36500)
-        
-        for user_id, username, email in users:
-            print(f"  ✓ Creating FREE subscription for user {user_id} ({username}, {email})")
-            
-            cursor.execute("""
-                INSERT INTO subscriptions 
-                (user_id, plan_id, status, current_period_start, current_period_end, cancel_at_period_end, created_at)
-                VALUES (?, ?, 'ACTIVE', ?, ?, 0, ?)
-            """, (user_id, free_plan_id, period_start.isoformat(), period_end.isoformat(), period_start.isoformat()))
-        
-        conn.commit()
-        print(f"\n✅ Successfully created {len(users)} free subscriptions")
-        
+        # Batched inserts instead of one INSERT per user
+        created = backfill_free_subscriptions(db)
+        print(f"\n✅ Successfully created {created} free subscriptions")
+    except ValueError as e:
+        print(f"❌ Error: {e}")
     except Exception as e:
         print(f"❌ Error: {e}")
-        conn.rollback()
+        db.rollback()
         raise
     finally:
-        conn.close()
+        db.close()
 
 if __name__ == "__main__":
     assign_free_subscriptions()
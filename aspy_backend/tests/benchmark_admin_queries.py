@@ -0,0 +1,235 @@
+"""
+Benchmark for GET /admin/users and GET /admin/subscriptions.
+
+Seeds a throwaway SQLite database with N users (a third of them subscribed,
+each with a few code executions and payments) and compares the old per-row
+query loops with the aggregated queries now used by the endpoints.
+
+Usage:
+    python tests/benchmark_admin_queries.py
+    python tests/benchmark_admin_queries.py --users 10000 100000 --limit 100 1000
+
+It also times a deep page of the user list fetched with the deprecated
+`skip` offset against the same page fetched with a keyset cursor.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Never seed the configured database; point the app at a scratch file before it connects
+_db_dir = tempfile.mkdtemp(prefix="admin_bench_")
+os.environ["DATABASE_URL"] = os.getenv(
+    "BENCHMARK_DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+)
+
+from fastapi import Response  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+
+from app.db.base import Base  # noqa: E402
+from app.db.session import SessionLocal, engine  # noqa: E402
+from app.models.user import User, UserType  # noqa: E402
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus  # noqa: E402
+from app.models.code_execution import CodeExecution  # noqa: E402
+from app.models.payment import Payment, PaymentStatus  # noqa: E402
+from app.models import invoice, language, translation_cache  # noqa: E402,F401
+from app.api.v1.admin import get_all_subscriptions, get_all_users  # noqa: E402
+from app.core.pagination import encode_cursor  # noqa: E402
+
+EXECUTIONS_PER_USER = 3
+PAYMENTS_PER_SUBSCRIBER = 3
+BATCH_SIZE = 5000
+SEED_START = datetime(2023, 1, 1)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+def seed(num_users):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        db.execute(insert(Plan), [
+            {"id": 1, "name": "Free", "type": PlanType.FREE, "price": 0, "currency": "INR", "features": {}},
+            {"id": 2, "name": "Pro", "type": PlanType.PRO, "price": 499, "currency": "INR", "features": {}},
+        ])
+
+        for start in range(1, num_users + 1, BATCH_SIZE):
+            ids = range(start, min(start + BATCH_SIZE, num_users + 1))
+            db.execute(insert(User), [
+                {
+                    "id": i,
+                    "username": f"bench{i}",
+                    "email": f"bench{i}@test.com",
+                    "password": "x",
+                    "user_type": UserType.USER,
+                    "is_active": True,
+                    "execution_count": EXECUTIONS_PER_USER,
+                    "created_at": SEED_START + timedelta(minutes=i),
+                }
+                for i in ids
+            ])
+            db.execute(insert(Subscription), [
+                {
+                    "user_id": i,
+                    "plan_id": 2 if i % 2 else 1,
+                    "status": SubscriptionStatus.ACTIVE,
+                    "created_at": SEED_START + timedelta(minutes=i),
+                }
+                for i in ids if i % 3 == 0
+            ])
+            db.execute(insert(Payment), [
+                {
+                    "user_id": i,
+                    "amount": 100 * (n + 1),
+                    "currency": "INR",
+                    "status": PaymentStatus.COMPLETED if n < PAYMENTS_PER_SUBSCRIBER - 1 else PaymentStatus.FAILED,
+                    "provider_payment_id": f"pay_{i}_{n}",
+                    "created_at": datetime(2024, 1, 1) + timedelta(days=n),
+                }
+                for i in ids if i % 3 == 0 for n in range(PAYMENTS_PER_SUBSCRIBER)
+            ])
+            db.execute(insert(CodeExecution), [
+                {"user_id": i, "language": "english", "code": "print(1)", "output": "1"}
+                for i in ids for _ in range(EXECUTIONS_PER_USER)
+            ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def legacy_get_all_users(db, limit):
+    """The pre-aggregation implementation: three queries per listed user"""
+    users = db.query(User).filter(User.user_type == UserType.USER).order_by(
+        User.created_at.desc(), User.id.desc()
+    ).offset(0).limit(limit).all()
+    response = []
+    for user in users:
+        active_subscription = db.query(Subscription).filter(
+            Subscription.user_id == user.id,
+            Subscription.status == SubscriptionStatus.ACTIVE
+        ).first()
+        execution_count = db.query(CodeExecution).filter(
+            CodeExecution.user_id == user.id
+        ).count()
+        response.append({
+            "id": user.id,
+            "subscription_plan": active_subscription.plan.name if active_subscription and active_subscription.plan else None,
+            "execution_count": execution_count,
+        })
+    return response
+
+
+def legacy_get_all_subscriptions(db, limit):
+    """The pre-aggregation implementation: a payment query and two lazy loads per subscription"""
+    subscriptions = db.query(Subscription).order_by(
+        Subscription.created_at.desc(), Subscription.id.desc()
+    ).offset(0).limit(limit).all()
+    response = []
+    for sub in subscriptions:
+        latest_payment = db.query(Payment).filter(
+            Payment.user_id == sub.user_id,
+            Payment.status == PaymentStatus.COMPLETED
+        ).order_by(Payment.created_at.desc()).first()
+        response.append({
+            "id": sub.id,
+            "user_email": sub.user.email if sub.user else "N/A",
+            "plan_name": sub.plan.name if sub.plan else "N/A",
+            "amount_paid": float(latest_payment.amount if latest_payment else 0.0),
+        })
+    return response
+
+
+def compare(old, new, fields):
+    old_view = [tuple(r[f] for f in fields) for r in old]
+    new_view = [tuple(r[f] for f in fields) for r in new]
+    if old_view != new_view:
+        print("  WARNING: results differ between implementations")
+
+
+def measure(label, fn, repeats=3):
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    timings = []
+    try:
+        for _ in range(repeats):
+            db = SessionLocal()
+            try:
+                counter.count = 0
+                start = time.perf_counter()
+                rows = fn(db)
+                timings.append(time.perf_counter() - start)
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+
+    best = min(timings) * 1000
+    print(f"  {label:<12} rows={len(rows):<6} queries={counter.count:<6} best={best:9.1f} ms")
+    return rows
+
+
+def run(user_counts, limits):
+    print("Admin list endpoints benchmark")
+    print("=" * 60)
+    print(f"Database: {engine.url}")
+
+    for num_users in user_counts:
+        start = time.perf_counter()
+        seed(num_users)
+        print(f"\n{num_users} users (seeded in {time.perf_counter() - start:.1f}s)")
+
+        for limit in limits:
+            print(f" /admin/users limit={limit}")
+            old = measure("legacy", lambda db: legacy_get_all_users(db, limit))
+            new = measure("aggregated", lambda db: get_all_users(
+                response=Response(), search=None, cursor=None, skip=0, limit=limit, db=db, current_admin=None
+            ))
+            compare(old, new, ("id", "subscription_plan", "execution_count"))
+
+            print(f" /admin/subscriptions limit={limit}")
+            old = measure("legacy", lambda db: legacy_get_all_subscriptions(db, limit))
+            new = measure("aggregated", lambda db: get_all_subscriptions(
+                response=Response(), cursor=None, skip=0, limit=limit, db=db, current_admin=None
+            ))
+            compare(old, new, ("id", "user_email", "plan_name", "amount_paid"))
+
+            # A page 90% of the way through the list: offset paging vs the cursor for the same position
+            depth = int(num_users * 0.9)
+            db = SessionLocal()
+            try:
+                boundary = db.query(User.created_at, User.id).filter(User.user_type == UserType.USER).order_by(
+                    User.created_at.desc(), User.id.desc()
+                ).offset(depth - 1).first()
+            finally:
+                db.close()
+            cursor = encode_cursor(boundary.created_at, boundary.id)
+
+            print(f" /admin/users limit={limit} at row {depth}")
+            old = measure("skip", lambda db: get_all_users(
+                response=Response(), search=None, cursor=None, skip=depth, limit=limit, db=db, current_admin=None
+            ))
+            new = measure("cursor", lambda db: get_all_users(
+                response=Response(), search=None, cursor=cursor, skip=0, limit=limit, db=db, current_admin=None
+            ))
+            compare(old, new, ("id",))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--limit", type=int, nargs="+", default=[100, 1000])
+    args = parser.parse_args()
+    run(args.users, args.limit)
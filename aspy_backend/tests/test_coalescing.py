@@ -0,0 +1,219 @@
+"""
+Offline tests for single-flight coalescing (app/services/coalescing.py) and
+the streamed translations that lead flights (app/services/translation.py).
+
+    python -m pytest tests/test_coalescing.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import translation  # noqa: E402
+from app.services.coalescing import SingleFlight  # noqa: E402
+
+
+class Call:
+    """An awaitable fn for SingleFlight.do() that finishes when told to"""
+
+    def __init__(self, result="python", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+async def until_waiting(flights: SingleFlight, n: int) -> None:
+    while flights.stats()["waiting"] < n:
+        await asyncio.sleep(0)
+
+
+def test_waiters_receive_the_leaders_result():
+    async def run():
+        flights = SingleFlight("test")
+        call = Call()
+        tasks = [asyncio.ensure_future(flights.do("key", call)) for _ in range(4)]
+        await until_waiting(flights, 3)
+        assert flights.stats()["in_flight"] == 1
+
+        call.release.set()
+        assert await asyncio.gather(*tasks) == ["python"] * 4
+        assert call.calls == 1
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["in_flight"], stats["waiting"], stats["top_keys"]) == (0, 0, [])
+    assert (stats["leaders"], stats["coalesced"], stats["max_waiters"]) == (1, 3, 3)
+
+
+def test_leader_exception_reaches_every_waiter():
+    async def run():
+        flights = SingleFlight("test")
+        call = Call(error=ValueError("model unavailable"))
+        tasks = [asyncio.ensure_future(flights.do("key", call)) for _ in range(3)]
+        await until_waiting(flights, 2)
+
+        call.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert [str(result) for result in results] == ["model unavailable"] * 3
+        assert all(isinstance(result, ValueError) for result in results)
+        assert call.calls == 1
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["in_flight"], stats["waiting"], stats["leader_failures"]) == (0, 0, 1)
+
+
+def test_cancelled_leader_hands_over_to_a_waiter():
+    async def run():
+        flights = SingleFlight("test")
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        await call.started.wait()
+        waiters = [asyncio.ensure_future(flights.do("key", call)) for _ in range(2)]
+        await until_waiting(flights, 2)
+
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        # One waiter leads the retry, the other waits for it
+        while flights.stats()["leaders"] < 2:
+            await asyncio.sleep(0)
+        await until_waiting(flights, 1)
+        call.release.set()
+        assert await asyncio.wait_for(asyncio.gather(*waiters), timeout=1) == ["python", "python"]
+        assert call.calls == 2
+        return flights.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["in_flight"], stats["waiting"], stats["leaders"]) == (0, 0, 2)
+
+
+def test_cancelled_waiter_leaves_the_flight_running():
+    async def run():
+        flights = SingleFlight("test")
+        call = Call()
+        leader = asyncio.ensure_future(flights.do("key", call))
+        waiter = asyncio.ensure_future(flights.do("key", call))
+        await until_waiting(flights, 1)
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert flights.stats()["waiting"] == 0
+
+        call.release.set()
+        assert await leader == "python"
+
+    asyncio.run(run())
+
+
+class FakeStream:
+    """Chunks of a streamed completion; with hold, the model stalls after the first one"""
+
+    def __init__(self, deltas, hold=False):
+        self.deltas = deltas
+        self.resume = asyncio.Event()
+        if not hold:
+            self.resume.set()
+        self.finished = asyncio.Event()
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        for n, delta in enumerate(self.deltas):
+            if n:
+                await self.resume.wait()
+            await asyncio.sleep(0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        self.finished.set()
+
+
+def fake_client(stream: FakeStream):
+    async def create(**kwargs):
+        assert kwargs["stream"]
+        return stream
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+@pytest.fixture
+def streaming(monkeypatch):
+    monkeypatch.setattr(translation.transpilers, "enabled", False)
+    monkeypatch.setattr(translation.translation_cache, "use_db", False)
+    monkeypatch.setattr(translation, "translation_flights", SingleFlight("translation"))
+    translation.translation_cache.clear()
+
+    def setup(deltas, hold=False):
+        stream = FakeStream(deltas, hold)
+        monkeypatch.setattr(translation, "_client", fake_client(stream))
+        monkeypatch.setattr(translation, "_completion_slots", asyncio.Semaphore(1))
+        return stream
+    return setup
+
+
+def test_stream_releases_its_slot_before_the_client_reads_everything(streaming):
+    async def run():
+        stream = streaming(["print(", "'hi'", ")"])
+        chunks = translation.stream_translation("pseudo", "say hi")
+        first = await chunks.__anext__()
+
+        # The client stalls after one chunk; the model finishes regardless
+        await asyncio.wait_for(stream.finished.wait(), timeout=1)
+        await asyncio.wait_for(translation._completion_slots.acquire(), timeout=1)
+        translation._completion_slots.release()
+
+        rest = [chunk async for chunk in chunks]
+        return "".join([first] + rest)
+
+    assert asyncio.run(run()) == "print('hi')"
+
+
+def test_stream_waiter_gets_the_leaders_code(streaming):
+    async def run():
+        streaming(["print(", "1", ")"])
+        chunks = translation.stream_translation("pseudo", "show one")
+        first = await chunks.__anext__()
+        waiter = asyncio.ensure_future(translation.translate_to_python("pseudo", "show one"))
+        await until_waiting(translation.translation_flights, 1)
+
+        rest = [chunk async for chunk in chunks]
+        return "".join([first] + rest), await waiter
+
+    assert asyncio.run(run()) == ("print(1)", "print(1)")
+
+
+def test_stream_client_leaving_hands_over_to_a_waiter(streaming, monkeypatch):
+    async def run():
+        stream = streaming(["print(", "2", ")"], hold=True)
+        chunks = translation.stream_translation("pseudo", "show two")
+        await chunks.__anext__()
+        waiter = asyncio.ensure_future(translation.translate_to_python("pseudo", "show two"))
+        await until_waiting(translation.translation_flights, 1)
+
+        async def complete(key, language, code):
+            return "print(2)"
+        monkeypatch.setattr(translation, "_complete", complete)
+
+        # The client disconnects while the model is still generating
+        await chunks.aclose()
+        python_code = await asyncio.wait_for(waiter, timeout=1)
+        return python_code, stream.finished.is_set(), translation.translation_flights.stats()
+
+    python_code, model_finished, stats = asyncio.run(run())
+    assert (python_code, model_finished) == ("print(2)", False)
+    assert (stats["leaders"], stats["leader_failures"], stats["in_flight"]) == (2, 1, 0)
@@ -0,0 +1,104 @@
+"""
+Offline tests for the generated-code policy and compiled program cache
+(app/services/code_policy.py).
+
+    python -m pytest tests/test_code_policy.py
+"""
+import contextlib
+import io
+import marshal
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.code_policy import SECURITY_ERROR, CompiledProgramCache, compile_program  # noqa: E402
+from app.services.execution_cache import is_deterministic  # noqa: E402
+
+
+@pytest.mark.parametrize("code", [
+    "import os",
+    "import os.path",
+    "from os import system",
+    "import sys, math",
+    "from subprocess import run as r",
+    "import importlib",
+    "__import__('os')",
+    "f = eval\nf('1')",
+    "open('/etc/passwd').read()",
+    "exec ('print(1)')",
+    "print(getattr(print, '__self__'))",
+    "().__class__.__bases__[0].__subclasses__()",
+    "print.__self__.__import__('os')",
+    "print(__builtins__)",
+    # Only allowlisted modules may be imported
+    "import io\nio.open('/etc/passwd').read()",
+    "import timeit\ntimeit.timeit(\"import os; os.system('id')\")",
+    "from io import open as o",
+    "from . import sibling",
+    # Dunders named by strings
+    "import operator\nprint(operator.attrgetter('__class__')(1))",
+    "import operator\nprint(operator.attrgetter('real.__class__')(1))",
+    "print('{0.__class__}'.format(1))",
+    # Code evaluated from strings: typing.get_type_hints() and singledispatch eval annotations
+    "import typing\ndef f(x: \"[__import__('os').popen('id').read()]\"): pass\nprint(typing.get_type_hints(f))",
+    "import typing\nprint(typing.get_type_hints(len))",
+    "x = 1\ncode = \"[__import__('os')]\"",
+    "import functools\n@functools.singledispatch\ndef f(x): pass\n"
+    "@f.register\ndef _(x: \"print('evaluated') or int\"): pass",
+    "def f() -> 'int': pass",
+    "count: 'int' = 1",
+])
+def test_banned_programs_are_rejected(code):
+    assert compile_program(code).error == SECURITY_ERROR
+
+
+@pytest.mark.parametrize("code", [
+    # The old substring check refused these
+    "print('never call eval( on input')",
+    "message = 'import os'\nprint(message)",
+    "import math\nprint(math.sqrt(16))",
+    "class A:\n    def __init__(self):\n        self.x = 1\nprint(A().x, A.__name__)",
+    # Private names are mangled, not dunders
+    "class Account:\n    def __init__(self):\n        self.__balance = 5\n    def balance(self):\n"
+    "        return self.__balance\nprint(Account().balance())",
+    "class P:\n    x = 1\np = P()\nsetattr(p, 'x', 2)\nprint(getattr(p, 'x'), getattr(p, 'y', 0))",
+    "import random, datetime\nprint(random.randint(1, 1), datetime.date(2024, 1, 1))",
+    "def main():\n    print('hi')\nif __name__ == '__main__':\n    main()",
+    "print('_' * 10, '____')",
+    "def add(a: int, b: int = 0) -> int:\n    return a + b\ntotal: int = add(1, 2)\nprint(total)",
+])
+def test_allowed_programs_compile_to_marshalled_code(code):
+    program = compile_program(code)
+    assert program.error is None
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(marshal.loads(program.payload), {"__name__": "__main__"})
+    assert out.getvalue()
+
+
+def test_syntax_errors_are_left_to_the_sandbox():
+    program = compile_program("def f(:")
+    assert program.error is None
+    assert program.payload == "def f(:"
+
+
+def test_determinism_comes_from_the_same_parse():
+    assert compile_program("print(sum(range(5)))").deterministic
+    assert not compile_program("import random\nprint(random.random())").deterministic
+    assert not is_deterministic("import operator\nprint(operator.attrgetter('__class__')(1))")
+
+
+def test_cache_compiles_each_program_once():
+    cache = CompiledProgramCache(max_entries=2, max_bytes=1024 * 1024)
+    first = cache.get("print(1)")
+    assert cache.get("print(1)") is first
+    cache.get("import os")
+    cache.get("import os")
+    cache.get("print(2)")  # evicts print(1)
+    assert cache.stats() == {
+        "entries": 2, "bytes": cache.stats()["bytes"], "max_entries": 2, "max_bytes": 1024 * 1024,
+        "hits": 2, "misses": 3, "rejected": 2, "evictions": 1,
+    }
@@ -0,0 +1,61 @@
+"""
+Offline tests for the connection budget in app/db/config.py: every pool a
+worker opens on the primary counts against DB_MAX_CONNECTIONS, and the
+replica pool against DB_REPLICA_MAX_CONNECTIONS.
+
+    python -m pytest tests/test_db_config.py
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.config import DatabaseSettings  # noqa: E402
+
+PRIMARY = "postgresql://app@primary/desicodes"
+REPLICA = "postgresql://app@replica/desicodes"
+
+
+@pytest.fixture(autouse=True)
+def clean_environment(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith("DB_") or name in ("DATABASE_URL", "WEB_CONCURRENCY"):
+            monkeypatch.delenv(name)
+
+
+def settings(**values) -> DatabaseSettings:
+    return DatabaseSettings(DATABASE_URL=PRIMARY, **values)
+
+
+def test_sync_and_async_pools_both_count_against_the_primary():
+    config = settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3)
+    assert config.connections_per_worker == 30
+    assert config.total_connections == 90
+
+    config = settings(pool_size=10, max_overflow=5, async_pool_size=4, async_max_overflow=0, WEB_CONCURRENCY=3)
+    assert config.connections_per_worker == 19
+    assert config.describe()["total_connections"] == 57
+
+
+def test_budget_rejects_what_only_one_pool_would_fit():
+    # 3 x (10 + 5) = 45 fits, but the async pool doubles it
+    with pytest.raises(ValidationError, match="90 connections exceeds DB_MAX_CONNECTIONS 60"):
+        settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3, max_connections=60)
+    settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3, max_connections=90)
+
+
+def test_replica_is_checked_against_its_own_limit():
+    config = settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3, replica_url=REPLICA)
+    assert config.replica_total_connections == 45
+    assert settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3).replica_total_connections == 0
+
+    with pytest.raises(ValidationError, match="45 replica connections exceeds DB_REPLICA_MAX_CONNECTIONS 40"):
+        settings(pool_size=10, max_overflow=5, WEB_CONCURRENCY=3, replica_url=REPLICA, replica_max_connections=40)
+    settings(
+        pool_size=10, max_overflow=5, WEB_CONCURRENCY=3, replica_url=REPLICA,
+        max_connections=90, replica_max_connections=45,
+    )
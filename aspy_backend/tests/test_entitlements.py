@@ -0,0 +1,142 @@
+"""
+Offline tests for the entitlement cache (app/services/entitlements.py): every
+path that changes a user's subscription invalidates the cached entry, so the
+next lookup on the same worker sees the change instead of waiting out the TTL.
+
+    python -m pytest tests/test_entitlements.py
+"""
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.v1 import payments, subscriptions  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.models.invoice import Invoice  # noqa: E402
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models.webhook_event import WebhookEvent  # noqa: E402
+from app.models import admin_stats, code_execution, language, payment, translation_cache  # noqa: E402,F401
+from app.schemas.payment import RazorpayVerifyRequest  # noqa: E402
+from app.services.entitlements import entitlements  # noqa: E402
+from app.services.webhook_inbox import webhook_inbox  # noqa: E402
+
+USER_ID = 1
+FREE_PLAN_ID = 1
+PRO_PLAN_ID = 2
+RAZORPAY_SUBSCRIPTION_ID = "sub_mock_1"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(entitlements, "ttl_seconds", 3600)
+    entitlements.clear()
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    session.add_all([
+        Plan(id=FREE_PLAN_ID, name="Free", type=PlanType.FREE, price=0, currency="INR"),
+        Plan(id=PRO_PLAN_ID, name="Pro", type=PlanType.PRO, price=49900, currency="INR"),
+        User(id=USER_ID, username="learner", email="learner@example.com", password="x"),
+    ])
+    session.flush()
+    session.add(Subscription(
+        user_id=USER_ID, plan_id=FREE_PLAN_ID, status=SubscriptionStatus.ACTIVE,
+        current_period_start=datetime.utcnow(), current_period_end=datetime.utcnow() + timedelta(days=36500)
+    ))
+    session.add(Invoice(
+        user_id=USER_ID, plan_id=PRO_PLAN_ID, amount=499, currency="INR", status="pending",
+        razorpay_order_id=RAZORPAY_SUBSCRIPTION_ID
+    ))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+        entitlements.clear()
+
+
+def user(db: Session) -> User:
+    return db.get(User, USER_ID)
+
+
+def cached_plan(db: Session) -> str:
+    """Resolve twice: the second lookup must be a cache hit"""
+    entitlements.resolve(db, USER_ID)
+    hits = entitlements.hits
+    plan = entitlements.resolve(db, USER_ID)
+    assert entitlements.hits == hits + 1
+    return plan.plan_name
+
+
+def next_lookup_is_a_miss(db: Session):
+    misses = entitlements.misses
+    plan = entitlements.resolve(db, USER_ID)
+    assert entitlements.misses == misses + 1
+    return plan
+
+
+def test_payment_verify_invalidates(db):
+    assert cached_plan(db) == "Free"
+    request = RazorpayVerifyRequest(
+        razorpay_order_id=RAZORPAY_SUBSCRIPTION_ID, razorpay_payment_id="pay_1", razorpay_signature="mock"
+    )
+    payments.verify_razorpay_payment(request, db=db, current_user=user(db))
+    plan = next_lookup_is_a_miss(db)
+    assert (plan.plan_name, plan.is_paid, plan.execution_limit) == ("Pro", True, None)
+
+
+def test_webhook_activation_invalidates(db):
+    assert cached_plan(db) == "Free"
+    entity = {
+        "id": "pay_1", "amount": 49900, "currency": "INR", "created_at": 1700000000, "method": "card",
+        "subscription_id": RAZORPAY_SUBSCRIPTION_ID,
+        "notes": {"user_id": str(USER_ID), "plan_id": str(PRO_PLAN_ID)},
+    }
+    db.add(WebhookEvent(
+        provider="razorpay", event_id="evt_1", event_type="payment.captured", status="pending", attempts=0,
+        payload=json.dumps({"event": "payment.captured", "payload": {"payment": {"entity": entity}}}),
+        next_attempt_at=datetime.utcnow() - timedelta(seconds=1)
+    ))
+    db.commit()
+
+    assert webhook_inbox.process_due(db) == 1
+    assert next_lookup_is_a_miss(db).plan_name == "Pro"
+
+
+def test_subscription_cancel_invalidates(db):
+    assert cached_plan(db) == "Free"
+    subscription_id = entitlements.resolve(db, USER_ID).subscription_id
+    subscriptions.cancel_subscription(subscription_id, db=db, current_user=user(db))
+    plan = next_lookup_is_a_miss(db)
+    assert not plan.has_active_subscription
+
+
+def test_cancel_at_period_end_and_resume_invalidate(db):
+    assert cached_plan(db) == "Free"
+    assert payments.cancel_subscription(db=db, current_user=user(db))["status"] == "success"
+    next_lookup_is_a_miss(db)
+
+    assert cached_plan(db) == "Free"
+    assert payments.resume_subscription(db=db, current_user=user(db))["status"] == "success"
+    next_lookup_is_a_miss(db)
+
+
+def test_cached_entry_is_stale_without_invalidation(db):
+    # What the tests above guard against: a write the cache isn't told about
+    assert cached_plan(db) == "Free"
+    db.query(Subscription).filter(Subscription.user_id == USER_ID).update({"plan_id": PRO_PLAN_ID})
+    db.commit()
+    assert entitlements.resolve(db, USER_ID).plan_name == "Free"
+    assert entitlements.resolve(db, USER_ID, fresh=True).plan_name == "Pro"
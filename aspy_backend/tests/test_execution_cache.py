@@ -0,0 +1,66 @@
+"""
+Offline tests for the memoized results of deterministic programs
+(app/services/execution_cache.py).
+
+    python -m pytest tests/test_execution_cache.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.execution_cache import ExecutionResultCache, is_deterministic  # noqa: E402
+from app.services.sandbox import STATUS_OK, STATUS_TIMEOUT, SandboxResult  # noqa: E402
+
+
+@pytest.mark.parametrize("code", [
+    "print(sum(range(10)))",
+    "import math\nprint(math.sqrt(16))",
+    "from collections import Counter\ncounts = Counter('hello')\ncounts['z'] += 1\nprint(counts)",
+    "from decimal import getcontext, Decimal\ngetcontext().prec = 5\nprint(Decimal(1) / 7)",
+    "import json\ndata = json.loads('{}')\ndata['a'] = 1\nprint(data)",
+    "print('_' * 10, '____')\nif __name__ == '__main__':\n    print('main')",
+    "def f(:",
+])
+def test_deterministic_programs(code):
+    assert is_deterministic(code)
+
+
+@pytest.mark.parametrize("code", [
+    "import random\nprint(random.random())",
+    "print(input())",
+    "print({'a', 'b'})",
+    # Patching a module
+    "import math\nmath.pi = 3\nprint(math.pi)",
+    "import math as m\nm.pi += 1",
+    "from collections import OrderedDict\nOrderedDict.extra = 1",
+    "import json\ndel json.dumps",
+    "import string\nstring.digits, x = 'abc', 1",
+    "import json\njson.decoder.scanstring = None",
+    # typing.get_type_hints() evaluates string annotations
+    "import typing\ndef f(x: 'int'): pass\nprint(typing.get_type_hints(f))",
+    # A dunder anywhere in a string, not only at its start
+    "def f(x: \"[__import__('os').popen('id').read()]\"): pass",
+])
+def test_nondeterministic_programs(code):
+    assert not is_deterministic(code)
+
+
+def result(status=STATUS_OK, isolated=True) -> SandboxResult:
+    return SandboxResult("4\n", "", status, 1.0, isolated)
+
+
+def test_only_isolated_finished_runs_are_admitted():
+    cache = ExecutionResultCache(max_entries=10, max_bytes=10000)
+    code = "print(2 + 2)"
+
+    assert not cache.offer(code, result(isolated=False))
+    assert not cache.offer(code, result(status=STATUS_TIMEOUT))
+    assert cache.get(code) is None
+
+    assert cache.offer(code, result())
+    assert cache.get(code).stdout == "4\n"
+    stats = cache.stats()
+    assert (stats["rejected_unisolated"], stats["rejected_status"], stats["admitted"]) == (1, 1, 1)
@@ -0,0 +1,70 @@
+"""
+Offline tests for the social login provider calls (app/services/oauth.py):
+whatever a provider answers, login fails with an OAuthError (a 401 by
+default), never an unhandled exception.
+
+    python -m pytest tests/test_oauth.py
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import httpx
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services import oauth  # noqa: E402
+from app.services.oauth import OAuthError, fetch_github_profile, fetch_google_profile  # noqa: E402
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Answer provider requests from a {url: (status, body)} map"""
+    def setup(responses: dict):
+        def handle(request: httpx.Request) -> httpx.Response:
+            status, body = responses[str(request.url)]
+            return httpx.Response(status, content=body)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handle))
+        monkeypatch.setattr(oauth, "get_http_client", lambda: client)
+    return setup
+
+
+def test_google_profile(provider):
+    provider({oauth.GOOGLE_USERINFO_URL: (200, b'{"email": "a@example.com", "name": "A"}')})
+    profile = asyncio.run(fetch_google_profile("token"))
+    assert (profile.email, profile.name) == ("a@example.com", "A")
+
+
+@pytest.mark.parametrize("status, body", [
+    (200, b"<html>upstream proxy error</html>"),
+    (200, b'["not", "an", "object"]'),
+    (401, b'{"error": "invalid_token"}'),
+])
+def test_google_bad_response_is_an_auth_failure(provider, status, body):
+    provider({oauth.GOOGLE_USERINFO_URL: (status, body)})
+    with pytest.raises(OAuthError) as error:
+        asyncio.run(fetch_google_profile("token"))
+    assert (error.value.status_code, error.value.detail) == (401, "Invalid Google Token")
+
+
+@pytest.mark.parametrize("responses", [
+    {oauth.GITHUB_TOKEN_URL: (200, b"not json")},
+    {
+        oauth.GITHUB_TOKEN_URL: (200, b'{"access_token": "t"}'),
+        oauth.GITHUB_USER_URL: (200, b"not json"),
+        oauth.GITHUB_EMAILS_URL: (200, b"[]"),
+    },
+    {
+        oauth.GITHUB_TOKEN_URL: (200, b'{"access_token": "t"}'),
+        oauth.GITHUB_USER_URL: (200, b'{"login": "a"}'),
+        oauth.GITHUB_EMAILS_URL: (200, b"not json"),
+    },
+])
+def test_github_bad_response_is_an_auth_failure(provider, monkeypatch, responses):
+    monkeypatch.setenv("GITHUB_CLIENT_ID", "id")
+    monkeypatch.setenv("GITHUB_CLIENT_SECRET", "secret")
+    provider(responses)
+    with pytest.raises(OAuthError) as error:
+        asyncio.run(fetch_github_profile("code"))
+    assert error.value.status_code == 401
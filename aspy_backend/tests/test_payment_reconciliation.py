@@ -0,0 +1,225 @@
+"""
+Offline tests for reconciling a Razorpay checkout: the payment.captured
+webhook (app/services/webhook_inbox.py) and /payments/razorpay/verify
+(app/api/v1/payments.py) may arrive in either order, or race, and must
+leave one payment, one paid invoice and one active subscription.
+
+    python -m pytest tests/test_payment_reconciliation.py
+"""
+import hashlib
+import hmac
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+import razorpay
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.v1 import payments  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.models.invoice import Invoice  # noqa: E402
+from app.models.payment import Payment, PaymentStatus  # noqa: E402
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models import admin_stats, code_execution, language, translation_cache, webhook_event  # noqa: E402,F401
+from app.schemas.payment import RazorpayVerifyRequest  # noqa: E402
+from app.services.entitlements import PAID_PLAN_PERIOD  # noqa: E402
+from app.services.webhook_inbox import apply_payment_captured  # noqa: E402
+
+USER_ID = 1
+FREE_PLAN_ID = 1
+PRO_PLAN_ID = 2
+RAZORPAY_SUBSCRIPTION_ID = "sub_mock_1"
+RAZORPAY_PAYMENT_ID = "pay_1"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    session.add_all([
+        Plan(id=FREE_PLAN_ID, name="Free", type=PlanType.FREE, price=0, currency="INR"),
+        Plan(id=PRO_PLAN_ID, name="Pro", type=PlanType.PRO, price=49900, currency="INR"),
+        User(id=USER_ID, username="payer", email="payer@example.com", password="x"),
+    ])
+    session.flush()
+    # What registration and checkout leave behind
+    session.add(Subscription(
+        user_id=USER_ID, plan_id=FREE_PLAN_ID, status=SubscriptionStatus.ACTIVE,
+        current_period_start=datetime.utcnow(), current_period_end=datetime.utcnow() + timedelta(days=36500)
+    ))
+    session.add(Invoice(
+        user_id=USER_ID, plan_id=PRO_PLAN_ID, amount=499, currency="INR", status="pending",
+        razorpay_order_id=RAZORPAY_SUBSCRIPTION_ID
+    ))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def captured_event(subscription_id=RAZORPAY_SUBSCRIPTION_ID) -> dict:
+    entity = {
+        "id": RAZORPAY_PAYMENT_ID, "amount": 49900, "currency": "INR", "created_at": 1700000000,
+        "method": "card", "notes": {"user_id": str(USER_ID), "plan_id": str(PRO_PLAN_ID)},
+    }
+    if subscription_id:
+        entity["subscription_id"] = subscription_id
+    return {"event": "payment.captured", "payload": {"payment": {"entity": entity}}}
+
+
+def deliver_webhook(db: Session, event: dict = None) -> list:
+    changed = apply_payment_captured(db, event or captured_event())
+    db.commit()
+    return changed
+
+
+def verify(db: Session, signature: str = "mock", subscription_id: str = RAZORPAY_SUBSCRIPTION_ID) -> dict:
+    request = RazorpayVerifyRequest(
+        razorpay_order_id=subscription_id,
+        razorpay_payment_id=RAZORPAY_PAYMENT_ID,
+        razorpay_signature=signature
+    )
+    return payments.verify_razorpay_payment(request, db=db, current_user=db.get(User, USER_ID))
+
+
+def assert_reconciled(db: Session) -> None:
+    db.expire_all()
+    payment, = db.query(Payment).all()
+    assert (payment.provider_payment_id, payment.status) == (RAZORPAY_PAYMENT_ID, PaymentStatus.COMPLETED)
+
+    invoice, = db.query(Invoice).all()
+    assert (invoice.status, invoice.payment_id) == ("paid", payment.id)
+
+    active = db.query(Subscription).filter(
+        Subscription.user_id == USER_ID, Subscription.status == SubscriptionStatus.ACTIVE
+    ).all()
+    assert len(active) == 1
+    subscription = active[0]
+    assert subscription.plan_id == PRO_PLAN_ID
+    assert subscription.current_period_end - subscription.current_period_start == PAID_PLAN_PERIOD
+    assert payment.subscription_id == invoice.subscription_id == subscription.id
+
+
+def test_verify_then_webhook(db):
+    assert verify(db)["status"] == "success"
+    assert deliver_webhook(db) == []
+    assert_reconciled(db)
+
+
+def test_webhook_then_verify(db):
+    assert deliver_webhook(db) == [USER_ID]
+    response = verify(db)
+    assert (response["status"], response["payment_id"], response["amount"]) == ("success", RAZORPAY_PAYMENT_ID, 499.0)
+    assert_reconciled(db)
+
+
+def test_webhook_without_subscription_id_settles_checkout_invoice(db):
+    deliver_webhook(db, captured_event(subscription_id=None))
+    assert verify(db)["status"] == "success"
+    assert_reconciled(db)
+
+
+def first_check_misses(monkeypatch, before_miss=lambda db: None) -> list:
+    """Make verify's first look for a recorded payment come back empty"""
+    recorded = payments._recorded_payment
+    calls = []
+
+    def check(db, provider_payment_id, user_id):
+        calls.append(provider_payment_id)
+        if len(calls) == 1:
+            before_miss(db)
+            return None
+        return recorded(db, provider_payment_id, user_id)
+
+    monkeypatch.setattr(payments, "_recorded_payment", check)
+    return calls
+
+
+def test_webhook_landing_during_verify(db, monkeypatch):
+    # The webhook commits after verify's first check and settles the invoice
+    # verify was about to look up
+    def webhook(db):
+        other = Session(bind=db.get_bind())
+        deliver_webhook(other)
+        other.close()
+
+    calls = first_check_misses(monkeypatch, webhook)
+    assert verify(db)["status"] == "success"
+    assert len(calls) == 2
+    assert_reconciled(db)
+
+
+def test_duplicate_payment_insert_returns_recorded_payment(db, monkeypatch):
+    # The other writer's row is only visible once verify's insert collides with it
+    db.add(Payment(
+        user_id=USER_ID, amount=499, currency="INR", status=PaymentStatus.COMPLETED,
+        provider_payment_id=RAZORPAY_PAYMENT_ID
+    ))
+    db.commit()
+    calls = first_check_misses(monkeypatch)
+
+    response = verify(db)
+    assert (response["status"], response["payment_id"]) == ("success", RAZORPAY_PAYMENT_ID)
+    assert len(calls) == 2
+    assert db.query(Payment).count() == 1
+
+
+def test_verify_rejects_another_users_payment(db):
+    db.add(User(id=2, username="other", email="other@example.com", password="x"))
+    db.commit()
+    event = captured_event()
+    event["payload"]["payment"]["entity"]["notes"]["user_id"] = "2"
+    deliver_webhook(db, event)
+
+    with pytest.raises(payments.HTTPException) as error:
+        verify(db)
+    assert error.value.status_code == 400
+
+
+KEY_SECRET = "test_secret"
+
+
+@pytest.fixture
+def live_keys(monkeypatch):
+    """Razorpay configured with real-looking keys; nothing here reaches the network"""
+    monkeypatch.setattr(payments, "RAZORPAY_KEY_ID", "rzp_test_key")
+    monkeypatch.setattr(payments, "razorpay_client", razorpay.Client(auth=("rzp_test_key", KEY_SECRET)))
+
+
+def signature(payment_id: str, subscription_id: str) -> str:
+    return hmac.new(KEY_SECRET.encode(), f"{payment_id}|{subscription_id}".encode(), hashlib.sha256).hexdigest()
+
+
+def test_signed_verify_after_webhook_succeeds(db, live_keys):
+    deliver_webhook(db)
+    assert verify(db, signature(RAZORPAY_PAYMENT_ID, RAZORPAY_SUBSCRIPTION_ID))["status"] == "success"
+    assert_reconciled(db)
+
+
+@pytest.mark.parametrize("forged", [
+    "0" * 64,
+    signature(RAZORPAY_PAYMENT_ID, "sub_other"),
+])
+def test_forged_verify_is_rejected_even_when_webhook_recorded_the_payment(db, live_keys, forged):
+    deliver_webhook(db)
+    with pytest.raises(payments.HTTPException) as error:
+        verify(db, forged)
+    assert (error.value.status_code, error.value.detail) == (400, "Invalid payment signature")
+
+
+def test_mock_subscription_id_does_not_skip_the_signature_with_live_keys(db, live_keys):
+    with pytest.raises(payments.HTTPException) as error:
+        verify(db, "mock", subscription_id="sub_mock_1")
+    assert error.value.status_code == 400
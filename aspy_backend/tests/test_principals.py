@@ -0,0 +1,113 @@
+"""
+Offline tests for the principal cache (app/services/principals.py): the
+authenticated user is served from memory, so every write that changes who a
+token resolves to, or whether it is allowed in, must invalidate the entry.
+
+    python -m pytest tests/test_principals.py
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api.v1 import admin, users  # noqa: E402
+from app.core.security import create_access_token, get_current_user  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.models.user import User, UserType  # noqa: E402
+from app.models import (  # noqa: E402,F401
+    admin_stats, code_execution, invoice, language, payment, subscription, translation_cache, webhook_event,
+)
+from app.schemas.user import UserProfileUpdate  # noqa: E402
+from app.services.principals import principals  # noqa: E402
+
+ADMIN_ID = 1
+USER_ID = 2
+EMAIL = "learner@example.com"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(principals, "ttl_seconds", 3600)
+    principals.clear()
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    session.add_all([
+        User(id=ADMIN_ID, username="admin", email="admin@example.com", password="x", user_type=UserType.ADMIN),
+        User(id=USER_ID, username="learner", email=EMAIL, password="x"),
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+        principals.clear()
+
+
+def authenticate(db: Session, email: str = EMAIL) -> User:
+    """What get_current_user does for a request carrying a token for email"""
+    token = create_access_token({"sub": email, "user_id": USER_ID})
+    return get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+
+
+def cache(db: Session) -> None:
+    authenticate(db)
+    hits = principals.hits
+    assert authenticate(db).username == "learner"
+    assert principals.hits == hits + 1
+
+
+def an_admin(db: Session) -> User:
+    return db.get(User, ADMIN_ID)
+
+
+def test_admin_deactivating_a_user_locks_them_out(db):
+    cache(db)
+    admin.toggle_user_status(USER_ID, db=db, current_admin=an_admin(db))
+    with pytest.raises(HTTPException) as error:
+        authenticate(db)
+    assert (error.value.status_code, error.value.detail) == (403, "Inactive user")
+
+    admin.toggle_user_status(USER_ID, db=db, current_admin=an_admin(db))
+    assert authenticate(db).is_active
+
+
+def test_admin_deleting_a_user_locks_them_out(db):
+    cache(db)
+    admin.delete_user(USER_ID, db=db, current_admin=an_admin(db))
+    db.expunge_all()
+    with pytest.raises(HTTPException) as error:
+        authenticate(db)
+    assert (error.value.status_code, error.value.detail) == (401, "User not found")
+
+
+def test_email_change_retires_the_old_subject(db):
+    cache(db)
+    profile = UserProfileUpdate(username="renamed", email="new@example.com")
+    users.update_user_profile(profile, db=db, current_user=authenticate(db))
+    db.expunge_all()
+
+    with pytest.raises(HTTPException) as error:
+        authenticate(db)
+    assert error.value.status_code == 401
+    assert authenticate(db, "new@example.com").username == "renamed"
+
+
+def test_cached_entry_is_stale_without_invalidation(db):
+    # What the tests above guard against: a write the cache isn't told about
+    cache(db)
+    db.get(User, USER_ID).is_active = False
+    db.commit()
+    db.expunge_all()
+    assert authenticate(db).username == "learner"
@@ -0,0 +1,137 @@
+"""
+Query-plan regression tests for the hot per-user lookups.
+
+Each query is built the way the endpoint builds it and run through
+EXPLAIN; the test fails if the table is read with a full scan instead of
+one of the indexes declared on the models (and created by migration
+e5a1f7c2b904).
+
+Runs against a throwaway in-memory SQLite database by default:
+    python -m pytest tests/test_query_plans.py
+
+Set TEST_DATABASE_URL to a scratch Postgres database to check Postgres
+plans instead (the schema is created and dropped there). Sequential scans
+are disabled for the session so that tiny test tables don't make the
+planner prefer them; a query that still seq-scans has no usable index.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.db.base import Base  # noqa: E402
+from app.core.pagination import keyset_page  # noqa: E402
+from app.models.user import User  # noqa: E402,F401
+from app.models.subscription import Subscription  # noqa: E402
+from app.models.code_execution import CodeExecution  # noqa: E402
+from app.models.payment import Payment, PaymentStatus  # noqa: E402
+from app.models.invoice import Invoice  # noqa: E402
+from app.models import admin_stats, language, translation_cache  # noqa: E402,F401
+from app.services.entitlements import entitlements  # noqa: E402
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL", "sqlite://")
+USER_ID = 42
+
+
+@pytest.fixture(scope="module")
+def db():
+    if TEST_DATABASE_URL.startswith("sqlite"):
+        engine = create_engine(TEST_DATABASE_URL, poolclass=StaticPool)
+    else:
+        engine = create_engine(TEST_DATABASE_URL)
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    try:
+        yield session
+    finally:
+        session.close()
+        if engine.dialect.name != "sqlite":
+            Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+
+def explain(db: Session, statement) -> str:
+    """The plan for a statement, one line per step"""
+    compiled = statement.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+    if db.bind.dialect.name == "sqlite":
+        rows = db.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}").all()
+        return "\n".join(row[-1] for row in rows)
+
+    db.connection().exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = db.connection().exec_driver_sql(f"EXPLAIN {compiled}").all()
+    return "\n".join(row[0] for row in rows)
+
+
+def assert_uses_index(db: Session, statement, table: str, *indexes: str) -> None:
+    plan = explain(db, statement)
+    if db.bind.dialect.name == "sqlite":
+        steps = [line for line in plan.splitlines() if f" {table} " in f" {line} "]
+        assert steps, f"{table} does not appear in the plan:\n{plan}"
+        for step in steps:
+            assert any(index in step for index in indexes), f"{table} is scanned without {indexes}:\n{plan}"
+    else:
+        assert f"Seq Scan on {table}" not in plan, f"{table} is read with a sequential scan:\n{plan}"
+        assert any(index in plan for index in indexes), f"{table} is read without {indexes}:\n{plan}"
+
+
+def test_execution_count_uses_user_index(db):
+    statement = select(func.count()).select_from(CodeExecution).where(CodeExecution.user_id == USER_ID)
+    assert_uses_index(db, statement, "code_executions", "ix_code_executions_user_id_language_id_created_at")
+
+
+def test_certificate_languages_use_user_index(db):
+    used_languages = select(CodeExecution.language_id).where(
+        CodeExecution.user_id == USER_ID,
+        CodeExecution.language_id != None  # noqa: E711
+    ).distinct()
+    assert_uses_index(db, used_languages, "code_executions", "ix_code_executions_user_id_language_id_created_at")
+
+    first_use = select(CodeExecution.created_at).where(
+        CodeExecution.user_id == USER_ID,
+        CodeExecution.language_id == 1
+    ).order_by(CodeExecution.created_at.asc()).limit(1)
+    assert_uses_index(db, first_use, "code_executions", "ix_code_executions_user_id_language_id_created_at")
+
+
+def test_active_subscription_uses_user_status_index(db):
+    statement = entitlements._active_plan_query(USER_ID)
+    assert_uses_index(db, statement, "subscriptions", "ix_subscriptions_user_id_status")
+
+
+def test_payment_history_uses_user_index(db):
+    query = db.query(Payment).filter(Payment.user_id == USER_ID)
+    page = keyset_page(query, Payment.created_at, Payment.id, None, 50)
+    assert_uses_index(db, page.statement, "payments", "ix_payments_user_id_status_created_at")
+
+
+def test_latest_completed_payment_uses_user_status_index(db):
+    statement = select(Payment.amount).where(
+        Payment.user_id == USER_ID,
+        Payment.status == PaymentStatus.COMPLETED
+    ).order_by(Payment.created_at.desc()).limit(1)
+    assert_uses_index(db, statement, "payments", "ix_payments_user_id_status_created_at")
+
+
+def test_invoice_listing_uses_user_created_index(db):
+    query = db.query(Invoice).filter(Invoice.user_id == USER_ID)
+    page = keyset_page(query, Invoice.created_at, Invoice.id, None, 50)
+    assert_uses_index(db, page.statement, "invoices", "ix_invoices_user_id_created_at")
+
+
+def test_invoice_by_order_id_uses_index(db):
+    statement = select(Invoice).where(Invoice.razorpay_order_id == "sub_test")
+    assert_uses_index(db, statement, "invoices", "ix_invoices_razorpay_order_id")
+
+    # Payment verification also filters by user; either index avoids the scan
+    statement = select(Invoice).where(
+        Invoice.razorpay_order_id == "sub_test",
+        Invoice.user_id == USER_ID,
+        Invoice.status == "pending"
+    ).limit(1)
+    assert_uses_index(db, statement, "invoices", "ix_invoices_razorpay_order_id", "ix_invoices_user_id_created_at")
@@ -0,0 +1,199 @@
+"""
+Offline tests for read-your-writes tracking (app/db/routing.py): writes to a
+user's billing rows, whether flushed by the ORM or executed as Core
+INSERT/UPDATE statements, send that user's next reads to the primary.
+
+    python -m pytest tests/test_read_routing.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from jose import jwt  # noqa: E402
+from sqlalchemy import create_engine, insert, update  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.core.security import ALGORITHM, SECRET_KEY  # noqa: E402
+from app.db import routing  # noqa: E402
+from app.db.base import Base  # noqa: E402
+from app.models.code_execution import CodeExecution  # noqa: E402
+from app.models.subscription import Plan, PlanType, Subscription, SubscriptionStatus  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.models import admin_stats, invoice, language, payment, translation_cache, webhook_event  # noqa: E402,F401
+
+NOW = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def router(monkeypatch):
+    settings = SimpleNamespace(
+        replica_max_lag_seconds=5, replica_health_check_seconds=5, read_your_writes_seconds=60
+    )
+    # Any sessionmaker counts as a configured replica; nothing is read here
+    router = routing.ReadRouter(Session, Session, None, settings)
+    monkeypatch.setattr(routing, "read_router", router)
+    return router
+
+
+@pytest.fixture
+def db(router):
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    session.add(Plan(name="Free", type=PlanType.FREE, price=0))
+    for n in range(1, 6):
+        session.add(User(id=n, username=f"user{n}", email=f"user{n}@example.com", password="x"))
+    session.commit()
+    router._recent_writers.clear()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+def writers(router, user_ids=range(1, 10)) -> set:
+    return {user_id for user_id in user_ids if router.wrote_recently(user_id)}
+
+
+def test_core_update_is_tracked(router, db):
+    db.execute(update(User).where(User.id == 3).values(execution_count=User.execution_count + 1))
+    assert writers(router) == set()  # not until the commit
+    db.commit()
+    assert writers(router) == {3}
+
+
+def test_core_bulk_insert_is_tracked(router, db):
+    db.execute(insert(Subscription), [
+        {"user_id": user_id, "plan_id": 1, "status": SubscriptionStatus.ACTIVE, "created_at": NOW}
+        for user_id in (1, 2, 4)
+    ])
+    db.commit()
+    assert writers(router) == {1, 2, 4}
+
+
+def test_core_insert_with_values_is_tracked(router, db):
+    db.execute(insert(Subscription).values(user_id=5, plan_id=1, status=SubscriptionStatus.ACTIVE))
+    db.commit()
+    assert writers(router) == {5}
+
+
+def test_core_update_with_in_clause_is_tracked(router, db):
+    db.execute(
+        update(Subscription).where(Subscription.user_id.in_([2, 3])).values(cancel_at_period_end=True),
+        execution_options={"synchronize_session": False}
+    )
+    db.commit()
+    assert writers(router) == {2, 3}
+
+
+def test_rolled_back_writes_are_not_tracked(router, db):
+    db.execute(update(User).where(User.id == 3).values(execution_count=5))
+    db.rollback()
+    db.execute(update(User).where(User.id == 4).values(execution_count=5))
+    db.commit()
+    assert writers(router) == {4}
+
+
+def test_orm_flush_is_still_tracked(router, db):
+    db.get(User, 2).is_active = False
+    db.commit()
+    assert writers(router) == {2}
+
+
+def test_untracked_tables_are_ignored(router, db):
+    db.execute(insert(CodeExecution), [{"user_id": 1, "code": "print(1)", "output": "1"}])
+    db.commit()
+    assert writers(router) == set()
+
+
+def test_async_core_update_is_tracked(router, tmp_path):
+    async def run():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'routing.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add(User(id=7, username="async", email="async@example.com", password="x"))
+            await db.commit()
+            router._recent_writers.clear()
+
+            await db.execute(update(User).where(User.id == 7).values(execution_count=User.execution_count + 1))
+            await db.commit()
+        await engine.dispose()
+
+    asyncio.run(run())
+    assert writers(router) == {7}
+
+
+def bearer(user_id: int) -> dict:
+    return {"Authorization": f"Bearer {jwt.encode({'user_id': user_id}, SECRET_KEY, algorithm=ALGORITHM)}"}
+
+
+@pytest.fixture
+def api(router, db, monkeypatch):
+    """An app with a billing write and a routed read, served by "workers" that share nothing"""
+    router.replica_sessionmaker = lambda: Session(info={"server": "replica"})
+    router.primary_sessionmaker = lambda: Session(info={"server": "primary"})
+    monkeypatch.setattr(router, "replica_available", lambda: True)
+
+    app = FastAPI()
+    app.middleware("http")(routing.read_your_writes_middleware)
+
+    @app.post("/users/{user_id}/pay")
+    def pay(user_id: int):
+        db.execute(update(User).where(User.id == user_id).values(execution_count=1))
+        db.commit()
+        # The next request lands on another worker, which never saw this write
+        router._recent_writers.clear()
+        return {}
+
+    @app.get("/history")
+    def history(read_db: Session = Depends(routing.get_read_db)):
+        return {"server": read_db.info["server"]}
+
+    return TestClient(app, base_url="https://testserver")
+
+
+def test_write_claim_sends_reads_to_primary_on_any_worker(api):
+    response = api.post("/users/3/pay", headers=bearer(3))
+    assert routing.READ_YOUR_WRITES_HEADER in response.headers
+    # The cookie comes back on its own
+    assert api.get("/history", headers=bearer(3)).json() == {"server": "primary"}
+
+
+def test_write_claim_header_is_honoured_without_cookies(api):
+    claim = api.post("/users/3/pay", headers=bearer(3)).headers[routing.READ_YOUR_WRITES_HEADER]
+    api.cookies.clear()
+    assert api.get("/history", headers=bearer(3)).json() == {"server": "replica"}
+    headers = {**bearer(3), routing.READ_YOUR_WRITES_HEADER: claim}
+    assert api.get("/history", headers=headers).json() == {"server": "primary"}
+
+
+def test_write_claim_is_only_issued_for_and_accepted_from_the_writer(api):
+    # User 4 paid for user 3 (an admin action, say): 4's own data didn't change
+    assert routing.READ_YOUR_WRITES_HEADER not in api.post("/users/3/pay", headers=bearer(4)).headers
+
+    claim = routing.issue_write_claim(3, 60)
+    headers = {**bearer(4), routing.READ_YOUR_WRITES_HEADER: claim}
+    assert api.get("/history", headers=headers).json() == {"server": "replica"}
+
+
+def test_expired_or_forged_claims_are_ignored():
+    assert routing.claimed_writer(routing.issue_write_claim(3, 60)) == 3
+    assert routing.claimed_writer(routing.issue_write_claim(3, -1)) is None
+    assert routing.claimed_writer(jwt.encode({"read_your_writes": 3}, "not-the-key", algorithm=ALGORITHM)) is None
+    # An access token is not a claim, and a claim is not an access token
+    assert routing.claimed_writer(jwt.encode({"user_id": 3, "sub": "a@b.c"}, SECRET_KEY, algorithm=ALGORITHM)) is None
+    assert "sub" not in jwt.decode(routing.issue_write_claim(3, 60), SECRET_KEY, algorithms=[ALGORITHM])
@@ -0,0 +1,62 @@
+"""
+Offline tests for job isolation in the sandbox pool (app/services/sandbox.py).
+They start real worker processes, so they take a few seconds.
+
+    python -m pytest tests/test_sandbox.py
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.code_policy import compile_program  # noqa: E402
+from app.services.sandbox import (  # noqa: E402
+    FORK_PER_JOB, STATUS_CPU_LIMIT, STATUS_ERROR, STATUS_OK, STATUS_TIMEOUT, SandboxPool,
+)
+
+pytestmark = pytest.mark.skipif(not FORK_PER_JOB, reason="workers are single-use without fork()")
+
+
+@pytest.fixture(scope="module")
+def pool():
+    # One worker, so consecutive jobs are guaranteed to share it
+    pool = SandboxPool(size=1, max_queue=4, cpu_seconds=1, wall_seconds=4)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.parametrize("poison, probe, expected", [
+    ("import math\nmath.pi = 3", "import math\nprint(math.pi)", "3.141592653589793\n"),
+    ("import sys\nsys.modules['json'] = 42", "import json\nprint(type(json).__name__)", "module\n"),
+    ("import builtins\nbuiltins.sorted = lambda x: []", "print(sorted([2, 1]))", "[1, 2]\n"),
+    ("import functools\nfunctools.cached = 1", "import functools\nprint(hasattr(functools, 'cached'))", "False\n"),
+])
+def test_state_from_one_job_is_not_visible_to_the_next(pool, poison, probe, expected):
+    assert pool.run(poison).status == STATUS_OK
+    result = pool.run(probe)
+    assert (result.status, result.stdout) == (STATUS_OK, expected)
+    # What lets the execution cache admit it
+    assert result.isolated
+
+
+def test_compiled_programs_run(pool):
+    result = pool.run(compile_program("print('hi')\nx = 1 / 0").payload)
+    assert result.status == STATUS_ERROR
+    assert result.stdout == "hi\n"
+    assert "ZeroDivisionError" in result.stderr
+
+
+def test_killed_jobs_keep_the_worker(pool):
+    timeouts = pool.stats()["timeouts"]
+    result = pool.run("print('start')\nimport time\ntime.sleep(30)")
+    assert (result.status, result.stdout) == (STATUS_TIMEOUT, "start\n")
+    assert pool.stats()["timeouts"] == timeouts + 1
+
+    assert pool.run("while True: pass").status == STATUS_CPU_LIMIT
+
+    # The same worker serves the next job
+    assert pool.stats()["recycled"] == 0
+    assert pool.run("print(1)").stdout == "1\n"
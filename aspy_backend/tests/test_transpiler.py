@@ -0,0 +1,91 @@
+"""
+Offline tests for the keyword-dialect transpilers (app/services/transpiler.py).
+
+    python -m pytest tests/test_transpiler.py
+
+Each case is transpiled and, where the transpiler answers, executed, so the
+expected output is checked rather than the exact generated source.
+"""
+import contextlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.transpiler import KeywordTranspiler, TranspilerRegistry, transpilers  # noqa: E402
+
+
+def run(python_code: str) -> str:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        exec(python_code, {"__name__": "__main__"})
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("slug, code, expected", [
+    ("hindi", "x = 5\nagar x > 3:\n    likho 'bada'\nwarna:\n    likho('chhota')\n", "bada\n"),
+    ("hindi", "har i mein range(3):\n    likho i, i * i\n", "0 0\n1 1\n2 4\n"),
+    ("hindi", "n = 0\njab tak sach:\n    n = n + 1\n    agar n == 3:\n        ruko\nlikho n\n", "3\n"),
+    ("hindi", "x = 7\nagar x < 5:\n    likho 'a'\nwarna agar x < 10:\n    likho 'b'\nwarna:\n    likho 'c'\n", "b\n"),
+    ("bengali", "kaj jog(a, b):\n    ferot a + b\ndekhao jog(2, 3)\n", "5\n"),
+    ("english", "display 5", "5\n"),
+    ("english", "x = true\nif x:\n    show('yes')\n", "yes\n"),
+    # Keywords used as names are left alone; only calls are rewritten
+    ("english", "show = 3\nprint(show)\n", "3\n"),
+    ("english", "show = 3\nshow(show + 1)\n", "4\n"),
+    ("english", "def f(show=1):\n    return show\nshow(f(show=2))\n", "2\n"),
+    ("english", "class Screen:\n    display = 'on'\nshow(Screen.display)\n", "on\n"),
+    ("english", "for display in range(2):\n    show display\n", "0\n1\n"),
+    ("hindi", "likho lambai([1, 2])\n", "2\n"),
+    # Plain Python is accepted for every language
+    ("mizo", "for i in range(2):\n    print(i)\n", "0\n1\n"),
+])
+def test_dialect_programs_run(slug, code, expected):
+    python_code = transpilers.transpile(slug, code)
+    assert python_code is not None
+    assert run(python_code) == expected
+
+
+def test_keywords_inside_strings_and_comments_are_kept():
+    python_code = transpilers.transpile("hindi", "likho 'agar likho'  # agar\n")
+    assert run(python_code) == "agar likho\n"
+
+
+def test_comments_and_layout_are_kept():
+    code = "x = 1  # the count\n\nagar x:   # check it\n    likho x,  'a'\n"
+    assert transpilers.transpile("hindi", code) == "x = 1  # the count\n\nif x:   # check it\n    print(x,  'a')\n"
+
+
+@pytest.mark.parametrize("code", [
+    "hi",                             # a bare name: the author wants it shown
+    "10 + 5",                         # a bare value
+    "print hello world",              # not Python after rewriting
+    "print hello",                    # reads an undefined name
+    "say 0",
+    "name = input()\nprint(name)",    # needs the LLM to hardcode the input
+    "def f(:",
+    "if x > 5\n    print(x)",          # pseudocode without the colon
+    "def show(x):\n    return x\nshow(1)",  # defines the name a keyword is rewritten to
+])
+def test_falls_back_to_llm(code):
+    assert transpilers.transpile("english", code) is None
+
+
+def test_registry_is_pluggable_and_counts_per_language():
+    registry = TranspilerRegistry()
+    registry.register("Khasi", KeywordTranspiler("khasi", {"lada": "if", "pyni": "print"}))
+
+    assert registry.transpile("khasi", "x = 1\nlada x:\n    pyni 'ha'\n") == "x = 1\nif x:\n    print('ha')\n"
+    assert registry.transpile("khasi", "lada") is None
+    assert registry.transpile("unknown-slug", "print(1)") == "print(1)"
+    assert registry.stats()["by_language"] == {
+        "khasi": {"transpiled": 1, "fallbacks": 1},
+        "other": {"transpiled": 1, "fallbacks": 0},
+    }
+
+
+def test_disabled_registry_always_falls_back():
+    assert TranspilerRegistry(enabled=False).transpile("english", "print(1)") is None